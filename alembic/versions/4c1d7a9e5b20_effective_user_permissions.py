@@ -0,0 +1,40 @@
+"""effective user permissions
+
+Revision ID: 4c1d7a9e5b20
+Revises: e9e06082f2a8
+Create Date: 2026-10-17 05:12:08.316204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1d7a9e5b20'
+down_revision: Union[str, Sequence[str], None] = 'e9e06082f2a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('effective_user_permissions',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('mask', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='linked_user_for_effective_permissions', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.execute(
+        'INSERT INTO effective_user_permissions (user_id, mask) '
+        'SELECT user_groups.user_id, bit_or(group_permissions.mask) FROM user_groups '
+        'JOIN groups ON groups.id = user_groups.group_id '
+        'JOIN group_permissions ON group_permissions.id = groups.permissions '
+        'GROUP BY user_groups.user_id'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('effective_user_permissions')
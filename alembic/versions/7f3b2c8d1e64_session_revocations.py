@@ -0,0 +1,34 @@
+"""session revocations
+
+Revision ID: 7f3b2c8d1e64
+Revises: 4c1d7a9e5b20
+Create Date: 2026-10-17 06:40:27.918311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3b2c8d1e64'
+down_revision: Union[str, Sequence[str], None] = '4c1d7a9e5b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('session_revocations',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.Column('revoked_at', sa.DateTime(), server_default=sa.text('LOCALTIMESTAMP'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='linked_user_for_session_revocation', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('session_revocations')
@@ -0,0 +1,34 @@
+"""session indexes
+
+Revision ID: a52e9d0c6b17
+Revises: 7f3b2c8d1e64
+Create Date: 2026-10-17 07:58:13.604472
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a52e9d0c6b17'
+down_revision: Union[str, Sequence[str], None] = '7f3b2c8d1e64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_sessions_token'), 'sessions', ['token'], unique=False)
+    op.create_index(op.f('ix_sessions_user_id'), 'sessions', ['user_id'], unique=False)
+    op.create_index(op.f('ix_sessions_expire_time'), 'sessions', ['expire_time'], unique=False)
+    op.create_index(op.f('ix_discord_oauth_codes_expire_time'), 'discord_oauth_codes', ['expire_time'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_discord_oauth_codes_expire_time'), table_name='discord_oauth_codes')
+    op.drop_index(op.f('ix_sessions_expire_time'), table_name='sessions')
+    op.drop_index(op.f('ix_sessions_user_id'), table_name='sessions')
+    op.drop_index(op.f('ix_sessions_token'), table_name='sessions')
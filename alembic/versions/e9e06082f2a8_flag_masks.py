@@ -0,0 +1,30 @@
+"""flag masks
+
+Revision ID: e9e06082f2a8
+Revises: 1323f110de9a
+Create Date: 2026-10-17 03:24:51.402817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9e06082f2a8'
+down_revision: Union[str, Sequence[str], None] = '1323f110de9a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_roles', sa.Column('mask', sa.Integer(), sa.Computed('(CASE WHEN can_create_role THEN 1 ELSE 0 END) | (CASE WHEN can_create_group THEN 2 ELSE 0 END) | (CASE WHEN can_manage_server THEN 4 ELSE 0 END) | (CASE WHEN can_publish_realtime_events THEN 8 ELSE 0 END) | (CASE WHEN can_manage_session THEN 16 ELSE 0 END)', persisted=True), nullable=False))
+    op.add_column('group_permissions', sa.Column('mask', sa.Integer(), sa.Computed('(CASE WHEN can_upload_mission THEN 1 ELSE 0 END) | (CASE WHEN can_test_mission THEN 2 ELSE 0 END)', persisted=True), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('group_permissions', 'mask')
+    op.drop_column('user_roles', 'mask')
@@ -0,0 +1,91 @@
+import os
+
+from bw.state import State
+from bw.auth.session import SessionStore
+from bw.response import JsonResponse
+from bw.web_utils import define_api
+
+
+class AdminApi:
+    @define_api
+    def cache_stats(self, state: State, largest: int = 10) -> JsonResponse:
+        """
+        ### Report cache statistics
+
+        Reports hits, misses, inserts, evictions and invalidations for each tier and namespace of the cache held by
+        the worker serving the request, alongside the bytes used and the largest entries held.
+
+        **Args:**
+        - `state` (`State`): The application state containing the cache.
+        - `largest` (`int`): How many of the largest entries to list for each tier.
+
+        **Returns:**
+        - `JsonResponse`: The cache report.
+
+        **Example:**
+        ```python
+        response = AdminApi().cache_stats(state, largest=5)
+        # JsonResponse({'pid': 1234, 'inflight_loads': 0, 'l1': {...}, 'l2': {...}})
+        ```
+        """
+        return JsonResponse(state.cache.report(max(0, largest)))
+
+    @define_api
+    def pool_stats(self, state: State) -> JsonResponse:
+        """
+        ### Report database connection pool statistics
+
+        Reports the limits of each database's connection pool in the worker serving the request, how many connections
+        are in use right now, and how long checkouts have waited for one.
+
+        **Args:**
+        - `state` (`State`): The application state containing the database connections.
+
+        **Returns:**
+        - `JsonResponse`: The pool report, by database name.
+
+        **Example:**
+        ```python
+        response = AdminApi().pool_stats(state)
+        # JsonResponse({'pid': 1234, 'pools': {'bw_backend': {'size': 5, 'in_use': 1, 'checkouts': 310, ...}}})
+        ```
+        """
+        return JsonResponse({'pid': os.getpid(), 'pools': state.pool_report()})
+
+    @define_api
+    def query_stats(self, state: State) -> JsonResponse:
+        """
+        ### Report how many queries each endpoint makes
+
+        **Args:**
+        - `state` (`State`): The application state containing the query metrics.
+
+        **Returns:**
+        - `JsonResponse`: Query counts and time spent on them, by endpoint, for the worker serving the request.
+
+        **Example:**
+        ```python
+        response = AdminApi().query_stats(state)
+        # JsonResponse({'pid': 1234, 'slow_query_ms': 250.0, 'endpoints': {'bw_api.user.list_users': {'queries': 2, ...}}})
+        ```
+        """
+        return JsonResponse({'pid': os.getpid(), **state.sql_metrics.report()})
+
+    @define_api
+    def delete_expired_sessions(self, state: State) -> JsonResponse:
+        """
+        ### Delete expired sessions and Discord OAuth codes
+
+        **Args:**
+        - `state` (`State`): The application state containing the database connection.
+
+        **Returns:**
+        - `JsonResponse`: How many rows were deleted from each table.
+
+        **Example:**
+        ```python
+        response = AdminApi().delete_expired_sessions(state)
+        # JsonResponse({'sessions': 120, 'discord_oauth_codes': 3})
+        ```
+        """
+        return JsonResponse(SessionStore().delete_expired(state))
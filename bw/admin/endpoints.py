@@ -0,0 +1,134 @@
+import logging
+from quart import Blueprint, request
+
+from bw.admin.api import AdminApi
+from bw.auth.decorators import require_session, require_user_role
+from bw.auth.roles import Roles
+from bw.models.auth import User
+from bw.response import JsonResponse
+from bw.state import State, run_in_db_thread
+from bw.web_utils import url_endpoint
+
+logger = logging.getLogger('bw.admin')
+
+
+def define(api: Blueprint):
+    @api.get('/cache')
+    @url_endpoint
+    @require_session
+    @require_user_role(Roles.can_manage_server)
+    async def cache_stats(session_user: User) -> JsonResponse:
+        """
+        ### Report cache statistics
+
+        Reports counters, bytes used and largest entries for each tier and namespace of the cache. Counters belong to
+        the worker which served the request, and `pid` identifies that worker. Requires an active session and the
+        `can_manage_server` role.
+
+        **Args:**
+        - `session_user` (`User`): The authenticated user (automatically injected by `@require_session`).
+        - `largest` (`int`): How many of the largest entries to list for each tier (query parameter, default: 10).
+
+        **Returns:**
+        - `JsonResponse`:
+          - **Success (200)**: `{'pid': 1234, 'inflight_loads': 0, 'l1': {...}, 'l2': {...} | None}`
+          - **Error (401)**: HTTP 401 response with error message (not JSON)
+          - **Error (403)**: HTTP 403 response with error message (not JSON)
+
+        **Example:**
+        ```
+        GET /api/v1/admin/cache?largest=5
+        ```
+        """
+        logger.info('Reporting cache statistics')
+        largest = request.args.get('largest', default=10, type=int)
+        return await run_in_db_thread(AdminApi().cache_stats, State.state, largest=largest)
+
+    @api.get('/db/pool')
+    @url_endpoint
+    @require_session
+    @require_user_role(Roles.can_manage_server)
+    async def pool_stats(session_user: User) -> JsonResponse:
+        """
+        ### Report database connection pool statistics
+
+        Reports each pool's size and overflow limits, the connections in use and idle right now, and counters for
+        checkouts, checkouts which needed an overflow connection, checkouts which timed out and how long they waited.
+        Counters belong to the worker which served the request, and `pid` identifies that worker. Requires an active
+        session and the `can_manage_server` role.
+
+        **Args:**
+        - `session_user` (`User`): The authenticated user (automatically injected by `@require_session`).
+
+        **Returns:**
+        - `JsonResponse`:
+          - **Success (200)**: `{'pid': 1234, 'pools': {'bw_backend': {'size': 5, 'in_use': 1, 'max_wait_ms': 0.4, ...}}}`
+          - **Error (401)**: HTTP 401 response with error message (not JSON)
+          - **Error (403)**: HTTP 403 response with error message (not JSON)
+
+        **Example:**
+        ```
+        GET /api/v1/admin/db/pool
+        ```
+        """
+        logger.info('Reporting database pool statistics')
+        # answered on the loop, so a report is still returned when every database thread is stuck waiting on the pool
+        return AdminApi().pool_stats(State.state)
+
+    @api.get('/db/queries')
+    @url_endpoint
+    @require_session
+    @require_user_role(Roles.can_manage_server)
+    async def query_stats(session_user: User) -> JsonResponse:
+        """
+        ### Report how many queries each endpoint makes
+
+        Reports, per endpoint, the requests which queried the database, the queries made and milliseconds spent on
+        them, the most made by one request and how many took longer than `db_slow_query_ms`. Counters belong to the
+        worker which served the request, and `pid` identifies that worker. Requires an active session and the
+        `can_manage_server` role.
+
+        **Args:**
+        - `session_user` (`User`): The authenticated user (automatically injected by `@require_session`).
+
+        **Returns:**
+        - `JsonResponse`:
+          - **Success (200)**: `{'pid': 1234, 'slow_query_ms': 250.0, 'endpoints': {'bw_api.user.list_users': {...}}}`
+          - **Error (401)**: HTTP 401 response with error message (not JSON)
+          - **Error (403)**: HTTP 403 response with error message (not JSON)
+
+        **Example:**
+        ```
+        GET /api/v1/admin/db/queries
+        ```
+        """
+        logger.info('Reporting query statistics')
+        return AdminApi().query_stats(State.state)
+
+    @api.post('/sessions/delete_expired')
+    @url_endpoint
+    @require_session
+    @require_user_role(Roles.can_manage_server)
+    async def delete_expired_sessions(session_user: User) -> JsonResponse:
+        """
+        ### Delete expired sessions and Discord OAuth codes
+
+        Run periodically by the cron runner, and by each worker itself if `session_reap_interval` is set. Requires an
+        active session and the `can_manage_server` role.
+
+        **Args:**
+        - `session_user` (`User`): The authenticated user (automatically injected by `@require_session`).
+
+        **Returns:**
+        - `JsonResponse`:
+          - **Success (200)**: `{'sessions': 120, 'discord_oauth_codes': 3}`
+          - **Error (401)**: HTTP 401 response with error message (not JSON)
+          - **Error (403)**: HTTP 403 response with error message (not JSON)
+
+        **Example:**
+        ```
+        POST /api/v1/admin/sessions/delete_expired
+        ```
+        """
+        logger.info('Deleting expired sessions')
+        return await run_in_db_thread(AdminApi().delete_expired_sessions, State.state)
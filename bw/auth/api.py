@@ -1,5 +1,5 @@
 import logging
-from bw.state import State
+from bw.state import State, run_in_db_thread
 from bw.response import JsonResponse, Ok, WebResponse, Exists, DoesNotExist
 from bw.auth.session import SessionStore
 from bw.auth.user import UserStore
@@ -11,13 +11,20 @@ from bw.models.auth import User
 from bw.error import BwServerError, SessionExpired
 from bw.web_utils import define_api
 from bw.environment import ENVIRONMENT
+from bw.settings import GLOBAL_CONFIGURATION
 from bw.error import ReauthNeededError, AuthError, NoUserWithGivenCredentials
+import hashlib
 import uuid
 import aiohttp
 
 logger = logging.getLogger('bw.auth')
 
 
+def discord_token_key(token: str) -> str:
+    # access tokens are credentials, so only a digest of one is ever used as a key
+    return f'discord:access_token:{hashlib.sha256(token.encode()).hexdigest()}'
+
+
 class AuthApi:
     @define_api
     def create_new_user_bot(self, state: State) -> JsonResponse:
@@ -58,7 +65,8 @@ class AuthApi:
         ### Log in with Discord access token
 
         Logs in a user via their Discord access token. Retrieves the user's information from Discord,
-        creates a new user if they don't exist, and starts a new session for them.
+        creates a new user if they don't exist, and starts a new session for them. The Discord ID behind a token is
+        remembered for `discord_token_cache_ttl` seconds, so logging in again soon after skips asking Discord.
 
         *Docstring generated by AI.*
 
@@ -80,27 +88,35 @@ class AuthApi:
         # Error: WebResponse(status=401, reason='Access token has expired')
         ```
         """
-        headers = {'Authorization': f'Bearer {token}'}
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(f'{ENVIRONMENT.discord_api_url()}/users/@me') as response:
-                try:
-                    response.raise_for_status()
-                except aiohttp.ClientResponseError as e:
-                    if e.status == 401:
-                        raise ReauthNeededError(e.message, 'Discord OAuth')
-                    raise AuthError(e.message)
-
-                user = await response.json()
-
-        discord_id = DiscordSnowflake(user['id'])
+        discord_id = await state.cache.get_or_load(
+            discord_token_key(token),
+            lambda: self._discord_id_of_token(state, token),
+            ttl=float(GLOBAL_CONFIGURATION.get('discord_token_cache_ttl', 60)),
+        )
         logger.info(f'Discord user {discord_id} is logging in')
         logger.debug(f'id: {discord_id} type={type(discord_id)}')
+        return JsonResponse(await run_in_db_thread(self._start_discord_session, state, discord_id))
+
+    def _start_discord_session(self, state: State, discord_id: DiscordSnowflake) -> dict:
         try:
             user = UserStore().user_from_discord_id(state, discord_id)
         except NoUserWithGivenCredentials:
             user = UserStore().create_user(state)
             UserStore().link_discord_user(state, discord_id, user)
-        return JsonResponse(SessionStore().start_user_session(state, user))
+        return SessionStore().start_user_session(state, user)
+
+    async def _discord_id_of_token(self, state: State, token: str) -> DiscordSnowflake:
+        headers = {'Authorization': f'Bearer {token}'}
+        async with state.http.request('GET', f'{ENVIRONMENT.discord_api_url()}/users/@me', headers=headers) as response:
+            try:
+                response.raise_for_status()
+            except aiohttp.ClientResponseError as e:
+                if e.status == 401:
+                    raise ReauthNeededError(e.message, 'Discord OAuth')
+                raise AuthError(e.message)
+
+            user = await response.json()
+        return DiscordSnowflake(user['id'])
 
     @define_api
     def login_with_bot(self, state: State, bot_token: str) -> JsonResponse:
@@ -193,10 +209,8 @@ class AuthApi:
         if user_roles is None:
             return DoesNotExist()
 
-        test_roles = user_roles.as_dict()
-        for role, expecting_role in wanted_roles.as_dict().items():
-            if expecting_role and not test_roles[role]:
-                return DoesNotExist()
+        if not user_roles.covers(wanted_roles.mask):
+            return DoesNotExist()
         return Exists()
 
     @define_api
@@ -235,10 +249,8 @@ class AuthApi:
         if user_perms is None:
             return DoesNotExist()
 
-        test_perms = user_perms.as_dict()
-        for perms, expecting_perms in wanted_perms.as_dict().items():
-            if expecting_perms and not test_perms[perms]:
-                return DoesNotExist()
+        if not user_perms.covers(wanted_perms.mask):
+            return DoesNotExist()
         return Exists()
 
     @define_api
@@ -556,7 +568,9 @@ class AuthApi:
         return JsonResponse({'access_code': SessionStore().get_discord_oauth_code(state, code_state)})
 
     @define_api
-    def list_all_users(self, state: State, page: int = 1, page_size: int = 50) -> JsonResponse:
+    def list_all_users(
+        self, state: State, page_size: int = 50, continue_from: str | None = None, include_total: bool = False
+    ) -> JsonResponse:
         """
         ### List all users with pagination
 
@@ -567,24 +581,27 @@ class AuthApi:
 
         **Args:**
         - `state` (`State`): The application state containing the database connection.
-        - `page` (`int`): The page number to retrieve (default: 1).
         - `page_size` (`int`): Number of users per page (default: 50).
+        - `continue_from` (`str | None`): The `next` token of the previous page, or `None` for the first page.
+        - `include_total` (`bool`): Whether to include how many users there are in total (default: False).
 
         **Returns:**
         - `JsonResponse`: A JSON response containing paginated user list and metadata.
 
         **Example:**
         ```python
-        response = AuthApi().list_all_users(state, page=1, page_size=50)
+        response = AuthApi().list_all_users(state, page_size=50, include_total=True)
         # Success: JsonResponse({
         #   'users': [...],
-        #   'total': 150,
-        #   'page': 1,
-        #   'page_size': 50
+        #   'page_size': 50,
+        #   'next': 'WzUwXQ',
+        #   'total': 150
         # })
         ```
         """
-        users_data = UserStore().get_all_users_paginated(state, page=page, page_size=page_size)
+        users_data = UserStore().get_all_users_paginated(
+            state, page_size=page_size, continue_from=continue_from, include_total=include_total
+        )
         return JsonResponse(users_data)
 
     @define_api
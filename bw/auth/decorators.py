@@ -1,14 +1,17 @@
 import logging
 import asyncio
 import functools
-from contextlib import contextmanager
+import inspect
+from dataclasses import dataclass
 from bw.error import NonLocalIpAccessingLocalOnlyAddress, CannotDetermineSession, NotEnoughPermissions
-from bw.state import State
+from bw.state import State, run_in_db_thread
 from bw.models.auth import User
-from bw.auth.validators import validate_local, validate_session
-from bw.auth.session import SessionStore
+from bw.auth.validators import validate_local
+from bw.auth.principal import PrincipalStore, current_principal, remember_principal
 from bw.auth.group import GroupStore
 from bw.auth.user import UserStore
+from bw.auth.roles import Roles
+from bw.auth.permissions import Permissions
 from quart import request
 
 logger = logging.getLogger('bw.auth')
@@ -54,6 +57,166 @@ def with_token(func):
     return wrapper
 
 
+@dataclass(frozen=True, slots=True)
+class _Requirements:
+    local: bool = False
+    session: bool = False
+    role_mask: int = 0
+    permission_mask: int = 0
+
+    def merge(self, other: '_Requirements') -> '_Requirements':
+        return _Requirements(
+            local=self.local or other.local,
+            session=self.session or other.session,
+            role_mask=self.role_mask | other.role_mask,
+            permission_mask=self.permission_mask | other.permission_mask,
+        )
+
+
+def _session_token() -> str:
+    auth = request.headers.get('Authorization')
+    if auth is None:
+        logger.warning("'Session Token' not present in header")
+        raise CannotDetermineSession()
+
+    bearer_header = 'Bearer '
+    if not auth.startswith(bearer_header):
+        logger.warning("'Session Token' does not start with 'Bearer '")
+        raise CannotDetermineSession()
+
+    return auth[len(bearer_header) :]  # Remove 'Bearer ' prefix
+
+
+def _check_roles(session_user: User, roles: Roles | None, required_mask: int):
+    if roles is None:
+        logger.warning(f'User {session_user.id} does not have a role assigned')
+        raise NotEnoughPermissions()
+    mask = roles.mask
+    if mask & required_mask != required_mask:
+        missing = Roles.flags_in(required_mask & ~mask)
+        logger.warning(f'User {session_user.id} does not have required roles: {", ".join(missing)}')
+        raise NotEnoughPermissions()
+
+
+def _check_permissions(session_user: User, permissions: Permissions, required_mask: int):
+    mask = permissions.mask
+    if mask & required_mask != required_mask:
+        missing = Permissions.flags_in(required_mask & ~mask)
+        logger.warning(f'User {session_user.id} does not have required permissions: {", ".join(missing)}')
+        raise NotEnoughPermissions()
+
+
+def _compile(requirements: _Requirements, func):
+    # stacked guards collapse into one wrapper around the original function, so a request is checked exactly once
+    inner = getattr(func, '__guard__', None)
+    # `functools.wraps` copies `__guard__` onto anything wrapping a guard, which must not be skipped over
+    if inner is not None and inner[0] is func:
+        _, inner_requirements, func = inner
+        requirements = requirements.merge(inner_requirements)
+
+    local, session = requirements.local, requirements.session
+    role_mask, permission_mask = requirements.role_mask, requirements.permission_mask
+
+    def admit() -> str | None:
+        # everything that can be refused without the database
+        if local:
+            try:
+                validate_local(request.remote_addr)
+            except NonLocalIpAccessingLocalOnlyAddress as e:
+                logger.warning(f'Non-local API called from abroad: {e}')
+                raise e
+        return _session_token() if session else None
+
+    def authorize(token: str | None, args: tuple, kwargs: dict):
+        if session:
+            principal = PrincipalStore().load_principal(State.state, token)
+            remember_principal(principal)
+            session_user = kwargs['session_user'] = principal.user
+        elif role_mask or permission_mask:
+            # without a session of our own, the user is whoever the caller handed us
+            session_user = args[0] if args else kwargs['session_user']
+            principal = current_principal(session_user)
+        else:
+            return
+
+        if role_mask:
+            roles = principal.roles if principal is not None else UserStore().get_users_role(State.state, session_user)
+            _check_roles(session_user, roles, role_mask)
+        if permission_mask:
+            if principal is not None:
+                permissions = principal.permissions
+            else:
+                permissions = GroupStore().get_all_permissions_user_has(State.state, session_user)
+            _check_permissions(session_user, permissions, permission_mask)
+
+    needs_store = session or role_mask or permission_mask
+
+    if asyncio.iscoroutinefunction(func):
+
+        async def authorized(token: str | None, args: tuple, kwargs: dict):
+            if needs_store:
+                # loading the principal queries the database, which must not hold up the event loop
+                await run_in_db_thread(authorize, token, args, kwargs)
+            return await func(*args, **kwargs)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # admitted when called rather than when awaited, so a malformed request never creates the coroutine
+            return authorized(admit(), args, kwargs)
+
+        inspect.markcoroutinefunction(wrapper)
+    else:
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            authorize(admit(), args, kwargs)
+            return func(*args, **kwargs)
+
+    wrapper.__guard__ = (wrapper, requirements, func)  # ty: ignore[unresolved-attribute]
+    return wrapper
+
+
+def guard(*, local: bool = False, session: bool = False, roles: tuple = (), permissions: tuple = ()):
+    """
+    ### Restrict access to the decorated endpoint
+
+    Everything the endpoint requires is worked out once, when it is decorated, so each request parses its session
+    token at most once and checks the user's role and group permissions against precomputed masks. Requiring any
+    role or permission implies requiring a session. Guards stacked on the same function, including the
+    `@require_*` decorators, merge into one.
+
+    **Args:**
+    - `local` (`bool`): Only allow requests from the local network.
+    - `session` (`bool`): Require a valid session token, and pass its user as `session_user`.
+    - `roles` (`tuple`): Flags of `Roles` the user must hold, e.g. `(Roles.can_manage_server,)`.
+    - `permissions` (`tuple`): Flags of `Permissions` the user's groups must grant, e.g. `(Permissions.can_test_mission,)`.
+
+    **Raises:**
+    - `NonLocalIpAccessingLocalOnlyAddress`: If `local` is set and the request is not from a local IP address.
+    - `CannotDetermineSession`: If the request is malformed such that we can't determine session.
+    - `SessionKnownButInvalid`: If the session is not valid for some reason.
+    - `NotEnoughPermissions`: If the user is missing a required role or permission.
+
+    **Example:**
+    ```python
+    @guard(roles=(Roles.can_manage_server,))
+    async def my_view(session_user, ...):
+        ...
+    ```
+    """
+    requirements = _Requirements(
+        local=local,
+        session=session or bool(roles) or bool(permissions),
+        role_mask=Roles.mask_of(*roles),
+        permission_mask=Permissions.mask_of(*permissions),
+    )
+
+    def decorator(func):
+        return _compile(requirements, func)
+
+    return decorator
+
+
 def require_local(func):
     """
     ### Restrict access to local network requests
@@ -70,36 +233,16 @@ def require_local(func):
         ...
     ```
     """
-
-    @contextmanager
-    def _validate_local():
-        try:
-            validate_local(request.remote_addr)
-        except NonLocalIpAccessingLocalOnlyAddress as e:
-            logger.warning(f'Non-local API called from abroad: {e}')
-            raise e
-        yield
-
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        with _validate_local():
-            if asyncio.iscoroutinefunction(func):
-
-                async def afnc():
-                    return await func(*args, **kwargs)
-
-                return afnc()
-            else:
-                return func(*args, **kwargs)
-
-    return wrapper
+    return _compile(_Requirements(local=True), func)
 
 
 def require_session(func):
     """
     ### Require a valid session token
 
-    Ensures the decorated function is called with a valid session token.
+    Ensures the decorated function is called with a valid session token. The user's role and group permissions are
+    loaded alongside the session, and checked in the same step as any `@require_user_role` and
+    `@require_group_permission` beneath it.
 
     **Raises:**
     - `CannotDetermineSession`: If the request is malformed such that we can't determine session.
@@ -112,37 +255,7 @@ def require_session(func):
         ...
     ```
     """
-
-    @contextmanager
-    def _session_user():
-        auth = request.headers.get('Authorization')
-        if auth is None:
-            logger.warning("'Session Token' not present in header")
-            raise CannotDetermineSession()
-
-        bearer_header = 'Bearer '
-        if not auth.startswith(bearer_header):
-            logger.warning("'Session Token' does not start with 'Bearer '")
-            raise CannotDetermineSession()
-
-        session_token = auth[len(bearer_header) :]  # Remove 'Bearer ' prefix
-
-        validate_session(State.state, session_token)
-        yield SessionStore().get_user_from_session_token(State.state, session_token=session_token)
-
-    @functools.wraps(func)
-    def wrapper(**kwargs):
-        with _session_user() as session_user:
-            if asyncio.iscoroutinefunction(func):
-
-                async def afnc():
-                    return await func(session_user=session_user, **kwargs)
-
-                return afnc()
-            else:
-                return func(session_user=session_user, **kwargs)
-
-    return wrapper
+    return _compile(_Requirements(session=True), func)
 
 
 def require_group_permission(*required_permissions: bool):
@@ -161,76 +274,33 @@ def require_group_permission(*required_permissions: bool):
         ...
     ```
     """
-
-    @contextmanager
-    def _validate_permissions(session_user: User):
-        permissions = GroupStore().get_all_permissions_user_has(State.state, session_user)
-        for permission in required_permissions:
-            if not permission.__get__(permissions):  # ty: ignore[unresolved-attribute]
-                logger.warning(f'User {session_user.id} does not have required permission: {permission.__name__}')  # ty: ignore[unresolved-attribute]
-                raise NotEnoughPermissions()
-        yield
+    requirements = _Requirements(permission_mask=Permissions.mask_of(*required_permissions))
 
     def decorator(func):
-        @functools.wraps(func)
-        def wrapper(session_user: User, **kwargs):
-            with _validate_permissions(session_user):
-                if asyncio.iscoroutinefunction(func):
-
-                    async def afnc():
-                        return await func(session_user=session_user, **kwargs)
-
-                    return afnc()
-                else:
-                    return func(session_user=session_user, **kwargs)
-
-        return wrapper
+        return _compile(requirements, func)
 
     return decorator
 
 
 def require_user_role(*required_roles: bool):
     """
-    ### Require group permissions
+    ### Require user roles
 
-    Decorator factory that enforces group-based permissions for the decorated function.
+    Decorator factory that enforces the user's role for the decorated function.
 
     **Raises:**
-    - `NotEnoughPermissions`: If any required permission is missing from the user's group permissions.
+    - `NotEnoughPermissions`: If the user has no role, or their role is missing any of the required flags.
 
     **Example:**
     ```python
-    @require_group_permission(Permissions.can_upload_mission, Permissions.can_test_mission)
-    def my_view(session_token, ...):
+    @require_user_role(Roles.can_create_role, Roles.can_create_group)
+    def my_view(session_user, ...):
         ...
     ```
     """
-
-    @contextmanager
-    def _validate_roles(session_user: User):
-        user_role = UserStore().get_users_role(State.state, session_user)
-        if user_role is None:
-            logger.warning(f'User {session_user.id} does not have a role assigned')
-            raise NotEnoughPermissions()
-        for role in required_roles:
-            if not role.__get__(user_role):  # ty: ignore[unresolved-attribute]
-                logger.warning(f'User {session_user.id} does not have required role: {role.__name__}')  # ty: ignore[unresolved-attribute]
-                raise NotEnoughPermissions()
-        yield
+    requirements = _Requirements(role_mask=Roles.mask_of(*required_roles))
 
     def decorator(func):
-        @functools.wraps(func)
-        def wrapper(session_user: User, **kwargs):
-            with _validate_roles(session_user):
-                if asyncio.iscoroutinefunction(func):
-
-                    async def afnc():
-                        return await func(session_user=session_user, **kwargs)
-
-                    return afnc()
-                else:
-                    return func(session_user=session_user, **kwargs)
-
-        return wrapper
+        return _compile(requirements, func)
 
     return decorator
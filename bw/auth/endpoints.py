@@ -10,7 +10,8 @@ from bw.auth.decorators import require_session, require_local, require_user_role
 from bw.auth.permissions import Permissions
 from bw.auth.roles import Roles
 from bw.auth.api import AuthApi
-from bw.state import State
+from bw.state import State, run_in_db_thread
+from bw.db_metrics import query_budget
 
 
 logger = logging.getLogger('bw.auth')
@@ -78,7 +79,7 @@ def define_auth(api: Blueprint):
         """
         state = authorization[7:]
         logger.info('Retrieving access code (Discord)')
-        return AuthApi().retrieve_access_code(state=State.state, code_state=state)
+        return await run_in_db_thread(AuthApi().retrieve_access_code, state=State.state, code_state=state)
 
     @api.post('/login/discord')
     @url_endpoint
@@ -137,7 +138,7 @@ def define_auth(api: Blueprint):
         ```
         """
         logger.info('Creating new session (bot)')
-        return AuthApi().login_with_bot(state=State.state, bot_token=bot_token)
+        return await run_in_db_thread(AuthApi().login_with_bot, state=State.state, bot_token=bot_token)
 
 
 def define_user(api: Blueprint, local: Blueprint):
@@ -173,12 +174,13 @@ def define_user(api: Blueprint, local: Blueprint):
         GET /api/v1/user/
         ```
         """
-        return AuthApi().user_info(state=State.state, user=session_user)
+        return await run_in_db_thread(AuthApi().user_info, state=State.state, user=session_user)
 
     @api.get('/list')
     @url_endpoint
     @require_session
     @require_user_role(Roles.can_create_role)
+    @query_budget(2)
     async def list_users(session_user: User) -> JsonResponse:
         """
         ### List all users with pagination
@@ -190,29 +192,34 @@ def define_user(api: Blueprint, local: Blueprint):
 
         **Args:**
         - `session_user` (`User`): The authenticated user (automatically injected by `@require_session`).
-        - `page` (`int`): The page number to retrieve (query parameter, default: 1).
         - `page_size` (`int`): Number of users per page (query parameter, default: 50).
+        - `continue_from` (`str`): The `next` token of the previous page (query parameter, omit for the first page).
+        - `total` (`bool`): Whether to count every user, `true` or `false` (query parameter, default: false).
 
         **Returns:**
         - `JsonResponse`:
           - **Success (200)**: `{
           'users': [...],
-          'total': 150,
-          'page': 1,
           'page_size': 50,
-          'total_pages': 3
-          }`
+          'next': 'WzUwXQ',
+          'total': 150
+          }`, `next` is `null` on the last page and `total` is only present if asked for
+          - **Error (400)**: HTTP 400 response if `continue_from` is malformed
           - **Error (401)**: HTTP 401 response with error message (not JSON)
           - **Error (403)**: HTTP 403 response with error message (not JSON)
 
         **Example:**
         ```
-        GET /api/v1/user/list?page=1&page_size=50
+        GET /api/v1/user/list?page_size=50&total=true
+        GET /api/v1/user/list?page_size=50&continue_from=WzUwXQ
         ```
         """
-        page = request.args.get('page', default=1, type=int)
-        page_size = request.args.get('page_size', default=50, type=int)
-        return AuthApi().list_all_users(State.state, page=page, page_size=page_size)
+        page_size = max(1, request.args.get('page_size', default=50, type=int))
+        continue_from = request.args.get('continue_from', default=None, type=str)
+        include_total = request.args.get('total', default='false', type=str).lower() == 'true'
+        return await run_in_db_thread(
+            AuthApi().list_all_users, State.state, page_size=page_size, continue_from=continue_from, include_total=include_total
+        )
 
     @role_blueprint.post('/create')
     @json_endpoint
@@ -251,7 +258,7 @@ def define_user(api: Blueprint, local: Blueprint):
         """
         logger.info(f"Creating new role '{role_name}'")
         role = Roles.from_keys(**kwargs)
-        return AuthApi().create_role(State.state, role_name=role_name, roles=role)
+        return await run_in_db_thread(AuthApi().create_role, State.state, role_name=role_name, roles=role)
 
     @role_blueprint.post('/assign')
     @json_endpoint
@@ -288,7 +295,7 @@ def define_user(api: Blueprint, local: Blueprint):
         ```
         """
         logger.info(f'Assigning {role_name} to user {user_uuid}')
-        return AuthApi().assign_role(State.state, role_name=role_name, user_uuid=uuid.UUID(hex=user_uuid))
+        return await run_in_db_thread(AuthApi().assign_role, State.state, role_name=role_name, user_uuid=uuid.UUID(hex=user_uuid))
 
     @role_blueprint.get('/list')
     @url_endpoint
@@ -322,7 +329,7 @@ def define_user(api: Blueprint, local: Blueprint):
         GET /api/v1/user/role/list
         ```
         """
-        return AuthApi().get_all_roles(State.state)
+        return await run_in_db_thread(AuthApi().get_all_roles, State.state)
 
     @role_blueprint.put('/<string:role_name>')
     @json_endpoint
@@ -360,7 +367,7 @@ def define_user(api: Blueprint, local: Blueprint):
         """
         logger.info(f'Editing role {role_name}')
         role = Roles.from_keys(**kwargs)
-        return AuthApi().edit_role(State.state, role_name=role_name, roles=role)
+        return await run_in_db_thread(AuthApi().edit_role, State.state, role_name=role_name, roles=role)
 
     @role_blueprint.delete('/<string:role_name>')
     @url_endpoint
@@ -392,7 +399,7 @@ def define_user(api: Blueprint, local: Blueprint):
         ```
         """
         logger.info(f'Deleting role {role_name}')
-        return AuthApi().delete_role(State.state, role_name=role_name)
+        return await run_in_db_thread(AuthApi().delete_role, State.state, role_name=role_name)
 
     @local_role_blueprint.post('/create')
     @json_endpoint
@@ -431,7 +438,7 @@ def define_user(api: Blueprint, local: Blueprint):
         """
         logger.info('Creating new role (Local)')
         role = Roles.from_keys(**kwargs)
-        return AuthApi().create_role(State.state, role_name=role_name, roles=role)
+        return await run_in_db_thread(AuthApi().create_role, State.state, role_name=role_name, roles=role)
 
     # required to bootstrap server
     @local.post('/create/bot')
@@ -458,7 +465,7 @@ def define_user(api: Blueprint, local: Blueprint):
         ```
         """
         logger.info('Creating new bot user (Local)')
-        return AuthApi().create_new_user_bot(state=State.state)
+        return await run_in_db_thread(AuthApi().create_new_user_bot, state=State.state)
 
     @local_role_blueprint.post('/assign')
     @json_endpoint
@@ -495,7 +502,7 @@ def define_user(api: Blueprint, local: Blueprint):
         ```
         """
         logger.info(f'Assigning {role_name} to user {user_uuid} (Local)')
-        return AuthApi().assign_role(State.state, role_name=role_name, user_uuid=uuid.UUID(hex=user_uuid))
+        return await run_in_db_thread(AuthApi().assign_role, State.state, role_name=role_name, user_uuid=uuid.UUID(hex=user_uuid))
 
     api.register_blueprint(role_blueprint)
     local.register_blueprint(local_role_blueprint)
@@ -542,7 +549,9 @@ def define_group(api: Blueprint):
         """
         logger.info(f"Creating new group permission '{permission_name}'")
         permission = Permissions.from_keys(default_if_key_not_present=False, **kwargs)
-        return AuthApi().create_group_permission(State.state, permission_name=permission_name, permissions=permission)
+        return await run_in_db_thread(
+            AuthApi().create_group_permission, State.state, permission_name=permission_name, permissions=permission
+        )
 
     @api.post('/create')
     @json_endpoint
@@ -580,7 +589,9 @@ def define_group(api: Blueprint):
         ```
         """
         logger.info(f'Creating new group {group_name} with permissions {permissions}')
-        return AuthApi().create_group(state=State.state, group_name=group_name, permission_group=permissions)
+        return await run_in_db_thread(
+            AuthApi().create_group, state=State.state, group_name=group_name, permission_group=permissions
+        )
 
     @api.post('/join')
     @json_endpoint
@@ -612,7 +623,7 @@ def define_group(api: Blueprint):
         ```
         """
         logger.info(f'User {session_user.id} is joining group {group_name}')
-        return AuthApi().join_group(state=State.state, user=session_user, group_name=group_name)
+        return await run_in_db_thread(AuthApi().join_group, state=State.state, user=session_user, group_name=group_name)
 
     @api.post('/leave')
     @json_endpoint
@@ -644,7 +655,7 @@ def define_group(api: Blueprint):
         ```
         """
         logger.info(f'User {session_user.id} is leaving group {group_name}')
-        return AuthApi().leave_group(state=State.state, user=session_user, group_name=group_name)
+        return await run_in_db_thread(AuthApi().leave_group, state=State.state, user=session_user, group_name=group_name)
 
     @api.get('/list')
     @url_endpoint
@@ -676,7 +687,7 @@ def define_group(api: Blueprint):
         GET /api/v1/group/list
         ```
         """
-        return AuthApi().get_all_groups(State.state)
+        return await run_in_db_thread(AuthApi().get_all_groups, State.state)
 
     @api.delete('/<string:group_name>')
     @url_endpoint
@@ -707,7 +718,7 @@ def define_group(api: Blueprint):
         ```
         """
         logger.info(f'Deleting group {group_name}')
-        return AuthApi().delete_group(State.state, group_name=group_name)
+        return await run_in_db_thread(AuthApi().delete_group, State.state, group_name=group_name)
 
     @permission_blueprint.get('/list')
     @url_endpoint
@@ -741,7 +752,7 @@ def define_group(api: Blueprint):
         GET /api/v1/group/permission/list
         ```
         """
-        return AuthApi().get_all_permissions(State.state)
+        return await run_in_db_thread(AuthApi().get_all_permissions, State.state)
 
     @permission_blueprint.put('/<string:permission_name>')
     @json_endpoint
@@ -779,7 +790,9 @@ def define_group(api: Blueprint):
         """
         logger.info(f'Editing permission {permission_name}')
         permission = Permissions.from_keys(default_if_key_not_present=False, **kwargs)
-        return AuthApi().edit_permission(State.state, permission_name=permission_name, permissions=permission)
+        return await run_in_db_thread(
+            AuthApi().edit_permission, State.state, permission_name=permission_name, permissions=permission
+        )
 
     @permission_blueprint.delete('/<string:permission_name>')
     @url_endpoint
@@ -811,7 +824,7 @@ def define_group(api: Blueprint):
         ```
         """
         logger.info(f'Deleting permission {permission_name}')
-        return AuthApi().delete_permission(State.state, permission_name=permission_name)
+        return await run_in_db_thread(AuthApi().delete_permission, State.state, permission_name=permission_name)
 
     api.register_blueprint(permission_blueprint)
 
@@ -847,6 +860,6 @@ def define_html(frontend: Blueprint, parts: Blueprint):
         state = request.args.get('state', default=secrets.token_urlsafe(32), type=str)
         logger.info('OAuth redirect (Discord)')
         try:
-            AuthApi().register_access_code(state=State.state, code=code, code_state=state)
+            await run_in_db_thread(AuthApi().register_access_code, state=State.state, code=code, code_state=state)
         finally:
             return html
@@ -1,8 +1,12 @@
-from sqlalchemy import insert, delete, select
+from collections.abc import Iterable
+
+from sqlalchemy import insert, delete, select, func
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.exc import NoResultFound, IntegrityError
+from sqlalchemy.orm import Session
 
 from bw.state import State
-from bw.models.auth import User, Group, GroupPermission, UserGroup
+from bw.models.auth import User, Group, GroupPermission, UserGroup, EffectiveUserPermissions
 from bw.error import (
     GroupCreationFailed,
     GroupPermissionCreationFailed,
@@ -11,9 +15,41 @@ from bw.error import (
     NoGroupWithName,
 )
 from bw.auth.permissions import Permissions
+from bw.cache import cached
+from bw.web_event import GroupEvent, GroupPermissionChangedEvent, GroupMembershipChangedEvent, GroupDeletedEvent
+
+# arbitrary, only has to be distinct from any other advisory lock taken against the database
+EFFECTIVE_PERMISSIONS_LOCK = 0x6277_7065_726D
 
 
 class GroupStore:
+    def _lock_effective_permissions(self, session: Session):
+        # changes which affect effective permissions are rare, so they are simply serialised. Every recalculation then
+        # sees every change committed before it, rather than racing a concurrent change to the same user
+        session.execute(select(func.pg_advisory_xact_lock(EFFECTIVE_PERMISSIONS_LOCK)))
+
+    def _refresh_effective_permissions(self, session: Session, user_ids: Iterable[int]):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+
+        merged = (
+            select(User.id, func.coalesce(func.bit_or(GroupPermission.mask), 0))
+            .select_from(User)
+            .outerjoin(UserGroup, UserGroup.user_id == User.id)
+            .outerjoin(Group, Group.id == UserGroup.group_id)
+            .outerjoin(GroupPermission, GroupPermission.id == Group.permissions)
+            .where(User.id.in_(user_ids))
+            .group_by(User.id)
+        )
+        query = postgresql.insert(EffectiveUserPermissions).from_select(['user_id', 'mask'], merged)
+        query = query.on_conflict_do_update(index_elements=[EffectiveUserPermissions.user_id], set_={'mask': query.excluded.mask})
+        session.execute(query)
+
+    def _members_of_groups_with(self, session: Session, *criteria) -> list[int]:
+        query = select(UserGroup.user_id).join(Group, Group.id == UserGroup.group_id).where(*criteria).distinct()
+        return list(session.scalars(query))
+
     def create_permission(self, state: State, name: str, permissions: Permissions) -> GroupPermission:
         """
         ### Create a new group permission
@@ -122,6 +158,7 @@ class GroupStore:
         - `NoGroupPermissionWithCredentials`: If no permission group with the given name exists.
         """
         with state.Session.begin() as session:
+            self._lock_effective_permissions(session)
             query = select(GroupPermission).where(GroupPermission.name == permission_name)
             try:
                 permission = session.execute(query).one()[0]
@@ -132,7 +169,11 @@ class GroupStore:
                 setattr(permission, grant, allowed)
 
             session.flush()
+            self._refresh_effective_permissions(
+                session, self._members_of_groups_with(session, Group.permissions == permission.id)
+            )
             session.expunge(permission)
+        state.broker.publish(GroupPermissionChangedEvent(permission_name))
         return permission
 
     def assign_user_to_group(self, state: State, user: User, group: Group):
@@ -152,11 +193,14 @@ class GroupStore:
         - `GroupAssignmentFailed`: If a model constraint is violated during assignment.
         """
         with state.Session.begin() as session:
+            self._lock_effective_permissions(session)
             query = insert(UserGroup).values(user_id=user.id, group_id=group.id)
             try:
                 session.execute(query)
             except IntegrityError:
                 raise GroupAssignmentFailed()
+            self._refresh_effective_permissions(session, [user.id])
+        state.broker.publish(GroupMembershipChangedEvent(user.id, group.id))
 
     def remove_user_from_group(self, state: State, user: User, group: Group):
         """
@@ -175,8 +219,11 @@ class GroupStore:
         - None
         """
         with state.Session.begin() as session:
+            self._lock_effective_permissions(session)
             query = delete(UserGroup).where(UserGroup.user_id == user.id).where(UserGroup.group_id == group.id)
             session.execute(query)
+            self._refresh_effective_permissions(session, [user.id])
+        state.broker.publish(GroupMembershipChangedEvent(user.id, group.id))
 
     def delete_group(self, state: State, group_name: str):
         """
@@ -194,11 +241,16 @@ class GroupStore:
         - None
         """
         with state.Session.begin() as session:
+            self._lock_effective_permissions(session)
+            members = self._members_of_groups_with(session, Group.name == group_name)
+
             query = delete(UserGroup).where(Group.id == UserGroup.group_id).where(Group.name == group_name)
             session.execute(query)
 
             query = delete(Group).where(Group.name == group_name)
             session.execute(query)
+            self._refresh_effective_permissions(session, members)
+        state.broker.publish(GroupDeletedEvent(group_name))
 
     def get_group(self, state: State, group_name: str) -> Group:
         """
@@ -227,6 +279,7 @@ class GroupStore:
             session.expunge(permission)
         return permission
 
+    @cached('auth', expire_on=GroupEvent)
     def get_all_permissions_user_has(self, state: State, user: User) -> Permissions:
         """
         ### Retrieve all permissions a user has through group memberships
@@ -243,20 +296,9 @@ class GroupStore:
         - `Permissions`: The combined permissions from all groups the user belongs to.
         """
         with state.Session.begin() as session:
-            query = (
-                select(GroupPermission)
-                .join(Group)
-                .where(Group.permissions == GroupPermission.id)
-                .join(UserGroup)
-                .where(UserGroup.group_id == Group.id)
-                .where(UserGroup.user_id == user.id)
-            )
-
-            all_permissions = []
-            for permission_group in session.execute(query).partitions():
-                for permissions in permission_group:
-                    all_permissions.extend([permission.into_permissions() for permission in permissions])
-        return Permissions.from_many(*all_permissions)
+            query = select(EffectiveUserPermissions.mask).where(EffectiveUserPermissions.user_id == user.id)
+            mask = session.scalar(query)
+        return Permissions.from_mask(mask or 0)
 
     def get_user_groups(self, state: State, user: User) -> list[Group]:
         """
@@ -361,9 +403,14 @@ class GroupStore:
         ```
         """
         with state.Session.begin() as session:
+            self._lock_effective_permissions(session)
             query = select(GroupPermission).where(GroupPermission.name == permission_name)
             try:
                 permission = session.execute(query).one()[0]
             except NoResultFound:
                 raise NoGroupPermissionWithCredentials(permission_name)
+            members = self._members_of_groups_with(session, Group.permissions == permission.id)
             session.delete(permission)
+            session.flush()
+            self._refresh_effective_permissions(session, members)
+        state.broker.publish(GroupPermissionChangedEvent(permission_name))
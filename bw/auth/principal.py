@@ -0,0 +1,215 @@
+import dataclasses
+import datetime
+import hashlib
+import logging
+from dataclasses import dataclass
+
+from quart import g, has_app_context
+from sqlalchemy import select, func
+
+from bw.state import State
+from bw.auth.roles import Roles
+from bw.auth.permissions import Permissions
+from bw.models.auth import User, Session, Role, EffectiveUserPermissions, SessionRevocation
+from bw.auth.token import is_signed_token, verify_session_token
+from bw.settings import GLOBAL_CONFIGURATION
+from bw.web_event import RoleEvent, GroupEvent
+from bw.error import SessionExpired
+
+logger = logging.getLogger('bw.auth')
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """
+    ### Everything needed to authorise a request
+
+    The user behind a session token, along with when the session expires, the user's role and the permissions merged
+    from every group they belong to.
+    """
+
+    user: User
+    session_expire_time: datetime.datetime
+    roles: Roles | None
+    permissions: Permissions
+
+
+def session_token_key(session_token: str) -> str:
+    # tokens are credentials, so only a digest of one is ever used as a key where cache reports could show it
+    return f'auth:session_token:{hashlib.sha256(session_token.encode()).hexdigest()}'
+
+
+def user_sessions_tag(user_id: int) -> str:
+    return f'auth:sessions_of_user:{user_id}'
+
+
+SESSION_DENYLIST_KEY = 'auth:session_denylist'
+SESSION_DENYLIST_TAG = 'auth:session_denylist'
+
+
+class PrincipalStore:
+    def load_principal(self, state: State, session_token: str) -> Principal:
+        """
+        ### Resolve a session token to a principal
+
+        Loads the user, their session, their role and their merged group permissions in a single query. The result is
+        cached until the session expires, or until the user's sessions are revoked or any role or group changes.
+
+        Signed tokens are checked against their signature and the revocation denylist instead of the sessions table,
+        so once the user's principal and the denylist are cached they are resolved without touching the database.
+
+        **Args:**
+        - `state` (`State`): The application state containing the database connection.
+        - `session_token` (`str`): The session token to resolve.
+
+        **Raises:**
+        - `SessionExpired`: If the session token is not found or is expired.
+
+        **Returns:**
+        - `Principal`: The user behind the session, with their role and permissions.
+
+        **Example:**
+        ```python
+        principal = PrincipalStore().load_principal(state, 'token123')
+        # Principal(user=User(...), session_expire_time=datetime(...), roles=Roles(...), permissions=Permissions(...))
+        ```
+        """
+        if is_signed_token(session_token):
+            return self._load_signed_principal(state, session_token)
+
+        return state.cache.load_through(
+            session_token_key(session_token),
+            lambda: self._query_principal(state, session_token),
+            lambda principal: (user_sessions_tag(principal.user.id), RoleEvent, GroupEvent),
+        )
+
+    def session_denylist(self, state: State) -> dict[int, int]:
+        """
+        ### Get the revocation generation of every user whose signed tokens were recently revoked
+
+        Revocations older than the longest session are left out, since every token they could refuse has expired. The
+        list is cached, and revoking a session expires it on every worker.
+
+        **Args:**
+        - `state` (`State`): The application state containing the database connection.
+
+        **Returns:**
+        - `dict[int, int]`: The generation signed tokens must carry, by user id.
+        """
+
+        def load() -> tuple[dict[int, int], None]:
+            longest = max(int(GLOBAL_CONFIGURATION['default_session_length']), int(GLOBAL_CONFIGURATION['api_session_length']))
+            query = select(SessionRevocation.user_id, SessionRevocation.generation).where(
+                SessionRevocation.revoked_at > Session.now() - datetime.timedelta(seconds=longest)
+            )
+            with state.Session.begin() as session:
+                return {user_id: generation for user_id, generation in session.execute(query)}, None
+
+        return state.cache.load_through(SESSION_DENYLIST_KEY, load, lambda _: (SESSION_DENYLIST_TAG,))
+
+    def _load_signed_principal(self, state: State, session_token: str) -> Principal:
+        claims = verify_session_token(session_token)
+        if claims.generation < self.session_denylist(state).get(claims.user_id, 0):
+            logger.info(f'Signed session for user {claims.user_id} has been revoked')
+            raise SessionExpired()
+
+        principal = state.cache.load_through(
+            f'auth:principal_of_user:{claims.user_id}',
+            lambda: (self._query_user_principal(state, claims.user_id), None),
+            lambda _: (user_sessions_tag(claims.user_id), RoleEvent, GroupEvent),
+        )
+        # naive local time, to match the expiry of sessions kept in the database
+        expire_time = datetime.datetime.fromtimestamp(claims.expire_time)
+        return dataclasses.replace(principal, session_expire_time=expire_time)
+
+    def _query_user_principal(self, state: State, user_id: int) -> Principal:
+        query = (
+            select(
+                User,
+                Role.id.label('role_id'),
+                Role.mask.label('role_mask'),
+                func.coalesce(EffectiveUserPermissions.mask, 0).label('permission_mask'),
+            )
+            .outerjoin(Role, Role.id == User.role)
+            .outerjoin(EffectiveUserPermissions, EffectiveUserPermissions.user_id == User.id)
+            .where(User.id == user_id)
+        )
+
+        with state.Session.begin() as session:
+            row = session.execute(query).one_or_none()
+            if row is None:
+                logger.info(f'Signed session belongs to user {user_id}, who no longer exists')
+                raise SessionExpired()
+            user = row[0]
+            session.expunge(user)
+
+        roles = Roles.from_mask(row.role_mask) if row.role_id is not None else None
+        permissions = Permissions.from_mask(row.permission_mask)
+        # the expiry comes from whichever token is being resolved
+        return Principal(user=user, session_expire_time=datetime.datetime.min, roles=roles, permissions=permissions)
+
+    def _query_principal(self, state: State, session_token: str) -> tuple[Principal, float]:
+        query = (
+            select(
+                User,
+                Session.expire_time,
+                (Session.expire_time >= Session.now()).label('active'),
+                func.extract('epoch', Session.expire_time - Session.now()).label('remaining'),
+                Role.id.label('role_id'),
+                Role.mask.label('role_mask'),
+                func.coalesce(EffectiveUserPermissions.mask, 0).label('permission_mask'),
+            )
+            .select_from(Session)
+            .join(User, User.id == Session.user_id)
+            .outerjoin(Role, Role.id == User.role)
+            .outerjoin(EffectiveUserPermissions, EffectiveUserPermissions.user_id == User.id)
+            .where(Session.token == session_token)
+            .order_by(Session.expire_time.desc())
+            .limit(1)
+        )
+
+        with state.Session.begin() as session:
+            row = session.execute(query).one_or_none()
+            if row is None:
+                logger.info(f'Could not find existing session record for token {session_token}')
+                raise SessionExpired()
+            if not row.active:
+                logger.info(f'Session for token {session_token} expired at {row.expire_time}')
+                raise SessionExpired()
+
+            user = row[0]
+            session.expunge(user)
+
+        roles = Roles.from_mask(row.role_mask) if row.role_id is not None else None
+        permissions = Permissions.from_mask(row.permission_mask)
+        principal = Principal(user=user, session_expire_time=row.expire_time, roles=roles, permissions=permissions)
+        return principal, float(row.remaining)
+
+
+def remember_principal(principal: Principal):
+    """
+    ### Share a principal with the rest of the request
+
+    **Args:**
+    - `principal` (`Principal`): The principal that authenticated the current request.
+    """
+    if has_app_context():
+        g.principal = principal
+
+
+def current_principal(user: User) -> Principal | None:
+    """
+    ### Get the principal loaded for a user earlier in the request
+
+    **Args:**
+    - `user` (`User`): The user the principal should belong to.
+
+    **Returns:**
+    - `Principal | None`: The principal, or `None` if this request has not loaded one for `user`.
+    """
+    if not has_app_context():
+        return None
+    principal = g.get('principal')
+    if principal is None or principal.user.id != user.id:
+        return None
+    return principal
@@ -3,6 +3,7 @@ from dataclasses import dataclass
 from bw.combined_dataclass import SlotCombiner
 
 
+# persisted as a bitmask by position, so new flags must be added at the end
 @dataclass(kw_only=True, slots=True)
 class Roles(SlotCombiner):
     can_create_role: bool = False
@@ -1,10 +1,16 @@
+import datetime
 import secrets
 import logging
+import time
 
 from sqlalchemy import insert, delete, select
+from sqlalchemy.dialects import postgresql
 
 from bw.state import State
-from bw.models.auth import Session, User, DiscordOAuthCode, TOKEN_LENGTH
+from bw.settings import GLOBAL_CONFIGURATION
+from bw.auth.principal import PrincipalStore, user_sessions_tag, SESSION_DENYLIST_TAG
+from bw.auth.token import SessionClaims, SessionKind, signed_tokens_enabled, sign_session_token
+from bw.models.auth import Session, User, DiscordOAuthCode, SessionRevocation, TOKEN_LENGTH
 from bw.error import SessionExpired, NoAccessCodeFound
 
 
@@ -12,11 +18,21 @@ logger = logging.getLogger('bw.auth')
 
 
 class SessionStore:
+    def _start_signed_session(self, state: State, user: User, kind: SessionKind, length: int) -> dict:
+        with state.Session.begin() as session:
+            query = select(SessionRevocation.generation).where(SessionRevocation.user_id == user.id)
+            generation = session.scalar(query) or 0
+
+        expire_time = time.time() + length
+        token = sign_session_token(SessionClaims(user_id=user.id, kind=kind, generation=generation, expire_time=expire_time))
+        return {'session_token': token, 'expire_time': datetime.datetime.fromtimestamp(expire_time)}
+
     def expire_session_from_user(self, state: State, user: User):
         """
         ### Expire session for a user
 
-        Expires (removes) session associated with the given user.
+        Expires (removes) session associated with the given user. Every worker stops accepting the user's
+        session tokens as soon as this returns, signed tokens included.
 
         *Docstring generated by AI.*
 
@@ -39,11 +55,20 @@ class SessionStore:
             query = delete(Session).where(Session.user_id == user.id)
             session.execute(query)
 
+            query = postgresql.insert(SessionRevocation).values(user_id=user.id, generation=1)
+            query = query.on_conflict_do_update(
+                index_elements=[SessionRevocation.user_id],
+                set_={'generation': SessionRevocation.generation + 1, 'revoked_at': Session.now()},
+            )
+            session.execute(query)
+        state.cache.invalidate(user_sessions_tag(user.id), SESSION_DENYLIST_TAG)
+
     def start_user_session(self, state: State, user: User) -> dict:
         """
         ### Start a new human session for a user
 
-        Starts a new human session for the given user, does not expire any existing sessions.
+        Starts a new human session for the given user, does not expire any existing sessions. If
+        `session_signing_key` is configured the token is signed, and is checked without a database lookup.
 
         *Docstring generated by AI.*
 
@@ -66,6 +91,9 @@ class SessionStore:
         # {'session_token': 'abc123...', 'expire_time': '2024-12-31T23:59:59'}
         ```
         """
+        if signed_tokens_enabled():
+            return self._start_signed_session(state, user, 'human', int(GLOBAL_CONFIGURATION['default_session_length']))
+
         token = secrets.token_urlsafe()[:TOKEN_LENGTH]
         with state.Session.begin() as session:
             query = (
@@ -89,7 +117,8 @@ class SessionStore:
         ### Start a new API session for a user
 
         Starts a new API session for the given user, expiring any existing sessions.
-        Used for bots to communicate with the API; they have a shorter-lived session.
+        Used for bots to communicate with the API; they have a shorter-lived session. If `session_signing_key` is
+        configured the token is signed, and is checked without a database lookup.
 
         *Docstring generated by AI.*
 
@@ -113,6 +142,8 @@ class SessionStore:
         ```
         """
         self.expire_session_from_user(state, user)
+        if signed_tokens_enabled():
+            return self._start_signed_session(state, user, 'api', int(GLOBAL_CONFIGURATION['api_session_length']))
 
         token = secrets.token_urlsafe()[:TOKEN_LENGTH]
         with state.Session.begin() as session:
@@ -156,25 +187,11 @@ class SessionStore:
         # False (if session doesn't exist or is expired)
         ```
         """
-        with state.Session.begin() as session:
-            # First check if session exists at all
-            query = select(Session).where(Session.token == session_token)
-            session_record = session.execute(query).first()
-
-            if session_record is None:
-                logger.info(f'Could not find existing session record for token {session_token}')
-                return False
-
-            session_obj = session_record[0]
-
-            # Check if session is expired
-            query = select(Session.now())
-            current_time = session.scalar(query)
-
-            if current_time > session_obj.expire_time:
-                logger.info(f'Session for token {session_token} is expired {(session_obj.expire_time - current_time)}')
-
-            return current_time <= session_obj.expire_time
+        try:
+            PrincipalStore().load_principal(state, session_token)
+        except SessionExpired:
+            return False
+        return True
 
     def get_user_from_session_token(self, state: State, session_token: str) -> User:
         """
@@ -203,30 +220,7 @@ class SessionStore:
         # Raises SessionExpired if token is invalid or expired
         ```
         """
-        with state.Session.begin() as session:
-            # First get the session record
-            query = select(Session).where(Session.token == session_token)
-            session_record = session.execute(query).first()
-
-            if session_record is None:
-                logger.info(f'Could not find existing session record for token {session_token}')
-                raise SessionExpired()
-
-            session_obj = session_record[0]
-
-            # Check if session is expired
-            query = select(Session.now())
-            current_time = session.scalar(query)
-
-            if current_time > session_obj.expire_time:
-                logger.info(f'Session for token {session_token} is expired {(session_obj.expire_time - current_time)}')
-                raise SessionExpired()
-
-            # Get the user
-            query = select(User).where(User.id == session_obj.user_id)
-            user = session.execute(query).one()[0]
-            session.expunge(user)
-        return user
+        return PrincipalStore().load_principal(state, session_token).user
 
     def register_discord_oauth_code(self, state: State, access_code: str, access_code_state: str):
         """
@@ -302,3 +296,38 @@ class SessionStore:
 
             session.commit()
             return result.code
+
+    def delete_expired(self, state: State, batch_size: int = 1000) -> dict[str, int]:
+        """
+        ### Delete expired sessions and Discord OAuth codes
+
+        Rows are deleted in batches, each in its own transaction, so the tables are never locked for long. Rows another
+        worker is already deleting are skipped rather than waited on, so it is safe to run this from several places at
+        once.
+
+        **Args:**
+        - `state` (`State`): The application state containing the database connection.
+        - `batch_size` (`int`): How many rows to delete per transaction (default: 1000).
+
+        **Returns:**
+        - `dict[str, int]`: How many rows were deleted from each table.
+
+        **Example:**
+        ```python
+        SessionStore().delete_expired(state)
+        # {'sessions': 120, 'discord_oauth_codes': 3}
+        ```
+        """
+        deleted = {}
+        for model, key in ((Session, Session.id), (DiscordOAuthCode, DiscordOAuthCode.state)):
+            expired = select(key).where(model.expire_time < Session.now()).limit(batch_size).with_for_update(skip_locked=True)
+            deleted[model.__tablename__] = 0
+            while True:
+                with state.Session.begin() as session:
+                    count = session.execute(delete(model).where(key.in_(expired.scalar_subquery()))).rowcount
+                deleted[model.__tablename__] += count
+                if count < batch_size:
+                    break
+
+        logger.info(f'Deleted {deleted["sessions"]} expired sessions and {deleted["discord_oauth_codes"]} expired OAuth codes')
+        return deleted
@@ -0,0 +1,113 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+from dataclasses import dataclass
+from typing import Literal
+
+from bw.settings import GLOBAL_CONFIGURATION
+from bw.error import SessionExpired
+
+SIGNED_TOKEN_PREFIX = 'bw1.'
+
+SessionKind = Literal['human', 'api']
+
+
+@dataclass(frozen=True, slots=True)
+class SessionClaims:
+    """
+    ### What a signed session token says about itself
+
+    `generation` is the user's revocation generation when the token was issued. Revoking a user's sessions bumps it,
+    and any token carrying an older generation is refused.
+    """
+
+    user_id: int
+    kind: SessionKind
+    generation: int
+    expire_time: float
+
+
+def _signing_key() -> bytes | None:
+    key = GLOBAL_CONFIGURATION.get('session_signing_key')
+    return key.encode() if key else None
+
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def _decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def signed_tokens_enabled() -> bool:
+    return _signing_key() is not None
+
+
+def is_signed_token(token: str) -> bool:
+    # opaque tokens are `secrets.token_urlsafe`, which never contains a `.`
+    return token.startswith(SIGNED_TOKEN_PREFIX)
+
+
+def sign_session_token(claims: SessionClaims) -> str:
+    """
+    ### Issue a signed session token
+
+    **Args:**
+    - `claims` (`SessionClaims`): What the token grants.
+
+    **Raises:**
+    - `RuntimeError`: If `session_signing_key` is not configured.
+
+    **Returns:**
+    - `str`: The token, which can be verified without looking anything up.
+    """
+    key = _signing_key()
+    if key is None:
+        raise RuntimeError('Cannot sign session tokens without a `session_signing_key`')
+
+    payload = json.dumps(
+        {'u': claims.user_id, 'k': claims.kind, 'g': claims.generation, 'e': claims.expire_time}, separators=(',', ':')
+    )
+    body = SIGNED_TOKEN_PREFIX + _encode(payload.encode())
+    signature = hmac.new(key, body.encode(), hashlib.sha256).digest()
+    return f'{body}.{_encode(signature)}'
+
+
+def verify_session_token(token: str) -> SessionClaims:
+    """
+    ### Check a signed session token and read its claims
+
+    Only the signature and expiry are checked here. Whether the token has been revoked is up to the caller.
+
+    **Args:**
+    - `token` (`str`): A token made by `sign_session_token`.
+
+    **Raises:**
+    - `SessionExpired`: If the token is malformed, was not signed with our key, or has expired.
+
+    **Returns:**
+    - `SessionClaims`: What the token grants.
+    """
+    key = _signing_key()
+    body, _, signature = token.rpartition('.')
+    if key is None or not body.startswith(SIGNED_TOKEN_PREFIX):
+        raise SessionExpired()
+
+    expected = hmac.new(key, body.encode(), hashlib.sha256).digest()
+    try:
+        if not hmac.compare_digest(expected, _decode(signature)):
+            raise SessionExpired()
+        payload = json.loads(_decode(body.removeprefix(SIGNED_TOKEN_PREFIX)))
+        claims = SessionClaims(
+            user_id=int(payload['u']), kind=payload['k'], generation=int(payload['g']), expire_time=float(payload['e'])
+        )
+    except (ValueError, binascii.Error, TypeError, KeyError):
+        raise SessionExpired()
+
+    if claims.expire_time <= time.time():
+        raise SessionExpired()
+    return claims
@@ -4,15 +4,23 @@ from uuid import UUID
 import sqlalchemy
 from sqlalchemy import select, delete, insert, update
 from sqlalchemy.exc import NoResultFound, IntegrityError
-from bw.auth.group import GroupStore
+from bw.auth.principal import user_sessions_tag
 
 from bw.state import State
 from bw.auth.roles import Roles
 from bw.auth.types import DiscordSnowflake
-from bw.models.auth import User, DiscordUser, BotUser, TOKEN_LENGTH, Role
+from bw.cache import cached
+from bw.pagination import encode_page_token, decode_page_token
+from bw.models.auth import User, DiscordUser, BotUser, TOKEN_LENGTH, Role, Group, UserGroup
+from bw.settings import GLOBAL_CONFIGURATION
+from bw.web_event import RoleEvent, RoleChangedEvent, UserRoleChangedEvent
 from bw.error import AuthError, NoUserWithGivenCredentials, DbError, RoleCreationFailed, NoRoleWithName, DiscordUserAlreadyExists
 
 
+def discord_user_tag(discord_id: DiscordSnowflake) -> str:
+    return f'discord:user:{discord_id}'
+
+
 class UserStore:
     def create_user(self, state: State) -> User:
         """
@@ -120,7 +128,8 @@ class UserStore:
 
         *Docstring generated by AI.*
 
-        Retrieves a user from the database by their Discord ID.
+        Retrieves a user from the database by their Discord ID. The result is cached until the Discord ID is linked or
+        unlinked, and a Discord ID with no user is remembered for `cache_absent_ttl` seconds.
 
         **Async:** No
 
@@ -141,13 +150,24 @@ class UserStore:
         # User(id=1, uuid=UUID('...'))
         ```
         """
-        with state.Session.begin() as session:
-            query = select(User).join(DiscordUser, DiscordUser.user_id == User.id).where(DiscordUser.discord_id == discord_id)
-            try:
-                user = session.execute(query).one()[0]
-            except NoResultFound:
-                raise NoUserWithGivenCredentials(discord_id)
-            session.expunge(user)
+
+        def load() -> tuple[User | None, float | None]:
+            with state.Session.begin() as session:
+                query = select(User).join(DiscordUser, DiscordUser.user_id == User.id).where(DiscordUser.discord_id == discord_id)
+                user = session.execute(query).scalar_one_or_none()
+                if user is None:
+                    return None, float(GLOBAL_CONFIGURATION.get('cache_absent_ttl', 30))
+                session.expunge(user)
+            return user, None
+
+        def tags_of(user: User | None) -> tuple:
+            if user is None:
+                return (discord_user_tag(discord_id),)
+            return discord_user_tag(discord_id), user_sessions_tag(user.id), UserRoleChangedEvent
+
+        user = state.cache.load_through(discord_user_tag(discord_id), load, tags_of)
+        if user is None:
+            raise NoUserWithGivenCredentials(discord_id)
         return user
 
     def user_from_bot_token(self, state: State, bot_token: str) -> User:
@@ -271,6 +291,7 @@ class UserStore:
             except IntegrityError:
                 raise DbError()
             session.expunge(discord_user)
+        state.cache.invalidate(discord_user_tag(discord_id))
         return discord_user
 
     def delete_user(self, state: State, user: User):
@@ -299,6 +320,7 @@ class UserStore:
             self.delete_bot_user(state, user)
             query = delete(User).where(User.id == user.id)
             session.execute(query)
+        state.cache.invalidate(user_sessions_tag(user.id))
 
     def delete_discord_user(self, state: State, user: DiscordUser | User):
         """
@@ -331,7 +353,9 @@ class UserStore:
                 query = delete(DiscordUser).where(DiscordUser.user_id == user.id)
             else:
                 raise AuthError('attempting to delete user with bad arguments')
-            session.execute(query)
+            discord_ids = session.execute(query.returning(DiscordUser.discord_id)).scalars().all()
+        if discord_ids:
+            state.cache.invalidate(*(discord_user_tag(discord_id) for discord_id in discord_ids))
 
     def delete_bot_user(self, state: State, user: BotUser | User):
         """
@@ -401,6 +425,7 @@ class UserStore:
             except IntegrityError:
                 raise RoleCreationFailed(role_name)
             session.expunge(role)
+        state.broker.publish(RoleChangedEvent(role_name))
         return role
 
     def edit_role(self, state: State, role_name: str, new_roles: Roles) -> Role:
@@ -443,6 +468,7 @@ class UserStore:
 
             session.flush()
             session.expunge(permission)
+        state.broker.publish(RoleChangedEvent(role_name))
         return permission
 
     def delete_role(self, state: State, role_name: str):
@@ -484,6 +510,7 @@ class UserStore:
             session.flush()
 
             session.delete(role)
+        state.broker.publish(RoleChangedEvent(role_name))
 
     def assign_user_role(self, state: State, user: User, role_name: str):
         """
@@ -520,6 +547,7 @@ class UserStore:
 
             query = update(User).where(User.id == user.id).values(role=role.id)
             session.execute(query)
+        state.broker.publish(UserRoleChangedEvent(user.id))
 
     def get_all_roles(self, state: State) -> list[Role]:
         """
@@ -550,6 +578,7 @@ class UserStore:
             session.expunge_all()
         return list(roles)
 
+    @cached('auth', expire_on=RoleEvent)
     def get_users_role(self, state: State, user: User) -> Roles | None:
         """
         ### Retrieve a user's role
@@ -583,7 +612,26 @@ class UserStore:
             session.expunge(role)
         return role.into_roles()
 
-    def get_all_users_paginated(self, state: State, page: int = 1, page_size: int = 50) -> dict:
+    @cached('auth', ttl=60)
+    def user_count(self, state: State) -> int:
+        """
+        ### Count every user
+
+        Counting means scanning the whole table, so the result is cached for a minute and may briefly lag behind users
+        being created or deleted.
+
+        **Args:**
+        - `state` (`State`): The application state containing the database connection.
+
+        **Returns:**
+        - `int`: How many users exist.
+        """
+        with state.ReadSession.begin() as session:
+            return session.scalar(select(sqlalchemy.func.count()).select_from(User))
+
+    def get_all_users_paginated(
+        self, state: State, page_size: int = 50, continue_from: str | None = None, include_total: bool = False
+    ) -> dict:
         """
         ### Retrieve all users with pagination
 
@@ -592,84 +640,88 @@ class UserStore:
         Retrieves a paginated list of all users with their basic information, roles, groups,
         and connected apps (Discord, Bot).
 
+        Pages are read by user id rather than by offset, so every page costs the same single query however deep into
+        the list it is. The total is only counted when asked for.
+        Pages are read from the replica when one is configured.
+
         **Async:** No
 
         **Args:**
         - `state` (`State`): The application state containing the database connection.
-        - `page` (`int`): The page number to retrieve (default: 1).
         - `page_size` (`int`): Number of users per page (default: 50).
+        - `continue_from` (`str | None`): The `next` token of the previous page, or `None` for the first page.
+        - `include_total` (`bool`): Whether to include how many users there are in total (default: False).
+
+        **Raises:**
+        - `BadPageToken`: If `continue_from` is not a token handed out by this method.
 
         **Returns:**
-        - `dict`: A dictionary containing paginated user data and metadata.
+        - `dict`: A dictionary containing paginated user data and metadata. `next` is `None` on the last page.
 
         **Example:**
         ```python
         user_store = UserStore()
-        data = user_store.get_all_users_paginated(state, page=1, page_size=50)
+        data = user_store.get_all_users_paginated(state, page_size=50, include_total=True)
         # {
         #   'users': [...],
-        #   'total': 150,
-        #   'page': 1,
         #   'page_size': 50,
-        #   'total_pages': 3
+        #   'next': 'WzUwXQ',
+        #   'total': 150
         # }
         ```
         """
 
-        with state.Session.begin() as session:
-            # Get total count
-            count_query = select(sqlalchemy.func.count()).select_from(User)
-            total = session.scalar(count_query)
-
-            # Get paginated users
-            offset = (page - 1) * page_size
-            query = select(User).offset(offset).limit(page_size)
-            users = session.execute(query).scalars().all()
-
-            users_data = []
-            for user in users:
-                # Get role
-                role_name = None
-                if user.role is not None:
-                    role_query = select(Role).where(Role.id == user.role)
-                    try:
-                        role = session.execute(role_query).one()[0]
-                        role_name = role.name
-                    except NoResultFound:
-                        pass
-
-                # Get groups
-                session.expunge(user)
-                groups = GroupStore().get_user_groups(state, user)
-                group_names = [group.name for group in groups]
-
-                # Get connected apps
-                discord_query = select(DiscordUser).where(DiscordUser.user_id == user.id)
-                has_discord = session.execute(discord_query).first() is not None
-
-                bot_query = select(BotUser).where(BotUser.user_id == user.id)
-                has_bot = session.execute(bot_query).first() is not None
-
-                users_data.append(
-                    {
-                        'id': user.id,
-                        'uuid': str(user.uuid),
-                        'creation_date': user.creation_date.isoformat(),
-                        'role': role_name,
-                        'groups': group_names,
-                        'connected_apps': {
-                            'discord': has_discord,
-                            'bot': has_bot,
-                        },
-                    }
-                )
-
-        total_pages = (total + page_size - 1) // page_size
-
-        return {
+        group_names = (
+            select(Group.name)
+            .join(UserGroup, UserGroup.group_id == Group.id)
+            .where(UserGroup.user_id == User.id)
+            .order_by(Group.name)
+            .correlate(User)
+            .scalar_subquery()
+        )
+        query = (
+            select(
+                User.id,
+                User.uuid,
+                User.creation_date,
+                Role.name.label('role'),
+                sqlalchemy.func.array(group_names).label('groups'),
+                sqlalchemy.exists().where(DiscordUser.user_id == User.id).label('has_discord'),
+                sqlalchemy.exists().where(BotUser.user_id == User.id).label('has_bot'),
+            )
+            .outerjoin(Role, Role.id == User.role)
+            .order_by(User.id)
+            # one extra row tells us whether there is another page without counting
+            .limit(page_size + 1)
+        )
+        if continue_from is not None:
+            (last_id,) = decode_page_token(continue_from, int)
+            query = query.where(User.id > last_id)
+
+        with state.ReadSession.begin() as session:
+            rows = session.execute(query).all()
+
+        rows, more = rows[:page_size], len(rows) > page_size
+        users_data = [
+            {
+                'id': row.id,
+                'uuid': str(row.uuid),
+                'creation_date': row.creation_date.isoformat(),
+                'role': row.role,
+                'groups': list(row.groups),
+                'connected_apps': {
+                    'discord': row.has_discord,
+                    'bot': row.has_bot,
+                },
+            }
+            for row in rows
+        ]
+
+        data = {
             'users': users_data,
-            'total': total,
-            'page': page,
             'page_size': page_size,
-            'total_pages': total_pages,
+            'next': encode_page_token(rows[-1].id) if more else None,
         }
+        if include_total:
+            data['total'] = self.user_count(state)
+        return data
@@ -1,9 +1,15 @@
+import ipaddress
 from bw.error import NonLocalIpAccessingLocalOnlyAddress, SessionExpired, NotEnoughPermissions
 from bw.state import State
 from bw.auth import api
 from bw.auth.roles import Roles
 from bw.auth.permissions import Permissions
 
+LOCAL_NETWORKS = tuple(
+    ipaddress.ip_network(network)
+    for network in ('0.0.0.0/8', '10.0.0.0/8', '127.0.0.0/8', '172.16.0.0/16', '192.0.0.0/24', '192.168.0.0/16')
+)
+
 
 def validate_user_has_permissions(state: State, session_token: str, permissions: Permissions):
     """
@@ -77,13 +83,9 @@ def validate_local(ip: str | None):
     if ip is None:
         raise NonLocalIpAccessingLocalOnlyAddress('IP address not present')
 
-    valid_local_prefix = (
-        '0.',
-        '10.',
-        '127.',
-        '172.16.',
-        '192.0.0.',
-        '192.168.',
-    )
-    if not any([ip.startswith(prefix) for prefix in valid_local_prefix]):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        raise NonLocalIpAccessingLocalOnlyAddress(ip)
+    if not any(address in network for network in LOCAL_NETWORKS):
         raise NonLocalIpAccessingLocalOnlyAddress(ip)
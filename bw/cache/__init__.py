@@ -1 +1,2 @@
 from bw.cache.cache import Cache as Cache
+from bw.cache.decorators import cached as cached
@@ -1,45 +1,585 @@
 # A caching scheme that mimics CPU architecture caches.
-# Includes an "L1" cache that is a simple in-memory cache,
-# and can be extended with an "L2" cache that is a networked cache (memcache, redis).
+# Includes an "L1" cache that is a simple in-memory cache private to each worker,
+# and an "L2" cache that is shared between every worker on the host.
+# A snapshot written on shutdown warms both back up after a restart.
 
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
 import logging
-from typing import Any
+import os
+import pickle
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from dataclasses import dataclass
+from typing import Any, TypeVar
 from bw.cache.l1 import L1Cache
-from bw.error import L1CacheMiss
+from bw.cache.l2 import L2Cache, Invalidation
+from bw.cache.snapshot import Snapshot, schema_revision, write_snapshot
+from bw.cache.tags import Tag, make_tags
+from bw.environment import ENVIRONMENT, Test
+from bw.error import CacheMiss, L1CacheMiss, L2CacheMiss
+from bw.settings import GLOBAL_CONFIGURATION
 from bw.web_event import BaseEvent
 
 logger = logging.getLogger('bw.cache')
 
+_MISSING = object()
+
+# invalidations made inside `Cache.repeating_invalidations`, to be made again once it exits
+_repeated_invalidations: contextvars.ContextVar[list[tuple[Callable, tuple]] | None] = contextvars.ContextVar(
+    'repeated_invalidations', default=None
+)
+
+T = TypeVar('T')
+
+
+def _locked(method):
+    # handlers hand database work, and the caching around it, to a pool of threads, so every change to the tiers
+    # happens under the cache's lock
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+@dataclass(frozen=True, slots=True)
+class _Loading:
+    # a load in flight, which anything else missing the same key waits on instead of loading it again. Database
+    # threads block on the future, while coroutines await it, so the one registry serves both
+    future: concurrent.futures.Future
+    invalidations: int
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+@dataclass(frozen=True, slots=True)
+class Revalidating:
+    # a value which is still served after `refresh_at`, but triggers a refresh when it is
+    value: Any
+    refresh_at: float
+
 
 class Cache:
     l1_cache: L1Cache
-    l2_cache: None  # Placeholder for L2 cache, if implemented later
+    l2_cache: L2Cache | None
+    snapshot: Snapshot | None
+
+    _loading: dict[str, _Loading]
+    _invalidations: int
+    _lock: threading.RLock
 
     def __init__(self):
+        self._lock = threading.RLock()
+        self._loading = {}
+        self._invalidations = 0
+
         self.l1_cache = L1Cache()
-        self.l2_cache = None
+        self.l1_cache.on_evict = self._demote
+
+        l2_cache_path = ENVIRONMENT.l2_cache_path()
+        if l2_cache_path is not None:
+            self.l2_cache = L2Cache(l2_cache_path, int(GLOBAL_CONFIGURATION.get('l2_cache_size', 64 * 1024 * 1024)))
+        else:
+            self.l2_cache = None
+
+        snapshot_path = ENVIRONMENT.cache_snapshot_path()
+        if snapshot_path is not None:
+            self.snapshot = Snapshot(
+                snapshot_path, float(GLOBAL_CONFIGURATION.get('cache_snapshot_max_age', 60 * 60)), self.l2_cache
+            )
+        else:
+            self.snapshot = None
+
+    @property
+    def invalidations(self) -> int:
+        # bumped on every invalidation this worker makes or syncs, so a reader can tell whether anything it read from
+        # the database may have been invalidated before it got the chance to cache it
+        return self._invalidations
+
+    def _repeat_later(self, method: Callable, args: tuple):
+        repeated = _repeated_invalidations.get()
+        if repeated is not None:
+            repeated.append((method, args))
+
+    @contextlib.contextmanager
+    def repeating_invalidations(self) -> Iterator[None]:
+        """
+        ### Make every invalidation inside the block again once it exits
+
+        Writes made inside a transaction invalidate the cache before they are committed, so another request can
+        read and cache the old rows in between. Repeating the invalidations after the transaction has committed, or
+        rolled back, drops anything cached in the meantime.
+        """
+        if _repeated_invalidations.get() is not None:
+            yield
+            return
+
+        repeated: list[tuple[Callable, tuple]] = []
+        token = _repeated_invalidations.set(repeated)
+        try:
+            yield
+        finally:
+            _repeated_invalidations.reset(token)
+            for method, args in repeated:
+                method(*args)
 
-    def event(self, event: type[BaseEvent], data: Any = None):
+    def _demote(self, key: str, value: Any, tags: frozenset[str], expires_at: float | None):
+        if self.l2_cache is not None:
+            logger.debug(f"Demoting '{key}' from L1 cache into L2 cache")
+            self.l2_cache.insert(key, value, tags, expires_at=expires_at)
+
+    @_locked
+    def sync(self):
+        """
+        ### Apply invalidations made by other workers
+
+        Drops anything from the L1 cache which another worker has invalidated or overwritten since the last sync.
+        """
+        if self.l2_cache is None:
+            return
+
+        invalidations = self.l2_cache.poll()
+        if invalidations is None or invalidations:
+            self._invalidations += 1
+
+        if invalidations is None:
+            logger.debug('Fell too far behind the L2 invalidation log, dropping L1 cache')
+            self.l1_cache.clear()
+            if self.snapshot is not None:
+                self.snapshot.clear()
+            return
+
+        # the snapshot is private to this worker like the L1 cache, so it has to be told about the same invalidations
+        tiers = [self.l1_cache] if self.snapshot is None else [self.l1_cache, self.snapshot]
+        for kind, target in invalidations:
+            for tier in tiers:
+                if kind == Invalidation.KEY:
+                    tier.expire(target)
+                elif kind == Invalidation.TAG:
+                    tier.invalidate(target)
+                elif kind == Invalidation.NAMESPACE:
+                    tier.invalidate_namespace(target)
+                elif kind == Invalidation.CLEAR:
+                    tier.clear()
+
+    @_locked
+    def event(self, event: type[BaseEvent] | BaseEvent, data: Any = None):
+        # the broker hands us the published event instance, but entries are keyed off the event class
+        if not isinstance(event, type):
+            event = type(event)
+
+        self._repeat_later(self.event, (event,))
+        self._invalidations += 1
         self.l1_cache.event(event)
+        if self.l2_cache is not None:
+            self.l2_cache.event(event)
+        if self.snapshot is not None:
+            self.snapshot.invalidate(event)
+
+    @_locked
+    def invalidate(self, *tags: Tag):
+        self._repeat_later(self.invalidate, tags)
+        self._invalidations += 1
+        self.l1_cache.invalidate(*tags)
+        if self.l2_cache is not None:
+            self.l2_cache.invalidate(*tags)
+        if self.snapshot is not None:
+            self.snapshot.invalidate(*tags)
+
+    @_locked
+    def invalidate_namespace(self, namespace: str):
+        self._repeat_later(self.invalidate_namespace, (namespace,))
+        self._invalidations += 1
+        self.l1_cache.invalidate_namespace(namespace)
+        if self.l2_cache is not None:
+            self.l2_cache.invalidate_namespace(namespace)
+        if self.snapshot is not None:
+            self.snapshot.invalidate_namespace(namespace)
+
+    @_locked
+    def insert(
+        self,
+        key: str,
+        value: Any,
+        expire_event: type[BaseEvent] | None = None,
+        tags: Iterable[Tag] = (),
+        size: int | None = None,
+        ttl: float | None = None,
+    ):
+        entry_tags = make_tags(expire_event, tags)
+        ttl = ttl if ttl is not None else self.l1_cache.default_ttl
+        expires_at = time.time() + ttl if ttl is not None else None
 
-    def insert(self, key: str, value: Any, expire_event: type[BaseEvent] | None = None):
-        logging.info(f"Inserting '{key}' into cache")
-        logging.debug(f"Inserting '{key}' into L1 cache")
-        popped_items = self.l1_cache.insert(key, value, expire_event)  # noqa: F841
-        logging.debug(f'Popped {len(popped_items)} items from L1 cache')
-        # If L2 cache is implemented, it would handle the popped items
-        # for right now, unused
+        logger.debug(f"Inserting '{key}' into L1 cache")
+        popped_items = self.l1_cache.insert(key, value, None, entry_tags, size=size, expires_at=expires_at)
+        logger.debug(f'Popped {len(popped_items)} items from L1 cache')
+
+        if self.l2_cache is not None:
+            # write through so every other worker sees the new value instead of a stale one
+            logger.debug(f"Inserting '{key}' into L2 cache")
+            self.l2_cache.insert(key, value, entry_tags, notify=True, expires_at=expires_at)
+
+    @_locked
+    def _lookup(self, key: str) -> Any:
+        self.sync()
+
+        logger.debug(f"Getting '{key}' from L1 cache")
+        value = self.l1_cache.get(key, _MISSING)
+        if value is not _MISSING:
+            logger.debug(f'L1 Cache hit! Key: {key}')
+            return value
+        logger.debug(f'L1 Cache miss! Key: {key}')
+
+        if self.l2_cache is not None:
+            item = self.l2_cache.get(key)
+            if item is not None:
+                logger.debug(f'L2 Cache hit! Key: {key}')
+                value, tags, expires_at = item
+                self.l1_cache.insert(key, value, None, tags, expires_at=expires_at)
+                return value
+            logger.debug(f'L2 Cache miss! Key: {key}')
+
+        if self.snapshot is not None:
+            item = self.snapshot.take(key)
+            if item is not None:
+                logger.debug(f'Snapshot hit! Key: {key}')
+                value, tags, expires_at = item
+                self.l1_cache.insert(key, value, None, tags, expires_at=expires_at)
+                return value
+
+        if self.l2_cache is None:
+            raise L1CacheMiss(key)
+        raise L2CacheMiss(key)
 
     def get(self, key: str) -> Any | None:
-        logging.info(f"Getting '{key}' from cache")
-        logging.debug(f"Getting '{key}' from L1 cache")
-        item = self.l1_cache.get(key)
-        if item is not None:
-            logging.debug(f'L1 Cache hit! Key: {key}')
-            return item
-        logging.debug(f'L1 Cache miss! Key: {key}')
-        raise L1CacheMiss(key)
-        # todo! if L2 cache is implemented, check there as well
+        value = self._lookup(key)
+        if isinstance(value, Revalidating):
+            return value.value
+        return value
+
+    @_locked
+    def insert_unless_invalidated(
+        self,
+        invalidations: int,
+        key: str,
+        value: Any,
+        expire_event: type[BaseEvent] | None = None,
+        tags: Iterable[Tag] = (),
+        size: int | None = None,
+        ttl: float | None = None,
+    ) -> bool:
+        """
+        ### Cache a value read from the database, unless anything was invalidated since the read began
+
+        A write made while the value was being read must not be undone by caching what was read before it, so
+        invalidations made by other workers are synced first.
+
+        **Args:**
+        - `invalidations` (`int`): `Cache.invalidations` from before the value was read.
+        - `key` (`str`): The key to store the value under.
+        - `value` (`Any`): The value to store.
+        - `expire_event` (`type[BaseEvent] | None`): Event which expires the value.
+        - `tags` (`Iterable[Tag]`): Tags which expire the value.
+        - `size` (`int | None`): Size of the value in bytes, if known.
+        - `ttl` (`float | None`): Seconds the value may be served for. Falls back to the cache's default TTL.
+
+        **Returns:**
+        - `bool`: `True` if the value was cached.
+        """
+        self.sync()
+        if invalidations != self._invalidations:
+            logger.debug(f"Not caching '{key}', cache was invalidated during load")
+            return False
+        self.insert(key, value, expire_event, tags, size=size, ttl=ttl)
+        return True
+
+    @_locked
+    def _join_or_lead(self, key: str) -> tuple[_Loading, bool]:
+        # a load which started before the latest invalidation may have read rows from before the write, so is not joined
+        self.sync()
+        loading = self._loading.get(key)
+        if loading is not None and loading.invalidations == self._invalidations:
+            return loading, False
+        loading = self._loading[key] = _Loading(concurrent.futures.Future(), self._invalidations)
+        return loading, True
+
+    @_locked
+    def _finish_loading(self, key: str, loading: _Loading):
+        if self._loading.get(key) is loading:
+            del self._loading[key]
+
+    def load_once(self, key: str, load: Callable[[], T]) -> T:
+        """
+        ### Call `load`, unless another thread is already loading `key`
+
+        Threads missing the same key at the same time wait on the first one's load and share its result, or its
+        error, so a burst of misses sends one query to the database instead of one each. A load which started before
+        the latest invalidation is not joined, since it may have read rows from before the write that invalidated it.
+
+        Waiting blocks the calling thread, so this must only be called from the database threads, never from the event
+        loop. Coroutines wait on in-flight loads through `get_or_load` instead. Called from the event loop it fails
+        while testing, and otherwise loads without waiting on anyone.
+
+        **Args:**
+        - `key` (`str`): The key being loaded.
+        - `load` (`Callable[[], T]`): Produces the value. Whatever it returns is shared between every waiting thread,
+          so it should be immutable, e.g. a pickled snapshot.
+
+        **Returns:**
+        - `T`: What `load` returned, on this thread or the one it waited on.
+
+        **Raises:**
+        - `RuntimeError`: If called from the event loop while testing.
+        - Whatever `load` raises.
+        """
+        if _on_event_loop():
+            error = RuntimeError(f"Loading '{key}' on the event loop, hand it to `run_in_db_thread` instead")
+            if isinstance(ENVIRONMENT, Test):
+                raise error
+            logger.warning(str(error))
+            return load()
+
+        loading, leader = self._join_or_lead(key)
+        if not leader:
+            logger.debug(f"Waiting on in-flight load of '{key}'")
+            return loading.future.result()
+
+        try:
+            value = load()
+        except BaseException as e:
+            loading.future.set_exception(e)
+            raise
+        else:
+            loading.future.set_result(value)
+            return value
+        finally:
+            self._finish_loading(key, loading)
+
+    def load_through(self, key: str, load: Callable[[], tuple[T, float | None]], tags_of: Callable[[T], Iterable[Tag]]) -> T:
+        """
+        ### Get a value, loading and caching a snapshot of it on a miss
+
+        Values are stored pickled, so every caller gets its own copy. A value is not cached if anything was
+        invalidated, by this worker or any other, while it was being loaded. Concurrent misses on the same key share
+        a single call to `load`.
+
+        **Args:**
+        - `key` (`str`): The key to get.
+        - `load` (`Callable[[], tuple[T, float | None]]`): Produces the value on a miss, along with its TTL.
+        - `tags_of` (`Callable[[T], Iterable[Tag]]`): The tags which expire a loaded value.
+
+        **Returns:**
+        - `T`: The cached or loaded value.
+
+        **Raises:**
+        - Whatever `load` raises. Failures are not cached.
+        """
+        try:
+            return pickle.loads(self.get(key))
+        except CacheMiss:
+            pass
+
+        def load_snapshot() -> bytes:
+            invalidations = self._invalidations
+            value, ttl = load()
+
+            snapshot = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            self.insert_unless_invalidated(invalidations, key, snapshot, tags=tuple(tags_of(value)), size=len(snapshot), ttl=ttl)
+            return snapshot
+
+        return pickle.loads(self.load_once(key, load_snapshot))
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        expire_event: type[BaseEvent] | None = None,
+        tags: Iterable[Tag] = (),
+        size: int | None = None,
+        ttl: float | None = None,
+        stale_ttl: float | None = None,
+    ) -> Any:
+        """
+        ### Get a value, loading it on a miss
+
+        Concurrent misses on the same key within this worker share a single call to `loader` rather than each
+        calling it themselves, through the same in-flight loads as `load_once`, but awaited rather than blocked on.
+        A caller going away does not cancel the load for everyone else waiting on it.
+
+        If `stale_ttl` is given the value is served for a further `stale_ttl` seconds after its `ttl` runs out, while
+        a single background load refreshes it.
+
+        **Args:**
+        - `key` (`str`): The key to get.
+        - `loader` (`Callable[[], Awaitable[Any]]`): Produces the value on a miss.
+        - `expire_event` (`type[BaseEvent] | None`): Event which expires the loaded value.
+        - `tags` (`Iterable[Tag]`): Tags which expire the loaded value.
+        - `size` (`int | None`): Size of the loaded value in bytes, if known.
+        - `ttl` (`float | None`): Seconds the loaded value is fresh for. Falls back to the cache's default TTL.
+        - `stale_ttl` (`float | None`): Seconds a value is still served for while it is refreshed.
+
+        **Returns:**
+        - `Any`: The cached or loaded value.
+
+        **Raises:**
+        - `ValueError`: If `stale_ttl` is given without any TTL to go stale after.
+        - Whatever `loader` raises. Failures are not cached.
+        """
+        ttl = ttl if ttl is not None else self.l1_cache.default_ttl
+        if stale_ttl is not None and ttl is None:
+            raise ValueError('a value can only go stale if it has a TTL')
+
+        try:
+            value = self._lookup(key)
+        except CacheMiss:
+            pass
+        else:
+            if not isinstance(value, Revalidating):
+                return value
+            if value.refresh_at <= time.time():
+                loading, leader = self._join_or_lead(key)
+                if leader:
+                    logger.debug(f"Serving stale '{key}' while it is refreshed")
+                    self._start_load(key, loading, loader, expire_event, tags, size, ttl, stale_ttl)
+            return value.value
+
+        loading, leader = self._join_or_lead(key)
+        if leader:
+            self._start_load(key, loading, loader, expire_event, tags, size, ttl, stale_ttl)
+        else:
+            logger.debug(f"Waiting on in-flight load of '{key}'")
+        return await asyncio.shield(asyncio.wrap_future(loading.future))
+
+    def _start_load(
+        self,
+        key: str,
+        loading: _Loading,
+        loader: Callable[[], Awaitable[Any]],
+        expire_event: type[BaseEvent] | None,
+        tags: Iterable[Tag],
+        size: int | None,
+        ttl: float | None,
+        stale_ttl: float | None,
+    ):
+        async def load() -> Any:
+            value = await loader()
+            if stale_ttl is None:
+                self.insert_unless_invalidated(loading.invalidations, key, value, expire_event, tags, size=size, ttl=ttl)
+            else:
+                stored = Revalidating(value, time.time() + ttl)
+                self.insert_unless_invalidated(
+                    loading.invalidations, key, stored, expire_event, tags, size=size, ttl=ttl + stale_ttl
+                )
+            return value
+
+        def done(task: asyncio.Task):
+            self._finish_loading(key, loading)
+            if task.cancelled():
+                loading.future.cancel()
+            elif task.exception() is not None:
+                logger.debug(f"Loading '{key}' failed: {task.exception()}")
+                loading.future.set_exception(task.exception())
+            else:
+                loading.future.set_result(task.result())
+
+        asyncio.get_running_loop().create_task(load()).add_done_callback(done)
+
+    @_locked
+    def expire(self, key: str):
+        self._repeat_later(self.expire, (key,))
+        self._invalidations += 1
+        self.l1_cache.expire(key)
+        if self.l2_cache is not None:
+            self.l2_cache.expire(key)
+        if self.snapshot is not None:
+            self.snapshot.expire(key)
+
+    @_locked
+    def clear(self):
+        self._repeat_later(self.clear, ())
+        self._invalidations += 1
+        self.l1_cache.clear()
+        if self.l2_cache is not None:
+            self.l2_cache.clear()
+        if self.snapshot is not None:
+            self.snapshot.clear()
+
+    @_locked
+    def dump_snapshot(self) -> int:
+        """
+        ### Write everything cached to the snapshot for the next run to warm up from
+
+        Both the L2 cache and this worker's L1 cache are written, with the L1 cache winning wherever they disagree.
+        Entries which cannot be pickled are left out. Every worker writes the whole of the shared L2 cache, and the
+        snapshot is replaced atomically, so whichever worker stops last leaves a complete snapshot behind. The
+        snapshot records how far through the L2 invalidation log it is up to date, so invalidations made after it
+        was written are replayed onto it when it is loaded.
+
+        **Returns:**
+        - `int`: The number of entries written.
+        """
+        path = ENVIRONMENT.cache_snapshot_path()
+        revision = schema_revision()
+        if path is None or revision is None:
+            return 0
+
+        now = time.time()
+        entries = {}
+        log_position = None
+        if self.l2_cache is not None:
+            # the L1 cache is up to date as of this position, and the L2 cache read below at least as up to date
+            self.sync()
+            log_position = self.l2_cache.log_position()
+            for key, blob, tags, expires_at in self.l2_cache.entries():
+                entries[key] = (key, blob, tags, expires_at)
+
+        for key, entry in self.l1_cache.entry_map.items():
+            if entry.expires_at is not None and entry.expires_at <= now:
+                continue
+            try:
+                blob = pickle.dumps((self.l1_cache.memory_cache[key], entry.tags), protocol=pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                logger.debug(f"Leaving '{key}' out of cache snapshot: {e}")
+                entries.pop(key, None)
+                continue
+            entries[key] = (key, blob, entry.tags, entry.expires_at)
+
+        written = write_snapshot(path, revision, entries.values(), log_position)
+        logger.info(f'Wrote {written} entries to cache snapshot {path}')
+        return written
+
+    @_locked
+    def report(self, largest: int = 10) -> dict[str, Any]:
+        """
+        ### Report how well each tier of the cache is doing
+
+        Counters are kept by this worker alone. What the L2 cache holds is shared by every worker on the host, so its
+        sizes and largest entries are host-wide while its hit and miss counters are not.
+
+        **Args:**
+        - `largest` (`int`): How many of the largest entries to list for each tier.
+
+        **Returns:**
+        - `dict[str, Any]`: Counters, bytes used and largest entries per tier and namespace.
+        """
+        return {
+            'pid': os.getpid(),
+            'inflight_loads': len(self._loading),
+            'l1': self.l1_cache.report(largest),
+            'l2': self.l2_cache.report(largest) if self.l2_cache is not None else None,
+        }
 
     def __getitem__(self, key: str) -> Any:
         return self.get(key)
@@ -0,0 +1,178 @@
+import enum
+import functools
+import inspect
+import logging
+import pickle
+import uuid
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from typing import Any, ParamSpec, TypeVar
+
+from sqlalchemy import inspect as sqlalchemy_inspect
+from sqlalchemy.exc import NoInspectionAvailable
+
+from bw.error import CacheMiss
+from bw.settings import GLOBAL_CONFIGURATION
+from bw.web_event import BaseEvent
+
+logger = logging.getLogger('bw.cache')
+
+P = ParamSpec('P')
+R = TypeVar('R')
+
+
+@dataclass(frozen=True, slots=True)
+class Absent:
+    # a lookup which is known to find nothing. The error is rebuilt without calling its constructor, since
+    # most errors format their message in `__init__` and would not survive a round trip through their `args`
+    error_type: type[Exception]
+    args: tuple
+    attributes: dict[str, Any]
+
+    @classmethod
+    def of(cls, error: Exception) -> 'Absent':
+        return cls(type(error), error.args, dict(vars(error)))
+
+    def error(self) -> Exception:
+        error = self.error_type.__new__(self.error_type)
+        error.args = self.args
+        error.__dict__.update(self.attributes)
+        return error
+
+
+def _key_part(value: Any) -> str:
+    if value is None or isinstance(value, str | int | float | bool | enum.Enum):
+        return repr(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if hasattr(value, 'cache_key'):
+        return f'{type(value).__name__}#{value.cache_key()}'
+    if isinstance(value, tuple | list | frozenset | set):
+        parts = [_key_part(item) for item in value]
+        if isinstance(value, frozenset | set):
+            parts.sort()
+        return f'({",".join(parts)})'
+
+    # models are keyed by primary key, a detached instance may carry stale columns but its primary key never changes
+    try:
+        instance_state = sqlalchemy_inspect(value)
+        identity = instance_state.mapper.primary_key_from_instance(value)
+    except (NoInspectionAvailable, AttributeError):
+        identity = [None]
+    if any(key is None for key in identity):
+        raise TypeError(f'cannot derive a cache key from {type(value).__name__}')
+    return f'{type(value).__name__}#{",".join(str(key) for key in identity)}'
+
+
+def _snapshot_of(key: str, value: Any) -> bytes | None:
+    try:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        logger.warning(f"Not caching '{key}', result cannot be pickled: {e}")
+        return None
+
+
+def cached(
+    namespace: str,
+    *,
+    expire_on: type[BaseEvent] | Iterable[type[BaseEvent]] = (),
+    ttl: float | None = None,
+    absent: type[Exception] | tuple[type[Exception], ...] = (),
+    absent_ttl: float | None = None,
+    cache_found: bool = True,
+) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """
+    ### Cache the result of a Store read
+
+    Results are keyed off the method and every argument other than `self` and `state`, and stored in `state.cache`
+    as a pickled snapshot. Arguments must be plain values, models, or define their own `cache_key()`. Every call which
+    hits the cache gets its own freshly unpickled, detached copy, so callers are free to mutate what they get back
+    without affecting anyone else.
+
+    Calls which raise are not cached, unless they raise one of the `absent` errors. Those are remembered for a short
+    while and raised again without going back to the database.
+
+    Concurrent misses on the same key, from the database threads, share a single call to the method. A result is
+    not cached if anything was invalidated, by this worker or any other, while the method was running.
+
+    **Args:**
+    - `namespace` (`str`): The cache namespace the results are stored under.
+    - `expire_on` (`type[BaseEvent] | Iterable[type[BaseEvent]]`): Events which expire every cached result when
+      published, including any subclasses of them.
+    - `ttl` (`float | None`): Seconds a result may be served for. Falls back to the cache's default TTL.
+    - `absent` (`type[Exception] | tuple[type[Exception], ...]`): Errors which mean the lookup found nothing.
+    - `absent_ttl` (`float | None`): Seconds a lookup is remembered as finding nothing. Falls back to the
+      `cache_absent_ttl` config value, or 30 seconds.
+    - `cache_found` (`bool`): Whether results are cached at all, rather than only lookups which found nothing.
+
+    **Returns:**
+    - `Callable`: The decorator.
+
+    **Example:**
+    ```python
+    class MissionStore:
+        @cached('mission', expire_on=MissionUploadEvent)
+        def mission_with_uuid(self, state: State, uuid: UUID) -> Mission: ...
+    ```
+    """
+    if isinstance(expire_on, type):
+        expire_on = (expire_on,)
+    tags = tuple(expire_on)
+    if isinstance(absent, type):
+        absent = (absent,)
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        signature = inspect.signature(func)
+        if 'state' not in signature.parameters:
+            raise TypeError(f'{func.__qualname__} must take a `state` argument to be cached')
+        key_parameters = [name for name in signature.parameters if name not in ('self', 'state')]
+
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            cache = bound.arguments['state'].cache
+            key = f'{namespace}:{func.__qualname__}({",".join(_key_part(bound.arguments[name]) for name in key_parameters)})'
+
+            try:
+                result = pickle.loads(cache.get(key))
+            except CacheMiss:
+                pass
+            else:
+                if isinstance(result, Absent):
+                    raise result.error()
+                return result
+
+            loaded_here = False
+
+            def load() -> tuple[Any, bytes | None]:
+                nonlocal loaded_here
+                loaded_here = True
+                invalidations = cache.invalidations
+                try:
+                    result = func(*args, **kwargs)
+                except absent as e:
+                    entry_ttl = absent_ttl if absent_ttl is not None else float(GLOBAL_CONFIGURATION.get('cache_absent_ttl', 30))
+                    snapshot = _snapshot_of(key, Absent.of(e))
+                    if snapshot is not None:
+                        cache.insert_unless_invalidated(
+                            invalidations, key, snapshot, tags=tags, size=len(snapshot), ttl=entry_ttl
+                        )
+                    raise
+
+                snapshot = _snapshot_of(key, result)
+                if cache_found and snapshot is not None:
+                    cache.insert_unless_invalidated(invalidations, key, snapshot, tags=tags, size=len(snapshot), ttl=ttl)
+                return result, snapshot
+
+            # concurrent misses share one call, and each caller other than the one which made it gets its own copy
+            result, snapshot = cache.load_once(key, load)
+            if loaded_here:
+                return result
+            if snapshot is None:
+                return func(*args, **kwargs)
+            return pickle.loads(snapshot)
+
+        return wrapper
+
+    return decorator
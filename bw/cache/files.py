@@ -0,0 +1,39 @@
+import os
+import stat
+from pathlib import Path
+
+from bw.error import InsecureCachePath
+
+
+def _check_owned(path: Path, is_kind, kind: str):
+    # cache files are unpickled, so anything another local user could have written to is refused
+    info = os.lstat(path)
+    if not is_kind(info.st_mode):
+        raise InsecureCachePath(path, f'not a {kind}')
+    if not hasattr(os, 'getuid'):
+        return
+    if info.st_uid != os.getuid():
+        raise InsecureCachePath(path, f'owned by uid {info.st_uid}, not {os.getuid()}')
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise InsecureCachePath(path, f'writable by other users (mode {stat.filemode(info.st_mode)})')
+
+
+def check_private_file(path: Path):
+    """
+    ### Make sure only this user could have written a cache file
+
+    The file's directory is created, readable by this user alone, if it does not exist yet. Both the directory and the
+    file, if there is one, must belong to this user and must not be writable by anyone else. Neither may be a symlink.
+
+    **Args:**
+    - `path` (`Path`): The cache file about to be opened.
+
+    **Raises:**
+    - `InsecureCachePath`: If another user could have planted or changed the file.
+    """
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    _check_owned(path.parent, stat.S_ISDIR, 'directory')
+    try:
+        _check_owned(path, stat.S_ISREG, 'regular file')
+    except FileNotFoundError:
+        pass
@@ -1,25 +1,208 @@
-import objsize
+import heapq
 import logging
+import time
+from collections.abc import Callable, Iterable
 from typing import Any, Optional
 from bw.settings import GLOBAL_CONFIGURATION
 from bw.web_event import BaseEvent
+from bw.error import InvalidConfigValue
+from bw.cache.sizer import Sizer, sizer_from_config, namespace_budgets_from_config
+from bw.cache.stats import CacheStats, NO_NAMESPACE
+from bw.cache.tags import Tag, encode_tag, event_tags, make_tags, namespace_of
 
 logger = logging.getLogger('bw.cache')
 
 
 class Entry:
     key: str
-    expire_event: type[BaseEvent] | None
+    tags: frozenset[str]
+    size: int
+    expires_at: float | None
     next: Optional['Entry']
     prev: Optional['Entry']
 
-    def __init__(self, key: str, expire_event: type[BaseEvent] | None):
+    def __init__(self, key: str, tags: frozenset[str], size: int, expires_at: float | None = None):
         self.key = key
-        self.expire_event = expire_event
+        self.tags = tags
+        self.size = size
+        self.expires_at = expires_at
         self.prev = None
         self.next = None
 
 
+class CountMinSketch:
+    """
+    ### Approximate access counts for keys, in a fixed amount of memory
+
+    Counters saturate at 15 and are halved once enough accesses have been recorded, so that keys which were popular
+    a long time ago gradually lose their standing.
+    """
+
+    DEPTH = 4
+    MAX_COUNT = 15
+    SEEDS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+
+    def __init__(self, width: int):
+        # round up to a power of two so indexing is a mask
+        self.width = 1 << max(width - 1, 1).bit_length()
+        self.mask = self.width - 1
+        self.rows = [bytearray(self.width) for _ in range(self.DEPTH)]
+        self.additions = 0
+        self.reset_after = 10 * self.width
+
+    def _indexes(self, key: str) -> list[int]:
+        h = hash(key)
+        return [((h * seed) >> 16) & self.mask for seed in self.SEEDS]
+
+    def increment(self, key: str):
+        for row, index in zip(self.rows, self._indexes(key)):
+            if row[index] < self.MAX_COUNT:
+                row[index] += 1
+
+        self.additions += 1
+        if self.additions >= self.reset_after:
+            self.rows = [bytearray(count >> 1 for count in row) for row in self.rows]
+            self.additions //= 2
+
+    def estimate(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+    def clear(self):
+        self.rows = [bytearray(self.width) for _ in range(self.DEPTH)]
+        self.additions = 0
+
+
+class CachePolicy:
+    """
+    ### Decides which entry to evict, and whether a new entry is worth evicting it for
+    """
+
+    def record_access(self, key: str):
+        pass
+
+    def on_insert(self, key: str, size: int):
+        pass
+
+    def on_update(self, key: str, size: int):
+        pass
+
+    def on_hit(self, key: str):
+        pass
+
+    def on_remove(self, key: str):
+        pass
+
+    def victim(self, exclude: str) -> str | None:
+        """
+        ### The key to evict next
+
+        **Returns:**
+        - `str | None`: The key to evict, or `None` to evict the least recently used entry.
+        """
+        return None
+
+    def admit(self, candidate: str, victim: str) -> bool:
+        raise NotImplementedError()
+
+    def clear(self):
+        pass
+
+
+class LruPolicy(CachePolicy):
+    """
+    ### Always admits, so the least recently used entry is always evicted
+    """
+
+    def admit(self, candidate: str, victim: str) -> bool:
+        return True
+
+
+class TinyLfuPolicy(CachePolicy):
+    """
+    ### Only admits entries which are accessed more often than the entry they would evict
+
+    New entries start out on probation and are only protected once they are read again. Eviction takes from
+    probation first, so keys touched once by a scan (e.g. paging through every mission) push out each other rather
+    than the sessions and permissions that are read on every request.
+    """
+
+    PROTECTED_FRACTION = 0.8
+
+    probation: dict[str, int]
+    protected: dict[str, int]
+    protected_bytes: int
+
+    def __init__(self, width: int, max_cache_size_bytes: int):
+        self.sketch = CountMinSketch(width)
+        self.max_protected_bytes = int(max_cache_size_bytes * self.PROTECTED_FRACTION)
+        self.probation = {}
+        self.protected = {}
+        self.protected_bytes = 0
+
+    def record_access(self, key: str):
+        self.sketch.increment(key)
+
+    def on_insert(self, key: str, size: int):
+        self.probation[key] = size
+
+    def on_update(self, key: str, size: int):
+        if key in self.protected:
+            self.protected_bytes += size - self.protected.pop(key)
+            self.protected[key] = size
+            self._shrink_protected()
+        else:
+            self.probation.pop(key, None)
+            self.probation[key] = size
+
+    def on_hit(self, key: str):
+        if key in self.protected:
+            self.protected[key] = self.protected.pop(key)
+        elif key in self.probation:
+            size = self.probation.pop(key)
+            self.protected[key] = size
+            self.protected_bytes += size
+            self._shrink_protected()
+
+    def on_remove(self, key: str):
+        if key in self.protected:
+            self.protected_bytes -= self.protected.pop(key)
+        else:
+            self.probation.pop(key, None)
+
+    def _shrink_protected(self):
+        while self.protected_bytes > self.max_protected_bytes:
+            oldest = next(iter(self.protected))
+            size = self.protected.pop(oldest)
+            self.protected_bytes -= size
+            self.probation[oldest] = size
+
+    def victim(self, exclude: str) -> str | None:
+        # the candidate is always the newest key on probation, so this only ever looks at one or two keys
+        for segment in (self.probation, self.protected):
+            for key in segment:
+                if key != exclude:
+                    return key
+        return None
+
+    def admit(self, candidate: str, victim: str) -> bool:
+        return self.sketch.estimate(candidate) > self.sketch.estimate(victim)
+
+    def clear(self):
+        # access history is still useful after the entries themselves are gone, so the sketch is kept
+        self.probation.clear()
+        self.protected.clear()
+        self.protected_bytes = 0
+
+
+def policy_from_config(name: str, max_cache_size_bytes: int) -> CachePolicy:
+    if name == 'lru':
+        return LruPolicy()
+    if name == 'tinylfu':
+        # assume entries are a few hundred bytes on average, which is plenty of counters for the keys that fit
+        return TinyLfuPolicy(max(1024, max_cache_size_bytes // 256), max_cache_size_bytes)
+    raise InvalidConfigValue('cache_policy', name, 'one of lru, tinylfu')
+
+
 class L1Cache:
     """
     ### In-memory cache for quick retrievals from RAM.
@@ -29,20 +212,41 @@ class L1Cache:
     oldest_entry: Entry | None
     memory_cache: dict[str, Any]
     entry_map: dict[str, Entry]
+    tag_map: dict[str, set[str]]
+    namespace_map: dict[str, dict[str, None]]  # keys of each namespace, from least to most recently used
+    namespace_size_bytes: dict[str, int]
+    namespace_budgets: dict[str, int]
     max_cache_size_bytes: int
     current_size_bytes: int
+    sizer: Sizer
+    policy: CachePolicy
+    default_ttl: float | None
+    expiry_heap: list[tuple[float, str]]
+    on_evict: Callable[[str, Any, frozenset[str], float | None], None] | None
+    stats: CacheStats
 
     def _getsize(self, value: Any) -> int:
-        return objsize.get_deep_size(value)
+        return self.sizer.size(value)
 
     def __init__(self):
         self.memory_cache = {}
         self.entry_map = {}
+        self.tag_map = {}
+        self.namespace_map = {}
+        self.namespace_size_bytes = {}
         self.oldest_entry = None
         self.newest_entry = None
         self.current_size_bytes = 0
+        self.expiry_heap = []
+        self.on_evict = None
+        self.stats = CacheStats()
 
-        self.max_cache_size_bytes = GLOBAL_CONFIGURATION.get('cache_size', 1 * 1024 * 1024)
+        self.max_cache_size_bytes = int(GLOBAL_CONFIGURATION.get('cache_size', 1 * 1024 * 1024))
+        self.namespace_budgets = namespace_budgets_from_config(GLOBAL_CONFIGURATION.get('cache_namespace_budgets', ''))
+        self.sizer = sizer_from_config(GLOBAL_CONFIGURATION.get('cache_sizer', 'sampled'))
+        self.policy = policy_from_config(GLOBAL_CONFIGURATION.get('cache_policy', 'tinylfu'), self.max_cache_size_bytes)
+        default_ttl = GLOBAL_CONFIGURATION.get('cache_default_ttl')
+        self.default_ttl = float(default_ttl) if default_ttl else None
 
     def _remove_entry(self, entry: Entry):
         previous = entry.prev
@@ -61,78 +265,265 @@ class L1Cache:
         entry.prev = None
         entry.next = None
 
-    def event(self, event: type[BaseEvent]):
-        to_expire = []
-        for key, entry in self.entry_map.items():
-            if entry.expire_event == event:
-                to_expire.append(key)
+    def _append_entry(self, entry: Entry):
+        if self.oldest_entry is None or self.newest_entry is None:
+            # if this is the first entry, set it as both oldest and newest
+            self.oldest_entry = entry
+            self.newest_entry = self.oldest_entry
+        else:
+            # otherwise, update it to the newest entry
+            entry.prev = self.newest_entry
+            self.newest_entry.next = entry
+            self.newest_entry = entry
+
+    def _index_entry(self, entry: Entry):
+        for tag in entry.tags:
+            self.tag_map.setdefault(tag, set()).add(entry.key)
+
+        namespace = namespace_of(entry.key)
+        if namespace is not None:
+            self.namespace_map.setdefault(namespace, {})[entry.key] = None
+            self.namespace_size_bytes[namespace] = self.namespace_size_bytes.get(namespace, 0) + entry.size
+        self.current_size_bytes += entry.size
 
-        for key in to_expire:
-            logger.debug(f'Expiring key {key} due to event {event}')
+    def _unindex_entry(self, entry: Entry):
+        for tag in entry.tags:
+            keys = self.tag_map.get(tag)
+            if keys is not None:
+                keys.discard(entry.key)
+                if not keys:
+                    del self.tag_map[tag]
+
+        namespace = namespace_of(entry.key)
+        if namespace is not None:
+            keys = self.namespace_map.get(namespace)
+            if keys is not None:
+                keys.pop(entry.key, None)
+                self.namespace_size_bytes[namespace] -= entry.size
+                if not keys:
+                    del self.namespace_map[namespace]
+                    del self.namespace_size_bytes[namespace]
+        self.current_size_bytes -= entry.size
+
+    def _evict(self, entry: Entry, popped_items: list[Any]):
+        value = self.memory_cache[entry.key]
+        popped_items.append(value)
+        self.stats.of(entry.key).evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(entry.key, value, entry.tags, entry.expires_at)
+        self.expire(entry.key)
+
+    def _victim(self, candidate: str) -> str:
+        victim = self.policy.victim(candidate)
+        if victim is None:
+            assert self.oldest_entry is not None
+            victim = self.oldest_entry.key
+        return victim
+
+    def _purge_expired(self):
+        now = time.time()
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self.expiry_heap)
+            entry = self.entry_map.get(key)
+            # the key may have been re-inserted with a different ttl since
+            if entry is not None and entry.expires_at == expires_at:
+                logger.debug(f'Expiring key {key} due to ttl')
+                self.stats.of(key).expirations += 1
+                self.expire(key)
+
+        if len(self.expiry_heap) > 2 * len(self.entry_map) + 64:
+            self.expiry_heap = [
+                (entry.expires_at, entry.key) for entry in self.entry_map.values() if entry.expires_at is not None
+            ]
+            heapq.heapify(self.expiry_heap)
+
+    def invalidate(self, *tags: Tag) -> int:
+        invalidated = 0
+        for tag in map(encode_tag, tags):
+            for key in self.tag_map.get(tag, set()).copy():
+                logger.debug(f'Expiring key {key} due to tag {tag}')
+                self.stats.of(key).invalidations += 1
+                self.expire(key)
+                invalidated += 1
+        return invalidated
+
+    def invalidate_namespace(self, namespace: str) -> int:
+        keys = list(self.namespace_map.get(namespace, {}))
+        for key in keys:
+            logger.debug(f'Expiring key {key} due to namespace {namespace}')
             self.expire(key)
+        self.stats.of_namespace(namespace).invalidations += len(keys)
+        return len(keys)
+
+    def event(self, event: type[BaseEvent]) -> int:
+        invalidated = self.invalidate(*event_tags(event))
+        self.stats.record_event(event.__name__, invalidated)
+        return invalidated
 
     def expire(self, key: str):
         if key in self.entry_map:
-            item = self.entry_map[key]
-            self.current_size_bytes -= self._getsize(item.key)
             del self.memory_cache[key]
 
             entry = self.entry_map.pop(key)
             self._remove_entry(entry)
+            self._unindex_entry(entry)
+            self.policy.on_remove(key)
+
+    def insert(
+        self,
+        key: str,
+        value: Any,
+        expire_event: type[BaseEvent] | None,
+        tags: Iterable[Tag] = (),
+        size: int | None = None,
+        ttl: float | None = None,
+        expires_at: float | None = None,
+    ) -> list[Any]:
+        """
+        ### Insert a value into the cache
+
+        Evicts the least recently used entries until the cache, and the namespace of `key`, are back under budget. A
+        new key is only admitted if the cache policy prefers it over the first entry it would evict.
+
+        **Args:**
+        - `key` (`str`): The key to store the value under. Anything before the first `:` is the key's namespace.
+        - `value` (`Any`): The value to store.
+        - `expire_event` (`type[BaseEvent] | None`): An event which expires the entry when published.
+        - `tags` (`Iterable[Tag]`): Further events or strings which expire the entry.
+        - `size` (`int | None`): The size of the value in bytes, if the caller already knows it. Measured otherwise.
+        - `ttl` (`float | None`): Seconds until the entry expires. Defaults to the `cache_default_ttl` config.
+        - `expires_at` (`float | None`): Unix time the entry expires at, used instead of `ttl` if given.
+
+        **Returns:**
+        - `list[Any]`: Every value evicted to make room, or `[value]` if the value was not admitted.
+        """
+        self._purge_expired()
+
+        if expires_at is None:
+            ttl = ttl if ttl is not None else self.default_ttl
+            expires_at = time.time() + ttl if ttl is not None else None
+
+        entry_size = size if size is not None else self._getsize(value)
+        namespace = namespace_of(key)
+        budget = self.namespace_budgets.get(namespace) if namespace is not None else None
 
-    def insert(self, key: str, value: Any, expire_event: type[BaseEvent] | None) -> list[Any]:
         # we dont want to blow the cache up if we try to cache something too big
-        entry_size = self._getsize(value)
-        if entry_size > self.max_cache_size_bytes:
+        if entry_size > self.max_cache_size_bytes or (budget is not None and entry_size > budget):
+            # the previous value is stale now, so it cant stay around either
+            self.stats.of(key).rejections += 1
+            self.expire(key)
             return [value]
 
-        self.memory_cache[key] = value
-
         if key in self.entry_map:
-            # if entry already exists, remove it from the linked list so we can append
+            # if entry already exists, remove it so it can be accounted for and appended again
             entry = self.entry_map[key]
             self._remove_entry(entry)
+            self._unindex_entry(entry)
+            entry.tags = make_tags(expire_event, tags)
+            entry.size = entry_size
+            entry.expires_at = expires_at
+            self.policy.on_update(key, entry_size)
+            is_new = False
         else:
-            # if new entry, make sure its logged
-            entry = Entry(key, expire_event=expire_event)
+            entry = Entry(key, make_tags(expire_event, tags), entry_size, expires_at)
             self.entry_map[key] = entry
-            self.current_size_bytes += entry_size
+            self.policy.on_insert(key, entry_size)
+            is_new = True
 
-        if self.oldest_entry is None or self.newest_entry is None:
-            # if this is the first entry, set it as both oldest and newest
-            self.oldest_entry = entry
-            self.newest_entry = self.oldest_entry
-        else:
-            # otherwise, update it to the newest entry
-            entry.prev = self.newest_entry
-            self.newest_entry.next = entry
-            self.newest_entry = entry
+        self.memory_cache[key] = value
+        self._append_entry(entry)
+        self._index_entry(entry)
+        if expires_at is not None:
+            heapq.heappush(self.expiry_heap, (expires_at, key))
+
+        if is_new:
+            victim = None
+            if budget is not None and self.namespace_size_bytes[namespace] > budget:
+                victim = next(iter(self.namespace_map[namespace]))
+            elif self.current_size_bytes > self.max_cache_size_bytes:
+                victim = self._victim(key)
 
+            if victim is not None and not self.policy.admit(key, victim):
+                logger.debug(f"Not admitting '{key}' over '{victim}'")
+                self.stats.of(key).rejections += 1
+                self.expire(key)
+                return [value]
+
+        self.stats.of(key).inserts += 1
         popped_items = []
+        if budget is not None:
+            assert namespace is not None
+            # a busy namespace can only push out its own entries once over budget
+            while self.namespace_size_bytes[namespace] > budget:
+                oldest_key = next(iter(self.namespace_map[namespace]))
+                self._evict(self.entry_map[oldest_key], popped_items)
+
         while self.current_size_bytes > self.max_cache_size_bytes:
-            popped_items.append(self.memory_cache[self.oldest_entry.key])
-            self.expire(self.oldest_entry.key)
+            self._evict(self.entry_map[self._victim(key)], popped_items)
         return popped_items
 
-    def get(self, key: str) -> Any | None:
+    def get(self, key: str, default: Any = None) -> Any | None:
+        self.policy.record_access(key)
+        counters = self.stats.of(key)
         if key in self.memory_cache:
             entry = self.entry_map[key]
+            if entry.expires_at is not None and entry.expires_at <= time.time():
+                counters.expirations += 1
+                counters.misses += 1
+                self.expire(key)
+                return default
 
-            self._remove_entry(entry)
-            assert self.newest_entry is not None
-            entry.prev = self.newest_entry
-            self.newest_entry.next = entry
-            self.newest_entry = entry
+            if entry is not self.newest_entry:
+                self._remove_entry(entry)
+                self._append_entry(entry)
+            self.policy.on_hit(key)
+
+            namespace = namespace_of(key)
+            if namespace is not None:
+                keys = self.namespace_map[namespace]
+                del keys[key]
+                keys[key] = None
 
+            counters.hits += 1
             return self.memory_cache[key]
-        return None
+        counters.misses += 1
+        return default
 
     def contains(self, key: str) -> bool:
-        return key in self.memory_cache
+        entry = self.entry_map.get(key)
+        if entry is None:
+            return False
+        if entry.expires_at is not None and entry.expires_at <= time.time():
+            self.stats.of(key).expirations += 1
+            self.expire(key)
+            return False
+        return True
+
+    def report(self, largest: int = 10) -> dict[str, Any]:
+        usage = {namespace: (size, len(self.namespace_map[namespace])) for namespace, size in self.namespace_size_bytes.items()}
+        unnamespaced_entries = len(self.entry_map) - sum(entries for _, entries in usage.values())
+        if unnamespaced_entries:
+            unnamespaced_size = self.current_size_bytes - sum(size for size, _ in usage.values())
+            usage[NO_NAMESPACE] = (unnamespaced_size, unnamespaced_entries)
+
+        largest_entries = heapq.nlargest(
+            largest, ((entry.key, entry.size) for entry in self.entry_map.values()), key=lambda item: item[1]
+        )
+        return {
+            'size_bytes': self.current_size_bytes,
+            'max_size_bytes': self.max_cache_size_bytes,
+            'entries': len(self.entry_map),
+            'namespace_budgets': dict(self.namespace_budgets),
+        } | self.stats.report(usage, largest_entries)
 
     def clear(self):
         self.memory_cache.clear()
         self.entry_map.clear()
+        self.tag_map.clear()
+        self.namespace_map.clear()
+        self.namespace_size_bytes.clear()
+        self.expiry_heap.clear()
+        self.policy.clear()
         self.oldest_entry = None
         self.newest_entry = None
         self.current_size_bytes = 0
@@ -0,0 +1,404 @@
+import os
+import pickle
+import sqlite3
+import logging
+import time
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+from bw.web_event import BaseEvent
+from bw.cache.files import check_private_file
+from bw.cache.stats import CacheStats, NO_NAMESPACE
+from bw.cache.tags import Tag, encode_tag, event_tags, namespace_of
+
+logger = logging.getLogger('bw.cache')
+
+# how many invalidations are kept around for lagging workers before they are forced to drop their whole L1 cache
+INVALIDATION_LOG_LENGTH = 4096
+
+
+class Invalidation:
+    KEY = 'key'
+    TAG = 'tag'
+    NAMESPACE = 'namespace'
+    CLEAR = 'clear'
+
+
+class L2Cache:
+    """
+    ### Host-wide cache shared between every worker process
+
+    Backed by a single SQLite file that every worker maps into memory. Whatever one worker demotes out of its
+    `L1Cache` can be promoted by any other worker.
+
+    Every invalidation is also appended to a log so that workers can drop stale copies held in their own `L1Cache`.
+
+    Entries are unpickled, so the file is only opened if no other user could have written to it.
+    """
+
+    path: Path
+    max_cache_size_bytes: int
+    stats: CacheStats
+
+    _connection: sqlite3.Connection | None
+    _connection_pid: int | None
+    _data_version: int
+    _last_seen: int
+
+    def __init__(self, path: Path, max_cache_size_bytes: int):
+        self.path = path
+        self.max_cache_size_bytes = max_cache_size_bytes
+        self.stats = CacheStats()
+        self._connection = None
+        self._connection_pid = None
+        self._data_version = 0
+        self._last_seen = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite connections cannot survive a fork, so every process opens its own
+        if self._connection is not None and self._connection_pid == os.getpid():
+            return self._connection
+
+        check_private_file(self.path)
+        connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=OFF')
+        connection.execute(f'PRAGMA mmap_size={2 * self.max_cache_size_bytes}')
+        connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                namespace TEXT,
+                size INTEGER NOT NULL,
+                inserted REAL NOT NULL,
+                expires_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS entries_inserted ON entries(inserted);
+            CREATE INDEX IF NOT EXISTS entries_expires_at ON entries(expires_at) WHERE expires_at IS NOT NULL;
+            CREATE INDEX IF NOT EXISTS entries_namespace ON entries(namespace);
+
+            CREATE TABLE IF NOT EXISTS entry_tags (
+                tag TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (tag, key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS entry_tags_key ON entry_tags(key);
+
+            CREATE TABLE IF NOT EXISTS invalidations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                target TEXT,
+                origin INTEGER NOT NULL
+            );
+
+            -- tells snapshots written against an earlier file, whose log positions mean nothing here, apart
+            CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), generation TEXT NOT NULL);
+            INSERT OR IGNORE INTO meta (id, generation) VALUES (0, lower(hex(randomblob(16))));
+
+            CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), size_bytes INTEGER NOT NULL);
+            INSERT OR IGNORE INTO usage (id, size_bytes) VALUES (0, 0);
+
+            CREATE TRIGGER IF NOT EXISTS entries_usage_insert AFTER INSERT ON entries BEGIN
+                UPDATE usage SET size_bytes = size_bytes + new.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_usage_update AFTER UPDATE OF size ON entries BEGIN
+                UPDATE usage SET size_bytes = size_bytes + new.size - old.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_usage_delete AFTER DELETE ON entries BEGIN
+                UPDATE usage SET size_bytes = size_bytes - old.size WHERE id = 0;
+                DELETE FROM entry_tags WHERE key = old.key;
+            END;
+            """
+        )
+
+        # a freshly opened connection has nothing stale in front of it, so only later invalidations matter
+        self._data_version = connection.execute('PRAGMA data_version').fetchone()[0]
+        self._last_seen = self._last_invalidation(connection)
+
+        self._connection = connection
+        self._connection_pid = os.getpid()
+        return connection
+
+    def _log(self, connection: sqlite3.Connection, kind: str, targets: Iterable[str | None]):
+        rows = [(kind, target, os.getpid()) for target in targets]
+        connection.executemany('INSERT INTO invalidations (kind, target, origin) VALUES (?, ?, ?)', rows)
+
+        # trim the log every so often rather than on every write
+        last_id = self._last_invalidation(connection)
+        if last_id % 256 < len(rows):
+            connection.execute('DELETE FROM invalidations WHERE id <= ?', (last_id - INVALIDATION_LOG_LENGTH,))
+
+    def _last_invalidation(self, connection: sqlite3.Connection) -> int:
+        row = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'invalidations'").fetchone()
+        if row is None:
+            return 0
+        return row[0]
+
+    def log_position(self) -> tuple[str, int]:
+        """
+        ### Where this worker has read the invalidation log up to
+
+        **Returns:**
+        - `tuple[str, int]`: The generation of the cache file, and the id of the last invalidation this worker has seen.
+        """
+        connection = self._connect()
+        generation = connection.execute('SELECT generation FROM meta WHERE id = 0').fetchone()[0]
+        return generation, self._last_seen
+
+    def invalidations_since(self, generation: str, position: int) -> list[tuple[str, str | None]] | None:
+        """
+        ### Fetch every invalidation logged after a position in the log
+
+        Unlike `poll`, invalidations made by this worker are included, and the worker's own place in the log is left
+        alone.
+
+        **Args:**
+        - `generation` (`str`): The generation of the cache file `position` was read from. If the file has been
+          replaced since, the whole of the current log is returned.
+        - `position` (`int`): The id of the last invalidation already accounted for.
+
+        **Returns:**
+        - `list[tuple[str, str | None]] | None`: `(kind, target)` for every later invalidation, oldest first, or `None`
+          if the log has been trimmed past `position` and some of them are lost.
+        """
+        connection = self._connect()
+        if generation != connection.execute('SELECT generation FROM meta WHERE id = 0').fetchone()[0]:
+            position = 0
+
+        oldest = connection.execute('SELECT MIN(id) FROM invalidations').fetchone()[0]
+        if oldest is not None and oldest > position + 1:
+            return None
+        if oldest is None and self._last_invalidation(connection) > position:
+            return None
+        return connection.execute('SELECT kind, target FROM invalidations WHERE id > ? ORDER BY id', (position,)).fetchall()
+
+    @property
+    def current_size_bytes(self) -> int:
+        return self._connect().execute('SELECT size_bytes FROM usage WHERE id = 0').fetchone()[0]
+
+    def invalidate(self, *tags: Tag) -> int:
+        encoded = [encode_tag(tag) for tag in tags]
+        if not encoded:
+            return 0
+
+        connection = self._connect()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            invalidated = connection.execute(
+                f'DELETE FROM entries WHERE key IN (SELECT key FROM entry_tags WHERE tag IN ({", ".join("?" * len(encoded))}))'
+                ' RETURNING namespace',
+                encoded,
+            ).fetchall()
+            self._log(connection, Invalidation.TAG, encoded)
+
+        for (namespace,) in invalidated:
+            self.stats.of_namespace(namespace).invalidations += 1
+        return len(invalidated)
+
+    def invalidate_namespace(self, namespace: str) -> int:
+        connection = self._connect()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            invalidated = connection.execute('DELETE FROM entries WHERE namespace = ?', (namespace,)).rowcount
+            self._log(connection, Invalidation.NAMESPACE, [namespace])
+
+        self.stats.of_namespace(namespace).invalidations += invalidated
+        return invalidated
+
+    def event(self, event: type[BaseEvent]) -> int:
+        invalidated = self.invalidate(*event_tags(event))
+        self.stats.record_event(event.__name__, invalidated)
+        return invalidated
+
+    def expire(self, key: str):
+        connection = self._connect()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._log(connection, Invalidation.KEY, [key])
+
+    def insert(self, key: str, value: Any, tags: Iterable[str], notify: bool = False, expires_at: float | None = None) -> bool:
+        """
+        ### Store a value in the shared cache
+
+        Stores `value` under `key`, evicting the oldest entries if the cache grows past its size limit. Values which
+        cannot be pickled or are larger than the whole cache are skipped.
+
+        **Args:**
+        - `key` (`str`): The key to store the value under.
+        - `value` (`Any`): The value to store.
+        - `tags` (`Iterable[str]`): Encoded tags which expire the entry.
+        - `notify` (`bool`): Whether other workers should drop their own copy of `key`. Set when the value changed,
+          rather than when a worker is only demoting its copy.
+        - `expires_at` (`float | None`): Unix time the entry expires at, if it should expire.
+
+        **Returns:**
+        - `bool`: `True` if the value was stored.
+        """
+        tags = frozenset(tags)
+        try:
+            blob = pickle.dumps((value, tags), protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.debug(f"Cannot store '{key}' in L2 cache: {e}")
+            self.stats.of(key).rejections += 1
+            return False
+
+        # we dont want to blow the cache up if we try to cache something too big
+        if len(blob) > self.max_cache_size_bytes:
+            self.stats.of(key).rejections += 1
+            return False
+
+        now = time.time()
+        connection = self._connect()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                """
+                INSERT INTO entries (key, value, namespace, size, inserted, expires_at) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value,
+                    size = excluded.size,
+                    inserted = excluded.inserted,
+                    expires_at = excluded.expires_at
+                """,
+                (key, blob, namespace_of(key), len(blob), now, expires_at),
+            )
+            connection.execute('DELETE FROM entry_tags WHERE key = ?', (key,))
+            connection.executemany('INSERT INTO entry_tags (tag, key) VALUES (?, ?)', [(tag, key) for tag in tags])
+            if notify:
+                self._log(connection, Invalidation.KEY, [key])
+
+            # entries are promoted into L1 on a hit and demoted again on eviction, so insertion order approximates LRU
+            overflow = connection.execute('SELECT size_bytes FROM usage WHERE id = 0').fetchone()[0] - self.max_cache_size_bytes
+            if overflow > 0:
+                # anything already expired is the cheapest thing to give up
+                expired = connection.execute('DELETE FROM entries WHERE expires_at <= ? RETURNING namespace', (now,)).fetchall()
+                for (namespace,) in expired:
+                    self.stats.of_namespace(namespace).expirations += 1
+                overflow = (
+                    connection.execute('SELECT size_bytes FROM usage WHERE id = 0').fetchone()[0] - self.max_cache_size_bytes
+                )
+            while overflow > 0:
+                oldest = connection.execute('SELECT key, size FROM entries ORDER BY inserted LIMIT 64').fetchall()
+                if not oldest:
+                    break
+                evicted = []
+                for oldest_key, size in oldest:
+                    evicted.append(oldest_key)
+                    overflow -= size
+                    if overflow <= 0:
+                        break
+                connection.executemany('DELETE FROM entries WHERE key = ?', [(evicted_key,) for evicted_key in evicted])
+                for evicted_key in evicted:
+                    self.stats.of(evicted_key).evictions += 1
+
+        self.stats.of(key).inserts += 1
+        return True
+
+    def get(self, key: str) -> tuple[Any, frozenset[str], float | None] | None:
+        row = (
+            self._connect()
+            .execute(
+                'SELECT value, expires_at FROM entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        if row is None:
+            self.stats.of(key).misses += 1
+            return None
+
+        try:
+            value, tags = pickle.loads(row[0])
+        except Exception as e:
+            logger.warning(f"Discarding unreadable L2 cache entry '{key}': {e}")
+            self._connect().execute('DELETE FROM entries WHERE key = ?', (key,))
+            self.stats.of(key).misses += 1
+            return None
+
+        self.stats.of(key).hits += 1
+        return value, tags, row[1]
+
+    def contains(self, key: str) -> bool:
+        row = (
+            self._connect()
+            .execute('SELECT 1 FROM entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)', (key, time.time()))
+            .fetchone()
+        )
+        return row is not None
+
+    def entries(self) -> Iterator[tuple[str, bytes, frozenset[str], float | None]]:
+        # everything still live, as the key, pickled `(value, tags)`, encoded tags and expiry
+        rows = self._connect().execute(
+            """
+            SELECT key, value, expires_at, (SELECT group_concat(tag, char(0)) FROM entry_tags WHERE entry_tags.key = entries.key)
+            FROM entries WHERE expires_at IS NULL OR expires_at > ?
+            """,
+            (time.time(),),
+        )
+        for key, blob, expires_at, tags in rows:
+            yield key, blob, frozenset(tags.split('\0')) if tags else frozenset(), expires_at
+
+    def poll(self) -> list[tuple[str, str | None]] | None:
+        """
+        ### Fetch invalidations made by other workers
+
+        Only a pragma read when no other worker has written to the cache since the last poll, so this is cheap
+        enough to run before every lookup.
+
+        **Returns:**
+        - `list[tuple[str, str | None]] | None`: `(kind, target)` for every invalidation made by another worker since
+          the last poll, or `None` if the log was trimmed before this worker caught up and nothing it holds can be trusted.
+        """
+        connection = self._connect()
+        data_version = connection.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            return []
+        self._data_version = data_version
+
+        oldest = connection.execute('SELECT MIN(id) FROM invalidations').fetchone()[0]
+        if oldest is not None and oldest > self._last_seen + 1:
+            self._last_seen = self._last_invalidation(connection)
+            return None
+
+        rows = connection.execute(
+            'SELECT id, kind, target, origin FROM invalidations WHERE id > ? ORDER BY id', (self._last_seen,)
+        ).fetchall()
+        if rows:
+            self._last_seen = rows[-1][0]
+        return [(kind, target) for _, kind, target, origin in rows if origin != os.getpid()]
+
+    def report(self, largest: int = 10) -> dict[str, Any]:
+        connection = self._connect()
+        usage = {
+            namespace or NO_NAMESPACE: (size, entries)
+            for namespace, size, entries in connection.execute(
+                'SELECT namespace, SUM(size), COUNT(*) FROM entries GROUP BY namespace'
+            ).fetchall()
+        }
+        largest_entries = connection.execute('SELECT key, size FROM entries ORDER BY size DESC LIMIT ?', (largest,)).fetchall()
+        return {
+            'size_bytes': self.current_size_bytes,
+            'max_size_bytes': self.max_cache_size_bytes,
+            'entries': sum(entries for _, entries in usage.values()),
+        } | self.stats.report(usage, largest_entries)
+
+    def clear(self):
+        connection = self._connect()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM entries')
+            self._log(connection, Invalidation.CLEAR, [None])
+
+    def close(self):
+        if self._connection is not None and self._connection_pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+        self._connection_pid = None
+
+    def destroy(self):
+        # entries pickled by a previous deploy may reference classes that no longer exist
+        self.close()
+        for suffix in ('', '-wal', '-shm'):
+            Path(f'{self.path}{suffix}').unlink(missing_ok=True)
@@ -0,0 +1,103 @@
+import sys
+import pickle
+import itertools
+import objsize
+from typing import Any
+from bw.error import InvalidConfigValue
+
+
+class Sizer:
+    """
+    ### Estimates how many bytes a cached value holds
+    """
+
+    def size(self, value: Any) -> int:
+        raise NotImplementedError()
+
+
+class DeepSizer(Sizer):
+    """
+    ### Exact size, found by walking every object the value references
+
+    Accurate, but costs time proportional to the size of the value.
+    """
+
+    def size(self, value: Any) -> int:
+        return objsize.get_deep_size(value)
+
+
+class SampledSizer(Sizer):
+    """
+    ### Estimated size of large containers from a sample of their items
+
+    Lists, tuples, sets and dicts with more than `sample_size` items are sized by deep sizing the first `sample_size`
+    items and assuming the rest are similar. Anything else is sized exactly.
+    """
+
+    def __init__(self, sample_size: int = 16):
+        self.sample_size = sample_size
+
+    def size(self, value: Any) -> int:
+        if not isinstance(value, dict | list | tuple | set | frozenset) or len(value) <= self.sample_size:
+            return objsize.get_deep_size(value)
+
+        # size the sample the same way the whole value would be sized, minus the container holding it
+        if isinstance(value, dict):
+            sample = dict(itertools.islice(value.items(), self.sample_size))
+        else:
+            sample = list(itertools.islice(value, self.sample_size))
+        sample_size = objsize.get_deep_size(sample) - sys.getsizeof(sample)
+        return sys.getsizeof(value) + (sample_size * len(value)) // self.sample_size
+
+
+class PickleSizer(Sizer):
+    """
+    ### Size of the value once serialized
+
+    Tracks what the value costs to store in the L2 cache rather than in RAM. Values which cannot be pickled are sized
+    exactly instead.
+    """
+
+    def size(self, value: Any) -> int:
+        try:
+            return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return objsize.get_deep_size(value)
+
+
+SIZERS: dict[str, type[Sizer]] = {
+    'deep': DeepSizer,
+    'sampled': SampledSizer,
+    'pickle': PickleSizer,
+}
+
+
+def sizer_from_config(name: str) -> Sizer:
+    if name not in SIZERS:
+        raise InvalidConfigValue('cache_sizer', name, f'one of {", ".join(SIZERS)}')
+    return SIZERS[name]()
+
+
+def namespace_budgets_from_config(budgets: str) -> dict[str, int]:
+    """
+    ### Parse per-namespace byte budgets
+
+    **Args:**
+    - `budgets` (`str`): Comma separated `namespace:bytes` pairs, e.g. `mission:65536,auth:32768`.
+
+    **Returns:**
+    - `dict[str, int]`: The byte budget for each namespace.
+
+    **Raises:**
+    - `InvalidConfigValue`: If a pair is malformed.
+    """
+    parsed = {}
+    for budget in budgets.split(','):
+        if not budget.strip():
+            continue
+        namespace, _, size = budget.partition(':')
+        try:
+            parsed[namespace.strip()] = int(size)
+        except ValueError:
+            raise InvalidConfigValue('cache_namespace_budgets', budgets, 'comma separated namespace:bytes pairs')
+    return parsed
@@ -0,0 +1,320 @@
+import functools
+import logging
+import math
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+from alembic.script import ScriptDirectory
+from bw.error import InsecureCachePath
+from bw.cache.files import check_private_file
+from bw.cache.l2 import Invalidation, L2Cache
+from bw.cache.tags import Tag, encode_tag, namespace_of
+
+logger = logging.getLogger('bw.cache')
+
+MAGIC = b'BWCS'
+FORMAT_VERSION = 2
+
+# magic, format version, unix time written, revision length, entry count, offset of the first value, generation of the
+# L2 cache file and id of the last invalidation already applied to the entries (-1 if written without an L2 cache)
+HEADER = struct.Struct('<4sHdIIQ32sq')
+# key length, tags length, value offset, value length, expiry (NaN if the entry never expires)
+INDEX_ENTRY = struct.Struct('<HIQId')
+
+ALEMBIC_DIRECTORY = Path(__file__).parents[2] / 'alembic'
+
+
+@functools.cache
+def schema_revision() -> str | None:
+    """
+    ### The alembic head revision this code was written against
+
+    Cached values are only as good as the models they were read into, so a snapshot is only loaded by code which
+    expects the same schema as the code that wrote it.
+
+    **Returns:**
+    - `str | None`: Every head revision joined by `,`, or `None` if the migrations cannot be found.
+    """
+    try:
+        heads = ScriptDirectory(str(ALEMBIC_DIRECTORY)).get_heads()
+    except Exception as e:
+        logger.warning(f'Cannot determine schema revision, cache snapshots are disabled: {e}')
+        return None
+    return ','.join(sorted(heads))
+
+
+def write_snapshot(
+    path: Path,
+    revision: str,
+    entries: Iterable[tuple[str, bytes, frozenset[str], float | None]],
+    log_position: tuple[str, int] | None = None,
+) -> int:
+    """
+    ### Write cache entries to a snapshot file
+
+    The file is written beside `path` and moved into place, so a reader never sees half a snapshot. Snapshots are
+    unpickled when loaded, so they are only written where no other user could have planted or replaced one.
+
+    **Args:**
+    - `path` (`Path`): Where to write the snapshot.
+    - `revision` (`str`): The schema revision the entries were read under.
+    - `entries` (`Iterable[tuple[str, bytes, frozenset[str], float | None]]`): The key, pickled `(value, tags)`,
+      encoded tags and expiry of every entry.
+    - `log_position` (`tuple[str, int] | None`): How far through the L2 invalidation log the entries are up to date,
+      so whoever loads the snapshot can replay every invalidation logged since.
+
+    **Returns:**
+    - `int`: The number of entries written.
+
+    **Raises:**
+    - `InsecureCachePath`: If another user could write to the snapshot's directory.
+    """
+    check_private_file(path)
+
+    index = []
+    values = []
+    offset = 0
+    for key, blob, tags, expires_at in entries:
+        encoded_key = key.encode()
+        if len(encoded_key) > 0xFFFF:
+            continue
+        encoded_tags = '\0'.join(tags).encode()
+        expiry = expires_at if expires_at is not None else math.nan
+        index.append(
+            INDEX_ENTRY.pack(len(encoded_key), len(encoded_tags), offset, len(blob), expiry) + encoded_key + encoded_tags
+        )
+        values.append(blob)
+        offset += len(blob)
+
+    encoded_revision = revision.encode()
+    index_size = sum(len(entry) for entry in index)
+    values_offset = HEADER.size + len(encoded_revision) + index_size
+    generation, position = log_position if log_position is not None else ('', -1)
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, time.time(), len(encoded_revision), len(index), values_offset, generation.encode(), position
+    )
+
+    # a fresh file of our own, rather than one at a predictable name which could already be a symlink
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(header)
+            file.write(encoded_revision)
+            file.writelines(index)
+            file.writelines(values)
+        os.replace(temporary, path)
+    except BaseException:
+        Path(temporary).unlink(missing_ok=True)
+        raise
+    return len(index)
+
+
+class Snapshot:
+    """
+    ### Read-only cache tier loaded from a snapshot left by the previous run
+
+    Nothing is read until the first lookup, and values are only unpickled when asked for. The file is memory mapped,
+    so every worker on the host shares the same pages.
+
+    Entries are handed out at most once, as they are promoted into the worker's own cache, and invalidations drop
+    entries just as they would from any other tier. Invalidations logged to the L2 cache after the snapshot was written,
+    by any worker, are replayed when it is loaded, so nothing another worker has invalidated is ever handed out.
+    """
+
+    path: Path
+    max_age: float
+    invalidation_log: L2Cache | None
+
+    _mmap: mmap.mmap | None
+    _entries: dict[str, tuple[int, int, frozenset[str], float | None]] | None
+    _tag_map: dict[str, set[str]]
+    _log_position: tuple[str, int] | None
+
+    def __init__(self, path: Path, max_age: float, invalidation_log: L2Cache | None = None):
+        self.path = path
+        self.max_age = max_age
+        self.invalidation_log = invalidation_log
+        self._log_position = None
+        self._mmap = None
+        self._entries = None
+        self._tag_map = {}
+
+    def _load(self) -> dict[str, tuple[int, int, frozenset[str], float | None]]:
+        if self._entries is not None:
+            return self._entries
+        self._entries = {}
+
+        revision = schema_revision()
+        if revision is None:
+            return self._entries
+
+        try:
+            check_private_file(self.path)
+            descriptor = os.open(self.path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+            with open(descriptor, 'rb') as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except InsecureCachePath as e:
+            logger.warning(str(e))
+            return self._entries
+        except (FileNotFoundError, ValueError):
+            # missing or empty, there is nothing to warm up from
+            return self._entries
+        except OSError as e:
+            logger.warning(f'Cannot open cache snapshot {self.path}: {e}')
+            return self._entries
+
+        try:
+            entries = self._read(mapped, revision)
+        except (struct.error, UnicodeDecodeError) as e:
+            logger.warning(f'Discarding corrupt cache snapshot {self.path}: {e}')
+            entries = None
+
+        if not entries:
+            mapped.close()
+            return self._entries
+
+        logger.info(f'Loaded {len(entries)} entries from cache snapshot {self.path}')
+        self._mmap = mapped
+        self._entries = entries
+        for key, (_, _, tags, _) in entries.items():
+            for tag in tags:
+                self._tag_map.setdefault(tag, set()).add(key)
+        self._replay_invalidations()
+        return self._entries
+
+    def _replay_invalidations(self):
+        if self.invalidation_log is None:
+            return
+        if self._log_position is None:
+            logger.info(f'Ignoring cache snapshot {self.path}, it does not say which invalidations it has seen')
+            self.close()
+            return
+
+        missed = self.invalidation_log.invalidations_since(*self._log_position)
+        if missed is None:
+            logger.info(f'Ignoring cache snapshot {self.path}, invalidations made since it was written are lost')
+            self.close()
+            return
+
+        for kind, target in missed:
+            if kind == Invalidation.KEY:
+                self.expire(target)
+            elif kind == Invalidation.TAG:
+                self.invalidate(target)
+            elif kind == Invalidation.NAMESPACE:
+                self.invalidate_namespace(target)
+            elif kind == Invalidation.CLEAR:
+                self.close()
+                return
+
+    def _read(self, mapped: mmap.mmap, revision: str) -> dict[str, tuple[int, int, frozenset[str], float | None]] | None:
+        magic, format_version = HEADER.unpack_from(mapped, 0)[:2]
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            logger.info(f'Ignoring cache snapshot {self.path} written in an unknown format')
+            return None
+        _, _, written_at, revision_length, count, values_offset, generation, log_position = HEADER.unpack_from(mapped, 0)
+
+        position = HEADER.size
+        snapshot_revision = mapped[position : position + revision_length].decode()
+        if snapshot_revision != revision:
+            logger.info(f'Ignoring cache snapshot {self.path} from schema revision {snapshot_revision}, expected {revision}')
+            return None
+        if time.time() - written_at > self.max_age:
+            logger.info(f'Ignoring cache snapshot {self.path}, it is too old to trust')
+            return None
+        position += revision_length
+        if log_position >= 0:
+            self._log_position = (generation.rstrip(b'\0').decode(), log_position)
+
+        now = time.time()
+        entries = {}
+        for _ in range(count):
+            key_length, tags_length, offset, length, expiry = INDEX_ENTRY.unpack_from(mapped, position)
+            position += INDEX_ENTRY.size
+            key = mapped[position : position + key_length].decode()
+            position += key_length
+            encoded_tags = mapped[position : position + tags_length].decode()
+            position += tags_length
+
+            expires_at = None if math.isnan(expiry) else expiry
+            if expires_at is not None and expires_at <= now:
+                continue
+            tags = frozenset(encoded_tags.split('\0')) if encoded_tags else frozenset()
+            entries[key] = (values_offset + offset, length, tags, expires_at)
+        return entries
+
+    def _drop(self, key: str):
+        assert self._entries is not None
+        _, _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tag_map.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_map[tag]
+
+        if not self._entries:
+            self.close()
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def take(self, key: str) -> tuple[Any, frozenset[str], float | None] | None:
+        """
+        ### Remove an entry from the snapshot and return it
+
+        **Args:**
+        - `key` (`str`): The key to take.
+
+        **Returns:**
+        - `tuple[Any, frozenset[str], float | None] | None`: The value, its tags and expiry, or `None` if the snapshot
+          does not hold the key, or holds it but it has since expired.
+        """
+        entries = self._load()
+        item = entries.get(key)
+        if item is None:
+            return None
+
+        offset, length, tags, expires_at = item
+        assert self._mmap is not None
+        blob = self._mmap[offset : offset + length]
+        self._drop(key)
+
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        try:
+            value, _ = pickle.loads(blob)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache snapshot entry '{key}': {e}")
+            return None
+        return value, tags, expires_at
+
+    def invalidate(self, *tags: Tag):
+        self._load()
+        for tag in map(encode_tag, tags):
+            for key in list(self._tag_map.get(tag, ())):
+                self._drop(key)
+
+    def invalidate_namespace(self, namespace: str):
+        for key in [key for key in self._load() if namespace_of(key) == namespace]:
+            self._drop(key)
+
+    def expire(self, key: str):
+        if key in self._load():
+            self._drop(key)
+
+    def clear(self):
+        self.close()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap = None
+        self._entries = {}
+        self._tag_map = {}
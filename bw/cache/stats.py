@@ -0,0 +1,79 @@
+from typing import Any
+from bw.cache.tags import namespace_of
+
+# keys without a namespace are counted under this name
+NO_NAMESPACE = ''
+
+
+class Counters:
+    __slots__ = ('hits', 'misses', 'inserts', 'rejections', 'evictions', 'expirations', 'invalidations')
+
+    hits: int
+    misses: int
+    inserts: int
+    rejections: int
+    evictions: int
+    expirations: int
+    invalidations: int
+
+    def __init__(self):
+        for counter in self.__slots__:
+            setattr(self, counter, 0)
+
+    def as_dict(self) -> dict[str, int]:
+        return {counter: getattr(self, counter) for counter in self.__slots__}
+
+
+class CacheStats:
+    """
+    ### Counters for a single cache tier within this worker
+
+    Only ever incremented on the paths that already touch the cache, so it is cheap enough to leave on everywhere.
+    """
+
+    namespaces: dict[str, Counters]
+    invalidations_by_event: dict[str, int]
+
+    def __init__(self):
+        self.namespaces = {}
+        self.invalidations_by_event = {}
+
+    def of(self, key: str) -> Counters:
+        return self.of_namespace(namespace_of(key) or NO_NAMESPACE)
+
+    def of_namespace(self, namespace: str | None) -> Counters:
+        namespace = namespace or NO_NAMESPACE
+        counters = self.namespaces.get(namespace)
+        if counters is None:
+            counters = self.namespaces[namespace] = Counters()
+        return counters
+
+    def record_event(self, event: str, invalidated: int):
+        self.invalidations_by_event[event] = self.invalidations_by_event.get(event, 0) + invalidated
+
+    def report(self, usage: dict[str, tuple[int, int]], largest: list[tuple[str, int]]) -> dict[str, Any]:
+        """
+        ### Combine the counters with what the tier currently holds
+
+        **Args:**
+        - `usage` (`dict[str, tuple[int, int]]`): Bytes used and number of entries held for each namespace.
+        - `largest` (`list[tuple[str, int]]`): The largest keys held and their size in bytes, largest first.
+
+        **Returns:**
+        - `dict[str, Any]`: A JSON safe report of the tier.
+        """
+        namespaces = {}
+        for namespace in sorted(self.namespaces.keys() | usage.keys()):
+            counters = self.namespaces.get(namespace) or Counters()
+            size_bytes, entries = usage.get(namespace, (0, 0))
+            namespaces[namespace] = counters.as_dict() | {'size_bytes': size_bytes, 'entries': entries}
+
+        return {
+            'namespaces': namespaces,
+            'invalidations_by_event': dict(self.invalidations_by_event),
+            'largest_entries': [{'key': key, 'size_bytes': size} for key, size in largest],
+        }
+
+    def clear(self):
+        self.namespaces.clear()
+        self.invalidations_by_event.clear()
@@ -0,0 +1,34 @@
+import functools
+from collections.abc import Iterable
+from bw.web_event import BaseEvent
+
+# An entry expires when any of its tags is invalidated. Event classes are invalidated whenever an event of that
+# class (or a subclass) is published, while string tags are only invalidated explicitly.
+Tag = type[BaseEvent] | str
+
+
+@functools.cache
+def encode_tag(tag: Tag) -> str:
+    if isinstance(tag, str):
+        return tag
+    return f'event:{tag.__module__}.{tag.__qualname__}'
+
+
+@functools.cache
+def event_tags(event: type[BaseEvent]) -> tuple[str, ...]:
+    # entries tagged with an abstract event (e.g. `MissionEvent`) expire on any of its concrete events
+    return tuple(encode_tag(cls) for cls in event.__mro__ if issubclass(cls, BaseEvent))
+
+
+def make_tags(expire_event: type[BaseEvent] | None, tags: Iterable[Tag] = ()) -> frozenset[str]:
+    encoded = frozenset(encode_tag(tag) for tag in tags)
+    if expire_event is None:
+        return encoded
+    return encoded | {encode_tag(expire_event)}
+
+
+def namespace_of(key: str) -> str | None:
+    namespace, separator, _ = key.partition(':')
+    if separator:
+        return namespace
+    return None
@@ -1,10 +1,47 @@
+import functools
+import operator
+
 from bw.error import MismatchedArguments
 
 
+@functools.cache
+def _flag_bits(cls: type) -> dict[str, int]:
+    # a flag's bit is its position in the class, so flags persisted as a mask must only ever be appended
+    return {slot: 1 << position for position, slot in enumerate(cls.__slots__)}
+
+
 class SlotCombiner:
     def as_dict(self) -> dict:
         return {slot: getattr(self, slot) for slot in self.__slots__}  # ty: ignore[unresolved-attribute]
 
+    @property
+    def mask(self) -> int:
+        mask = 0
+        for slot, bit in _flag_bits(type(self)).items():
+            if getattr(self, slot):
+                mask |= bit
+        return mask
+
+    def covers(self, mask: int) -> bool:
+        return self.mask & mask == mask
+
+    @classmethod
+    def mask_of(cls, *flags) -> int:
+        # flags may be given by name or as the slot itself, e.g. `Roles.can_manage_server`
+        bits = _flag_bits(cls)
+        mask = 0
+        for flag in flags:
+            mask |= bits[getattr(flag, '__name__', flag)]
+        return mask
+
+    @classmethod
+    def flags_in(cls, mask: int) -> list[str]:
+        return [slot for slot, bit in _flag_bits(cls).items() if mask & bit]
+
+    @classmethod
+    def from_mask(cls, mask: int):
+        return cls(**{slot: bool(mask & bit) for slot, bit in _flag_bits(cls).items()})
+
     @classmethod
     def from_keys(cls, default_if_key_not_present=None, **keys):
         expected_keys = [key for key in cls.__slots__ if key not in keys]  # ty: ignore[unresolved-attribute]
@@ -21,9 +58,4 @@ class SlotCombiner:
 
     @classmethod
     def from_many(cls, *permissions):
-        final = cls(**{slot: False for slot in cls.__slots__})  # ty: ignore[unresolved-attribute]
-        for permission in permissions:
-            for grant, value in permission.as_dict().items():
-                current_value = getattr(final, grant)
-                setattr(final, grant, current_value or value)
-        return final
+        return cls.from_mask(functools.reduce(operator.or_, (permission.mask for permission in permissions), 0))
@@ -0,0 +1,259 @@
+import contextlib
+import functools
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from typing import Any
+
+from quart import g, has_app_context, has_request_context, request
+from sqlalchemy import Engine, event
+
+from bw.environment import ENVIRONMENT, Test
+from bw.settings import GLOBAL_CONFIGURATION
+
+logger = logging.getLogger('bw.sql')
+
+NO_ENDPOINT = '<no endpoint>'
+
+
+class QueryBudgetExceeded(AssertionError):
+    def __init__(self, where: str, limit: int, statements: list[str]):
+        listing = '\n'.join(f'  {statement}' for statement in statements)
+        super().__init__(f'{where} made {len(statements)} queries, over its budget of {limit}:\n{listing}')
+
+
+def _value_shape(value: Any) -> str:
+    if isinstance(value, list | tuple | set | frozenset):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
+
+
+def parameter_shape(parameters: Any, executemany: bool = False) -> Any:
+    """
+    ### Describe bound parameters by type, leaving out their values
+
+    Values can be tokens or other secrets, so only their types are ever logged.
+
+    **Args:**
+    - `parameters` (`Any`): The parameters passed to the DBAPI cursor.
+    - `executemany` (`bool`): Whether `parameters` holds one set of parameters per execution.
+
+    **Returns:**
+    - `Any`: The same structure, with every value replaced by its type name, and collections by their length.
+
+    **Example:**
+    ```python
+    parameter_shape({'uuid_1': UUID(...), 'ids': [1, 2, 3]})
+    # {'uuid_1': 'UUID', 'ids': 'list[3]'}
+    ```
+    """
+    if executemany:
+        return f'{len(parameters)} x {parameter_shape(parameters[0])}' if parameters else '0 x ()'
+    if isinstance(parameters, dict):
+        return {key: _value_shape(value) for key, value in parameters.items()}
+    if isinstance(parameters, list | tuple):
+        return [_value_shape(value) for value in parameters]
+    return _value_shape(parameters)
+
+
+def current_endpoint() -> str:
+    if has_request_context() and request.endpoint is not None:
+        return request.endpoint
+    return NO_ENDPOINT
+
+
+@dataclass(slots=True)
+class RequestQueries:
+    # what the current request has sent to the database so far
+    statements: list[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+
+def request_queries() -> RequestQueries | None:
+    if not has_app_context():
+        return None
+    if 'sql' not in g:
+        g.sql = RequestQueries()
+    return g.sql
+
+
+@dataclass(slots=True)
+class EndpointQueries:
+    requests: int = 0
+    queries: int = 0
+    seconds: float = 0.0
+    slow_queries: int = 0
+    most_queries: int = 0
+
+
+class QueryMetrics:
+    """
+    ### How many queries each endpoint makes, and how long they take
+
+    Counters belong to the worker, and are changed from every database thread, so only under a lock.
+    """
+
+    slow_query_seconds: float
+    endpoints: dict[str, EndpointQueries]
+
+    def __init__(self):
+        self.slow_query_seconds = float(GLOBAL_CONFIGURATION.get('db_slow_query_ms', 250)) / 1000
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, endpoint: str) -> EndpointQueries:
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = self.endpoints[endpoint] = EndpointQueries()
+        return stats
+
+    def record_query(self, statement: str, parameters: Any, seconds: float, executemany: bool = False):
+        endpoint = current_endpoint()
+        slow = seconds >= self.slow_query_seconds
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats.queries += 1
+            stats.seconds += seconds
+            if slow:
+                stats.slow_queries += 1
+
+        queries = request_queries()
+        if queries is not None:
+            queries.statements.append(statement)
+            queries.seconds += seconds
+
+        if slow:
+            logger.warning(
+                f'Slow query in {endpoint} took {seconds * 1000:.1f} ms: {" ".join(statement.split())} '
+                f'parameters: {parameter_shape(parameters, executemany)}'
+            )
+
+    def finish_request(self):
+        """
+        ### Count the request which is ending against its endpoint
+        """
+        queries = request_queries()
+        if queries is None or not queries.statements:
+            return
+        with self._lock:
+            stats = self._endpoint(current_endpoint())
+            stats.requests += 1
+            stats.most_queries = max(stats.most_queries, len(queries.statements))
+
+    def instrument(self, engine: Engine):
+        """
+        ### Time every statement sent through an engine
+
+        **Args:**
+        - `engine` (`Engine`): The engine to instrument.
+        """
+
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        def after(conn, cursor, statement, parameters, context, executemany):
+            seconds = time.perf_counter() - conn.info['query_start'].pop()
+            self.record_query(statement, parameters, seconds, executemany)
+
+        event.listen(engine, 'before_cursor_execute', before)
+        event.listen(engine, 'after_cursor_execute', after)
+
+    def report(self) -> dict[str, Any]:
+        """
+        ### Report queries made by each endpoint
+
+        **Returns:**
+        - `dict[str, Any]`: Per endpoint, the requests that queried the database, the queries and seconds spent on
+          them, how many were slow, and the most made by a single request. Busiest endpoints first.
+        """
+        with self._lock:
+            endpoints = sorted(self.endpoints.items(), key=lambda item: item[1].seconds, reverse=True)
+            return {
+                'slow_query_ms': self.slow_query_seconds * 1000,
+                'endpoints': {
+                    endpoint: {
+                        'requests': stats.requests,
+                        'queries': stats.queries,
+                        'total_ms': stats.seconds * 1000,
+                        'mean_queries_per_request': stats.queries / stats.requests if stats.requests else None,
+                        'most_queries_per_request': stats.most_queries,
+                        'slow_queries': stats.slow_queries,
+                    }
+                    for endpoint, stats in endpoints
+                },
+            }
+
+
+def query_budget(limit: int):
+    """
+    ### Declare the most queries an endpoint may make
+
+    Goes directly above the endpoint function, so only the queries it makes itself are counted. Going over the budget
+    is logged, and fails the request when running tests so the test catches it.
+
+    **Args:**
+    - `limit` (`int`): The most queries one call may make.
+
+    **Example:**
+    ```python
+    @api.get('/list')
+    @url_endpoint
+    @query_budget(2)
+    async def list_users() -> JsonResponse: ...
+    ```
+    """
+
+    def decorator(func: Callable):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            queries = request_queries()
+            already_made = len(queries.statements) if queries is not None else 0
+            result = await func(*args, **kwargs)
+
+            if queries is not None and len(queries.statements) - already_made > limit:
+                error = QueryBudgetExceeded(current_endpoint(), limit, queries.statements[already_made:])
+                if isinstance(ENVIRONMENT, Test):
+                    raise error
+                logger.warning(str(error))
+            return result
+
+        wrapper.__query_budget__ = limit  # ty: ignore[unresolved-attribute]
+        return wrapper
+
+    return decorator
+
+
+@contextlib.contextmanager
+def assert_query_budget(engine: Engine, limit: int) -> Iterator[list[str]]:
+    """
+    ### Fail if the block sends more than `limit` statements through `engine`
+
+    Counts statements from every thread, so it also sees work handed to the database threads.
+
+    **Args:**
+    - `engine` (`Engine`): The engine to watch.
+    - `limit` (`int`): The most statements the block may send.
+
+    **Raises:**
+    - `QueryBudgetExceeded`: If the block went over its budget. The message lists every statement sent.
+
+    **Example:**
+    ```python
+    with assert_query_budget(state.Engine, 3):
+        response = await test_app.get('/missions/parts/list')
+    ```
+    """
+    statements: list[str] = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(' '.join(statement.split()))
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    if len(statements) > limit:
+        raise QueryBudgetExceeded('Block', limit, statements)
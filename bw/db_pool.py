@@ -0,0 +1,151 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+from bw.settings import GLOBAL_CONFIGURATION
+
+
+def _flag(value: Any) -> bool:
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+@dataclass(frozen=True, slots=True)
+class PoolOptions:
+    """
+    ### How each worker's database connection pool is sized
+
+    Every worker, and the cron runner, keeps its own pool, so the most connections the host can open is
+    `(size + max_overflow)` times the number of processes. Keep that under Postgres' `max_connections`.
+    """
+
+    size: int
+    max_overflow: int
+    timeout: float
+    recycle: int
+    pre_ping: bool
+
+    @staticmethod
+    def from_config() -> 'PoolOptions':
+        return PoolOptions(
+            size=int(GLOBAL_CONFIGURATION.get('db_pool_size', 5)),
+            max_overflow=int(GLOBAL_CONFIGURATION.get('db_max_overflow', 10)),
+            timeout=float(GLOBAL_CONFIGURATION.get('db_pool_timeout', 30)),
+            recycle=int(GLOBAL_CONFIGURATION.get('db_pool_recycle', 30 * 60)),
+            pre_ping=_flag(GLOBAL_CONFIGURATION.get('db_pool_pre_ping', 'true')),
+        )
+
+    @property
+    def max_connections(self) -> int:
+        return self.size + self.max_overflow
+
+    def engine_arguments(self) -> dict[str, Any]:
+        return {
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': self.size,
+            'max_overflow': self.max_overflow,
+            'pool_timeout': self.timeout,
+            'pool_recycle': self.recycle,
+            'pool_pre_ping': self.pre_ping,
+        }
+
+
+class PoolMetrics:
+    """
+    ### Counters for how connections are checked out of a pool
+
+    Checkouts happen on every database thread, so counters are only changed under a lock.
+    """
+
+    checkouts: int
+    overflow_checkouts: int
+    timeouts: int
+    wait_seconds: float
+    max_wait_seconds: float
+    peak_in_use: int
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.peak_in_use = 0
+
+    def record_checkout(self, waited: float, in_use: int, overflowed: bool):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self.peak_in_use = max(self.peak_in_use, in_use)
+            if overflowed:
+                self.overflow_checkouts += 1
+
+    def record_timeout(self, waited: float):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def report(self) -> dict[str, Any]:
+        with self._lock:
+            waits = self.checkouts + self.timeouts
+            return {
+                'peak_in_use': self.peak_in_use,
+                'checkouts': self.checkouts,
+                'overflow_checkouts': self.overflow_checkouts,
+                'timeouts': self.timeouts,
+                'mean_wait_ms': self.wait_seconds / waits * 1000 if waits else 0.0,
+                'max_wait_ms': self.max_wait_seconds * 1000,
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    ### A `QueuePool` which times how long each checkout waits for a connection
+
+    Metrics survive the pool being recreated, e.g. by `Engine.dispose`.
+    """
+
+    metrics: PoolMetrics
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.record_timeout(time.perf_counter() - start)
+            raise
+        in_use = self.checkedout()
+        self.metrics.record_checkout(time.perf_counter() - start, in_use, overflowed=in_use > self.size())
+        return connection
+
+    def recreate(self) -> 'InstrumentedQueuePool':
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def report(self) -> dict[str, Any]:
+        """
+        ### Report how the pool is being used
+
+        **Returns:**
+        - `dict[str, Any]`: The pool's limits, how many connections are in use right now, and checkout counters.
+        """
+        return {
+            'size': self.size(),
+            'max_overflow': self._max_overflow,
+            'timeout': self._timeout,
+            'in_use': self.checkedout(),
+            'idle': self.checkedin(),
+            'overflow': max(0, self.overflow()),
+            **self.metrics.report(),
+        }
@@ -6,6 +6,7 @@ from bw.missions.endpoints import define as missions_define, define_html as miss
 from bw.server_ops.endpoints import define as server_ops_define
 from bw.realtime.endpoints import define as realtime_define
 from bw.session.endpoints import define as sessions_define
+from bw.admin.endpoints import define as admin_define
 
 from bw.response import Ok, WebResponse
 from bw.web_utils import html_endpoint, url_endpoint, chunk_file_response
@@ -57,6 +58,7 @@ def define(app: Quart):
     server_ops_blueprint = Blueprint('server_ops', __name__, url_prefix='/server_ops')
     realtime_blueprint = Blueprint('realtime', __name__, url_prefix='/realtime')
     sessions_blueprint = Blueprint('sessions', __name__, url_prefix='/session')
+    admin_blueprint = Blueprint('admin', __name__, url_prefix='/admin')
 
     define_auth(auth_blueprint)
     define_user(user_blueprint, local_user_blueprint)
@@ -65,6 +67,7 @@ def define(app: Quart):
     server_ops_define(server_ops_blueprint)
     realtime_define(realtime_blueprint)
     sessions_define(sessions_blueprint)
+    admin_define(admin_blueprint)
 
     api_blueprint.register_blueprint(html_parts_blueprint)
     api_blueprint.register_blueprint(mission_blueprint)
@@ -74,6 +77,7 @@ def define(app: Quart):
     api_blueprint.register_blueprint(server_ops_blueprint)
     api_blueprint.register_blueprint(realtime_blueprint)
     api_blueprint.register_blueprint(sessions_blueprint)
+    api_blueprint.register_blueprint(admin_blueprint)
 
     local_blueprint.register_blueprint(local_user_blueprint)
 
@@ -16,6 +16,14 @@ class Environment:
         GC.require('db_driver', 'db_username', 'db_password', 'db_address', 'db_name')
         return f'{GC["db_driver"]}://{GC["db_username"]}:{GC["db_password"]}@{GC["db_address"]}'
 
+    def db_replica_connection(self) -> str | None:
+        # replicas share the primary's driver and credentials unless given their own
+        if not GC.get('db_replica_address'):
+            return None
+        username = GC.get('db_replica_username') or GC['db_username']
+        password = GC.get('db_replica_password') or GC['db_password']
+        return f'{GC["db_driver"]}://{username}:{password}@{GC["db_replica_address"]}'
+
     def deploy_asgi(self) -> bool:
         raise NotImplementedError()
 
@@ -66,6 +74,22 @@ class Environment:
         assert isinstance(player_count, str)
         return int(player_count)
 
+    def cache_directory(self) -> Path:
+        # cache files are unpickled, so they live somewhere only the server's user can write to
+        if GC.get('cache_directory'):
+            return Path(GC['cache_directory'])
+        return Path('./cache')
+
+    def l2_cache_path(self) -> Path | None:
+        if GC.get('l2_cache_path'):
+            return Path(GC['l2_cache_path'])
+        return None
+
+    def cache_snapshot_path(self) -> Path | None:
+        if GC.get('cache_snapshot_path'):
+            return Path(GC['cache_snapshot_path'])
+        return None
+
 
 class Local(Environment):
     def port(self) -> int:
@@ -117,6 +141,12 @@ class Staging(Environment):
     def use_subprocess(self) -> bool:
         return True
 
+    def l2_cache_path(self) -> Path | None:
+        return super().l2_cache_path() or self.cache_directory() / f'l2_cache_{self.port()}.sqlite3'
+
+    def cache_snapshot_path(self) -> Path | None:
+        return super().cache_snapshot_path() or self.cache_directory() / f'cache_snapshot_{self.port()}.bin'
+
 
 class Production(Environment):
     def port(self) -> int:
@@ -134,6 +164,12 @@ class Production(Environment):
     def use_subprocess(self) -> bool:
         return True
 
+    def l2_cache_path(self) -> Path | None:
+        return super().l2_cache_path() or self.cache_directory() / f'l2_cache_{self.port()}.sqlite3'
+
+    def cache_snapshot_path(self) -> Path | None:
+        return super().cache_snapshot_path() or self.cache_directory() / f'cache_snapshot_{self.port()}.bin'
+
 
 if GC.get('environment', 'local') == 'prod':
     ENVIRONMENT = Production()
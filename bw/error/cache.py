@@ -1,3 +1,5 @@
+from pathlib import Path
+
 from bw.error.base import BwServerError
 
 
@@ -9,3 +11,16 @@ class CacheMiss(BwServerError):
 class L1CacheMiss(CacheMiss):
     def __init__(self, key: str):
         super().__init__(f'L1 Cache miss for key: {key}')
+
+
+class L2CacheMiss(CacheMiss):
+    def __init__(self, key: str):
+        super().__init__(f'L2 Cache miss for key: {key}')
+
+
+class InsecureCachePath(BwServerError):
+    def __init__(self, path: Path, reason: str):
+        super().__init__(f'Refusing to use cache file {path}: {reason}')
+
+    def status(self) -> int:
+        return 500
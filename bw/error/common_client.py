@@ -6,6 +6,11 @@ class BadArguments(ClientError):
         super().__init__('Arguments are invalid')
 
 
+class BadPageToken(ClientError):
+    def __init__(self):
+        super().__init__('Continuation token is malformed')
+
+
 class BadHeader(ClientError):
     def __init__(self):
         super().__init__('A malformed header parameter exists')
@@ -44,3 +44,8 @@ class ConfigIsNotToml(WrongConfigType):
 class UnknownConfigFileType(WrongConfigType):
     def __init__(self, actual: str, *expected: str):
         ConfigError.__init__(self, f'Unknown config file type: {actual}. Expected one of: {", ".join(expected)}')
+
+
+class InvalidConfigValue(ConfigError):
+    def __init__(self, key: str, value: str, expected: str):
+        super().__init__(f"Invalid value '{value}' for key {key}, expected {expected}")
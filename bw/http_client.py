@@ -0,0 +1,141 @@
+import asyncio
+import contextlib
+import logging
+from collections.abc import AsyncIterator
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from bw.settings import GLOBAL_CONFIGURATION
+
+logger = logging.getLogger('bw.http')
+
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
+
+
+class HttpClients:
+    """
+    ### Outbound HTTP connections shared by the whole worker
+
+    Each host gets its own connection pool, so keep-alive connections, TLS sessions and resolved addresses are reused
+    between requests instead of being set up for every call. Pools only exist while the server is serving; requests
+    made outside of that, such as while loading configuration at startup, use a connection of their own.
+    """
+
+    timeout: aiohttp.ClientTimeout
+    retries: int
+    backoff: float
+    connections_per_host: int
+    dns_cache_ttl: int
+    keepalive_timeout: float
+
+    _sessions: dict[str, aiohttp.ClientSession]
+    _loop: asyncio.AbstractEventLoop | None
+
+    def __init__(self):
+        self.timeout = aiohttp.ClientTimeout(
+            total=float(GLOBAL_CONFIGURATION.get('http_timeout', 10)),
+            connect=float(GLOBAL_CONFIGURATION.get('http_connect_timeout', 5)),
+        )
+        self.retries = int(GLOBAL_CONFIGURATION.get('http_retries', 2))
+        self.backoff = float(GLOBAL_CONFIGURATION.get('http_retry_backoff', 0.25))
+        self.connections_per_host = int(GLOBAL_CONFIGURATION.get('http_connections_per_host', 10))
+        self.dns_cache_ttl = int(GLOBAL_CONFIGURATION.get('http_dns_cache_ttl', 300))
+        self.keepalive_timeout = float(GLOBAL_CONFIGURATION.get('http_keepalive_timeout', 30))
+        self._sessions = {}
+        self._loop = None
+
+    def _new_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.connections_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    @property
+    def is_open(self) -> bool:
+        return self._loop is not None
+
+    async def open(self):
+        """
+        ### Start pooling connections on the running event loop
+        """
+        self._loop = asyncio.get_running_loop()
+
+    async def close(self):
+        """
+        ### Close every pooled connection
+        """
+        sessions, self._sessions = self._sessions, {}
+        self._loop = None
+        for session in sessions.values():
+            await session.close()
+
+    @contextlib.asynccontextmanager
+    async def _session_for(self, url: str) -> AsyncIterator[aiohttp.ClientSession]:
+        # sessions belong to the loop they were made on, so anything running elsewhere cannot share the pools
+        if self._loop is None or self._loop is not asyncio.get_running_loop():
+            async with self._new_session() as session:
+                yield session
+            return
+
+        parts = urlsplit(url)
+        origin = f'{parts.scheme}://{parts.netloc}'
+        session = self._sessions.get(origin)
+        if session is None or session.closed:
+            session = self._sessions[origin] = self._new_session()
+        yield session
+
+    @contextlib.asynccontextmanager
+    async def request(
+        self, method: str, url: str, *, retry: bool | None = None, **kwargs
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """
+        ### Make a request through the pool for its host
+
+        Failed connections, timeouts and responses saying the server is busy are retried with exponential backoff.
+        Whatever response is last received is handed back, so callers still see a final error status.
+
+        **Args:**
+        - `method` (`str`): The HTTP method.
+        - `url` (`str`): The full URL to request.
+        - `retry` (`bool | None`): Whether to retry the request. Defaults to retrying only idempotent methods.
+        - `**kwargs`: Passed on to `aiohttp.ClientSession.request`, e.g. `headers`, `params` or `data`.
+
+        **Raises:**
+        - `aiohttp.ClientError`: If the request could not be made within its retries.
+        - `TimeoutError`: If the last attempt timed out.
+
+        **Returns:**
+        - `aiohttp.ClientResponse`: The response, released once the `async with` block is left.
+
+        **Example:**
+        ```python
+        async with state.http.request('GET', 'https://discord.com/api/v10/users/@me', headers=headers) as response:
+            user = await response.json()
+        ```
+        """
+        method = method.upper()
+        attempts = 1 + (self.retries if (retry if retry is not None else method in IDEMPOTENT_METHODS) else 0)
+        async with self._session_for(url) as session:
+            for attempt in range(attempts):
+                last_attempt = attempt == attempts - 1
+                try:
+                    response = await session.request(method, url, **kwargs)
+                except (aiohttp.ClientConnectionError, TimeoutError) as e:
+                    if last_attempt:
+                        raise
+                    logger.info(f'{method} {url} failed, retrying: {e!r}')
+                else:
+                    if response.status not in RETRY_STATUSES or last_attempt:
+                        break
+                    logger.info(f'{method} {url} answered {response.status}, retrying')
+                    response.release()
+                await asyncio.sleep(self.backoff * 2**attempt)
+
+            try:
+                yield response
+            finally:
+                response.release()
@@ -4,7 +4,7 @@ import shutil
 from uuid import UUID, uuid5
 from pathlib import Path
 
-from bw.state import State
+from bw.state import State, in_db_thread, run_in_db_thread
 from bw.response import JsonResponse, WebResponse, Created
 from bw.error import (
     BwServerError,
@@ -28,6 +28,7 @@ from bw.missions.response import (
     MissionResponse,
     MissionTypeResponse,
     IterationResponse,
+    MissionSignoffResponse,
 )
 from bw.models.auth import User
 from bw.settings import BW_UUID_NAMESPACE
@@ -149,13 +150,15 @@ class MissionsApi:
 
         uuid = uuid_from_name_and_map(non_versioned_mission_name, mission_map)
         try:
-            existing_mission = MissionStore().mission_with_uuid_in_server(state, uuid, server.server_name())
+            existing_mission = await run_in_db_thread(
+                MissionStore().mission_with_uuid_in_server, state, uuid, server.server_name()
+            )
         except MissionDoesNotExist:
             existing_mission = None
 
         if existing_mission is None:
             tag = int(info['potato_missiontesting_missionType']['data']['value'])
-            mission_type = MissionTypeStore().mission_type_from_tag(state, tag)
+            mission_type = await run_in_db_thread(MissionTypeStore().mission_type_from_tag, state, tag)
 
             flags = {}
             if 'potato_missiontesting_missionTag1' in info:
@@ -165,7 +168,8 @@ class MissionsApi:
             if 'potato_missiontesting_missionTag3' in info:
                 flags['tag3'] = int(info['potato_missiontesting_missionTag3']['data']['value'])
 
-            existing_mission = MissionStore().create_mission(
+            existing_mission = await run_in_db_thread(
+                MissionStore().create_mission,
                 state,
                 server.server_name(),
                 user,
@@ -195,7 +199,8 @@ class MissionsApi:
 
         self._copy_mission_to_server(server, stored_pbo_path)
 
-        iteration = MissionStore().add_iteration(
+        iteration = await run_in_db_thread(
+            MissionStore().add_iteration,
             state,
             existing_mission,
             stored_pbo_path.stem,
@@ -222,7 +227,8 @@ class MissionsApi:
         )
 
     @define_api
-    async def get_iteration_information(self, state: State, iteration_uuid: UUID) -> JsonResponse:
+    @in_db_thread
+    def get_iteration_information(self, state: State, iteration_uuid: UUID) -> JsonResponse:
         iteration = MissionStore().iteration_with_uuid(state, iteration_uuid)
         mission = MissionStore().mission_with_iteration(state, iteration)
         mission_tag = MissionTypeStore().mission_type_from_id(state, tag_id=mission.mission_type)
@@ -267,7 +273,8 @@ class MissionsApi:
         return JsonResponse(iteration_info)
 
     @define_api
-    async def get_mission_information(self, state: State, mission_uuid: UUID) -> JsonResponse:
+    @in_db_thread
+    def get_mission_information(self, state: State, mission_uuid: UUID) -> JsonResponse:
         mission = MissionStore().mission_with_uuid(state, mission_uuid)
         mission_tag = MissionTypeStore().mission_type_from_id(state, tag_id=mission.mission_type)
 
@@ -299,8 +306,10 @@ class MissionsApi:
     def mission_count(self, state: State) -> int:
         return MissionStore().mission_count(state)
 
-    def get_missions_by_page(self, state: State, page: int, items_per_page: int) -> list[MissionResponse]:
-        missions = MissionStore().get_missions_by_page(state, page, items_per_page)
+    def get_missions_by_page(
+        self, state: State, items_per_page: int, continue_from: str | None = None
+    ) -> tuple[list[MissionResponse], str | None]:
+        missions, next_page = MissionStore().get_missions_by_page(state, items_per_page, continue_from)
         return [
             MissionResponse(
                 uuid=mission.uuid,
@@ -318,7 +327,7 @@ class MissionsApi:
                 special_flags=mission.special_flags,
             )
             for mission, mission_tag, author in missions
-        ]
+        ], next_page
 
     def iterations_for_mission(self, state: State, mission_uuid: UUID) -> list[IterationResponse]:
         mission = MissionStore().mission_with_uuid(state, mission_uuid)
@@ -340,10 +349,42 @@ class MissionsApi:
             for iteration in all_iterations
         ]
 
+    def signoffs_for_missions(self, state: State, mission_uuids: list[UUID]) -> dict[UUID, MissionSignoffResponse]:
+        """
+        ### Tally the signoffs of the newest iteration of each mission
+
+        Made for listing many missions at once, so it costs the same two queries however many missions are asked for.
+
+        **Args:**
+        - `state` (`State`): The application state containing the database connection.
+        - `mission_uuids` (`list[UUID]`): The missions to tally.
+
+        **Returns:**
+        - `dict[UUID, MissionSignoffResponse]`: How many iterations each mission has, and the passed and failed
+          signoffs of its newest iteration, by mission UUID.
+        """
+        latest = MissionStore().latest_iterations(state, mission_uuids)
+        tallies = TestStore().signoff_tallies(state, [iteration.id for iteration, _ in latest.values()])
+
+        signoffs = {}
+        for mission_uuid in mission_uuids:
+            if mission_uuid not in latest:
+                signoffs[mission_uuid] = MissionSignoffResponse(iteration_count=0, passed_signoffs=0, failed_signoffs=0)
+                continue
+            iteration, iteration_count = latest[mission_uuid]
+            tally = tallies.get(iteration.id, {})
+            signoffs[mission_uuid] = MissionSignoffResponse(
+                iteration_count=iteration_count,
+                passed_signoffs=tally.get(TestStatus.PASSED, 0),
+                failed_signoffs=tally.get(TestStatus.FAILED, 0),
+            )
+        return signoffs
+
 
 class TestApi:
     @define_api
-    async def review_mission(
+    @in_db_thread
+    def review_mission(
         self,
         state: State,
         tester: User,
@@ -395,7 +436,8 @@ class TestApi:
         return JsonResponse({'result_uuid': result.uuid})
 
     @define_api
-    async def cosign_result(self, state: State, tester: User, result_uuid: UUID) -> WebResponse:
+    @in_db_thread
+    def cosign_result(self, state: State, tester: User, result_uuid: UUID) -> WebResponse:
         """
         ### Cosign a test result
 
@@ -424,7 +466,8 @@ class TestApi:
         return Created()
 
     @define_api
-    async def reviews(self, state: State, iteration_uuid: UUID, viewer: User | None) -> JsonResponse:
+    @in_db_thread
+    def reviews(self, state: State, iteration_uuid: UUID, viewer: User | None) -> JsonResponse:
         """
         ### Get reviews for a mission iteration
 
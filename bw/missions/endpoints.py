@@ -1,5 +1,3 @@
-from bw.missions.test_status import TestStatus
-from typing import Any
 from uuid import UUID
 import logging
 import urllib.parse
@@ -11,9 +9,10 @@ from bw.response import JsonResponse, WebResponse, NotFound
 from bw.models.auth import User
 from bw.auth.decorators import require_session, require_group_permission
 from bw.auth.permissions import Permissions
-from bw.missions.api import MissionsApi, TestApi
-from bw.state import State
-from bw.error import ServerConfigNotFound
+from bw.missions.api import MissionsApi
+from bw.state import State, run_in_db_thread
+from bw.db_metrics import query_budget
+from bw.error import ServerConfigNotFound, BadPageToken
 from bw.server_ops.arma.server import SERVER_MAP
 
 
@@ -77,7 +76,7 @@ def define(api: Blueprint):
                 changelog=changelog,
             )
         else:
-            return MissionsApi().copy_mission_to_server(server=server, stored_pbo_path=Path(pbo_path))
+            return await run_in_db_thread(MissionsApi().copy_mission_to_server, server=server, stored_pbo_path=Path(pbo_path))
 
     @api.get('/iteration/<uuid:iteration_uuid>')
     @url_endpoint
@@ -172,39 +171,34 @@ def define_html(frontend: Blueprint, parts: Blueprint):
     @frontend.get('/')
     @html_endpoint(template_path='missions/index.html', title='BW Missions')
     async def homepage(html: str) -> str:
-        mission_count = MissionsApi().mission_count(State.state)
+        mission_count = await run_in_db_thread(MissionsApi().mission_count, State.state)
         return await render_template_string(html, mission_count=mission_count)
 
     @parts.get('/list')
     @html_part_endpoint(template_path='missions/mission_card.bundle.html')
+    @query_budget(3)
     async def list(html: str) -> str | WebResponse:
-        current_page = int(request.args.get('page', '1'))
-        current_page = max(1, current_page)
+        continue_from = request.args.get('continue_from')
         items_per_page = int(request.args.get('count_per_page', '10'))
         items_per_page = max(10, items_per_page)
 
-        if (current_page - 1) * items_per_page > MissionsApi().mission_count(State.state):
+        try:
+            missions, next_page = await run_in_db_thread(
+                MissionsApi().get_missions_by_page, State.state, items_per_page=items_per_page, continue_from=continue_from
+            )
+        except BadPageToken:
             return NotFound()
 
         card_template = load_template_from_disk(template_path='missions/mission_card.template.html')
+        signoffs = await run_in_db_thread(
+            MissionsApi().signoffs_for_missions, State.state, [mission.uuid for mission in missions]
+        )
         mission_cards = []
 
-        for mission in MissionsApi().get_missions_by_page(State.state, page=current_page, items_per_page=items_per_page):
-            iterations_for_mission = sorted(
-                MissionsApi().iterations_for_mission(State.state, mission.uuid),
-                key=lambda iteration: iteration.upload_date,
-                reverse=True,
-            )
-            if iterations_for_mission:
-                latest_iteration = iterations_for_mission[0]
-                reviews: list[dict[str, Any]] = (await TestApi().reviews(State.state, latest_iteration.uuid, viewer=None))[
-                    'reviews'
-                ]
-                passes = sum([(1 + review['cosigns']) for review in reviews if TestStatus(review['status']) == TestStatus.PASSED])
-                fails = sum([(1 + review['cosigns']) for review in reviews if TestStatus(review['status']) == TestStatus.FAILED])
-            else:
-                passes = 0
-                fails = 0
+        for mission in missions:
+            mission_signoffs = signoffs[mission.uuid]
+            passes = mission_signoffs.passed_signoffs
+            fails = mission_signoffs.failed_signoffs
             mission_cards.append(
                 await render_template_string(
                     card_template,
@@ -213,7 +207,7 @@ def define_html(frontend: Blueprint, parts: Blueprint):
                     mission_author=mission.author_name,
                     mission_map=mission.map,
                     mission_uuid=mission.uuid,
-                    iteration_count=len(iterations_for_mission),
+                    iteration_count=mission_signoffs.iteration_count,
                     signed_off=(passes - 2 * fails) == mission.mission_type.signoffs_required,
                     passed_signoffs=passes,
                     failed_signoffs=fails,
@@ -221,4 +215,4 @@ def define_html(frontend: Blueprint, parts: Blueprint):
                 )
             )
 
-        return await render_template_string(html, mission_cards=mission_cards, page_number=current_page + 1)
+        return await render_template_string(html, mission_cards=mission_cards, next_page=next_page, items_per_page=items_per_page)
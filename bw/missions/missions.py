@@ -1,11 +1,15 @@
+import datetime
 from bw.converters import make_json_safe
 from bw.session.orbat import Orbat
 from bw.models.session import Session
 from uuid import UUID
-from sqlalchemy import delete, select, func
+from sqlalchemy import delete, select, func, tuple_
 from sqlalchemy.exc import NoResultFound, IntegrityError
 
 from bw.state import State
+from bw.cache import cached
+from bw.pagination import encode_page_token, decode_page_token
+from bw.web_event import MissionUploadEvent, MissionTypeChangedEvent
 from bw.models.auth import User
 from bw.models.missions import MissionType, Mission, Iteration, PlayedMission
 from bw.error import (
@@ -35,7 +39,7 @@ class MissionTypeStore:
         **Raises:**
         - `CouldNotCreateMissionType`: If a mission type with the same name or tag already exists.
         """
-        with state.Session.begin() as session:
+        with state.transaction(savepoint=True) as session:
             mission_type = MissionType(name=name, signoffs_required=signoff_requirement, numeric_tag=tag)
             try:
                 session.add(mission_type)
@@ -43,6 +47,7 @@ class MissionTypeStore:
             except IntegrityError as e:
                 raise CouldNotCreateMissionType() from e
             session.expunge(mission_type)
+        state.broker.publish(MissionTypeChangedEvent(name))
         return mission_type
 
     def update_mission_type(
@@ -63,7 +68,7 @@ class MissionTypeStore:
         **Raises:**
         - `NoMissionTypeWithName`: If no mission type with the given name exists.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(MissionType).where(MissionType.name == name)
             try:
                 mission_type = session.execute(query).one()[0]
@@ -77,6 +82,7 @@ class MissionTypeStore:
 
             session.flush()
             session.expunge(mission_type)
+        state.broker.publish(MissionTypeChangedEvent(name))
         return mission_type
 
     def delete_mission_type(self, state: State, name: str):
@@ -87,10 +93,12 @@ class MissionTypeStore:
         - `state` (`State`): The application state containing the database connection.
         - `name` (`str`): The name of the mission type to delete.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = delete(MissionType).where(MissionType.name == name)
             session.execute(query)
+        state.broker.publish(MissionTypeChangedEvent(name))
 
+    @cached('mission_type', expire_on=MissionTypeChangedEvent)
     def mission_type_from_name(self, state: State, name: str) -> MissionType:
         """
         ### Retrieve a mission type by name
@@ -105,7 +113,7 @@ class MissionTypeStore:
         **Raises:**
         - `NoMissionTypeWithName`: If no mission type with the given name exists.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(MissionType).where(MissionType.name == name)
             try:
                 mission_type = session.execute(query).one()[0]
@@ -114,6 +122,7 @@ class MissionTypeStore:
             session.expunge(mission_type)
         return mission_type
 
+    @cached('mission_type', expire_on=MissionTypeChangedEvent)
     def mission_type_from_tag(self, state: State, tag: int) -> MissionType:
         """
         ### Retrieve a mission type by tag
@@ -128,7 +137,7 @@ class MissionTypeStore:
         **Raises:**
         - `NoMissionTypeWithTag`: If no mission type with the given tag exists.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(MissionType).where(MissionType.numeric_tag == tag)
             try:
                 mission_type = session.execute(query).one()[0]
@@ -137,6 +146,7 @@ class MissionTypeStore:
             session.expunge(mission_type)
         return mission_type
 
+    @cached('mission_type', expire_on=MissionTypeChangedEvent)
     def mission_type_from_id(self, state: State, tag_id: int) -> MissionType:
         """
         ### Retrieve a mission type by its primary key
@@ -151,7 +161,7 @@ class MissionTypeStore:
         **Raises:**
         - `NoMissionTypeWithTag`: If no mission type with the given primary key exists.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(MissionType).where(MissionType.id == tag_id)
             try:
                 mission_type = session.execute(query).one()[0]
@@ -190,7 +200,7 @@ class MissionStore:
         **Returns:**
         - `Mission`: The created mission object.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             mission = Mission(
                 server=server,
                 author=creator.id,
@@ -217,7 +227,7 @@ class MissionStore:
         **Returns:**
         - `list[Mission]`: A list of missions authored by the specified author.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(Mission).where(Mission.author_name == author).order_by(Mission.creation_date)
             missions = session.execute(query).all()
             for mission in missions:
@@ -236,7 +246,7 @@ class MissionStore:
         **Returns:**
         - `list[Mission]`: A list of existing missions matching the author and title.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = (
                 select(Mission).where(Mission.author_name == author).where(Mission.title == title).order_by(Mission.creation_date)
             )
@@ -256,12 +266,13 @@ class MissionStore:
         **Returns:**
         - `Mission`: The mission.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(Mission).where(Mission.id == iteration.mission_id)
             mission = session.execute(query).one()[0]
             session.expunge(mission)
         return mission
 
+    @cached('mission', expire_on=MissionUploadEvent, absent=MissionDoesNotExist)
     def mission_with_uuid(self, state: State, uuid: UUID) -> Mission:
         """
         ### Retrieve existing mission via it's UUID
@@ -273,7 +284,7 @@ class MissionStore:
         **Returns:**
         - `Mission`: The mission, if the UUID is in the database.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(Mission).where(Mission.uuid == uuid)
             try:
                 mission = session.execute(query).one()[0]
@@ -293,7 +304,7 @@ class MissionStore:
         **Returns:**
         - `Mission`: The mission, if the UUID is in the database.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(Mission).where(Mission.uuid == uuid).where(Mission.server == server)
             try:
                 mission = session.execute(query).one()[0]
@@ -316,7 +327,7 @@ class MissionStore:
         **Raises:**
         - `IterationDoesNotExist`: If no iteration with the given UUID exists.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(Iteration).where(Iteration.uuid == uuid)
             try:
                 iteration = session.execute(query).one()[0]
@@ -325,8 +336,9 @@ class MissionStore:
             session.expunge(iteration)
         return iteration
 
+    @cached('mission', expire_on=MissionUploadEvent, absent=IterationDoesNotExist, cache_found=False)
     def iteration_with_mission_and_name(self, state: State, mission: Mission, file_name_no_pbo: str) -> Iteration:
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(Iteration).join(Mission, Mission.id == mission.id).where(Iteration.file_name == file_name_no_pbo)
             try:
                 iteration = session.execute(query).one()[0]
@@ -372,7 +384,7 @@ class MissionStore:
         - `MissionDoesNotExist`: If the mission does not exist.
         - `CouldNotCreateIteration`: If a constraint is violated when creating the iteration.
         """
-        with state.Session.begin() as session:
+        with state.transaction(savepoint=True) as session:
             query = select(Mission).where(Mission.id == mission.id)
             try:
                 session.execute(query).one()
@@ -416,7 +428,7 @@ class MissionStore:
         **Returns:**
         - `list[Iteration]`: A list of all `Iteration` objects for the mission.
         """
-        with state.Session.begin() as session:
+        with state.ReadSession.begin() as session:
             query = select(Iteration).where(Iteration.mission_id == mission.id).order_by(Iteration.iteration)
 
             iterations = []
@@ -425,52 +437,110 @@ class MissionStore:
                 iterations.append(iteration[0])
         return iterations
 
+    def latest_iterations(self, state: State, mission_uuids: list[UUID]) -> dict[UUID, tuple[Iteration, int]]:
+        """
+        ### Retrieve the newest iteration of many missions at once
+
+        **Args:**
+        - `state` (`State`): The application state containing the database connection.
+        - `mission_uuids` (`list[UUID]`): The missions to look up.
+
+        **Returns:**
+        - `dict[UUID, tuple[Iteration, int]]`: The newest iteration of each mission and how many iterations it has,
+          by mission UUID. Missions without any iterations are left out.
+        """
+        ranked = (
+            select(
+                Iteration.id,
+                Mission.uuid.label('mission_uuid'),
+                func.count().over(partition_by=Iteration.mission_id).label('iterations'),
+                func.row_number()
+                .over(partition_by=Iteration.mission_id, order_by=(Iteration.upload_date.desc(), Iteration.id.desc()))
+                .label('rank'),
+            )
+            .join(Mission, Mission.id == Iteration.mission_id)
+            .where(Mission.uuid.in_(mission_uuids))
+            .subquery()
+        )
+        query = (
+            select(Iteration, ranked.c.mission_uuid, ranked.c.iterations)
+            .join(ranked, ranked.c.id == Iteration.id)
+            .where(ranked.c.rank == 1)
+        )
+
+        with state.ReadSession.begin() as session:
+            results = session.execute(query).all()
+            session.expunge_all()
+        return {mission_uuid: (iteration, iterations) for iteration, mission_uuid, iterations in results}
+
+    @cached('mission', expire_on=MissionUploadEvent)
     def mission_count(self, state: State) -> int:
         """
         ### Return how many missions are uploaded in the database
 
+        Counting means scanning the whole table, so the result is cached until the next upload.
+
         **Args:**
         - `state` (`State`): The application state containing the database connection.
 
         **Returns:**
         - `int`: Count of all uploaded missions.
         """
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(func.count()).select_from(Mission)
             result: int = session.execute(query).scalar()
             return result
 
-    def get_missions_by_page(self, state: State, page: int, items_per_page: int) -> list[tuple[Mission, MissionType, User]]:
+    def get_missions_by_page(
+        self, state: State, items_per_page: int, continue_from: str | None = None
+    ) -> tuple[list[tuple[Mission, MissionType, User]], str | None]:
         """
         ### Return page of mission containing at most `items_per_page`
 
+        Missions are listed newest first. Pages are read by creation date rather than by offset, so a page costs the same
+        however deep into the list it is, and missions uploaded while paging do not shift later pages.
+        Pages are read from the replica when one is configured.
+
         **Args:**
         - `state` (`State`): The application state containing the database connection.
-        - `page` (`int`): The page which to get from.
         - `items_per_page` (`int`): How many items to retrieve at most.
+        - `continue_from` (`str | None`): The token returned with the previous page, or `None` for the first page.
+
+        **Raises:**
+        - `BadPageToken`: If `continue_from` is not a token handed out by this method.
 
         **Returns:**
-        - `list[Mission]`: List of missions for this page.
-        """
-        with state.Session.begin() as session:
-            query = (
-                select(Mission, MissionType, User)
-                .offset((page - 1) * items_per_page)
-                .limit(items_per_page)
-                .join(MissionType, Mission.mission_type == MissionType.id)
-                .join(User, Mission.author == User.id)
-                .order_by(Mission.creation_date.desc())
-            )
+        - `tuple[list[tuple[Mission, MissionType, User]], str | None]`: The missions for this page, and the token for
+          the next page or `None` if this is the last.
+        """
+        query = (
+            select(Mission, MissionType, User)
+            .join(MissionType, Mission.mission_type == MissionType.id)
+            .join(User, Mission.author == User.id)
+            .order_by(Mission.creation_date.desc(), Mission.id.desc())
+            # one extra row tells us whether there is another page without counting
+            .limit(items_per_page + 1)
+        )
+        if continue_from is not None:
+            creation_date, mission_id = decode_page_token(continue_from, datetime.datetime, int)
+            query = query.where(tuple_(Mission.creation_date, Mission.id) < tuple_(creation_date, mission_id))
+
+        with state.ReadSession.begin() as session:
             results = session.execute(query).tuples().all()
             session.expunge_all()
-            return list(results)
+
+        results, more = list(results[:items_per_page]), len(results) > items_per_page
+        if not more:
+            return results, None
+        last, _, _ = results[-1]
+        return results, encode_page_token(last.creation_date, last.id)
 
 
 class MissionHistoryStore:
     def add_played_mission(
         self, state: State, mission: Mission, iteration: Iteration, session: Session, orbat: Orbat
     ) -> PlayedMission:
-        with state.Session.begin() as db_session:
+        with state.transaction() as db_session:
             played = PlayedMission(
                 session_id=session.id,
                 iteration_id=iteration.id,
@@ -52,3 +52,10 @@ class IterationResponse:
     bwmf_version: str
     iteration: int
     changelog: str
+
+
+@dataclass
+class MissionSignoffResponse:
+    iteration_count: int
+    passed_signoffs: int
+    failed_signoffs: int
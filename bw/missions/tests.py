@@ -1,5 +1,5 @@
 from uuid import UUID
-from sqlalchemy import delete, select
+from sqlalchemy import delete, func, select
 from sqlalchemy.exc import NoResultFound, IntegrityError
 
 from bw.state import State
@@ -253,36 +253,72 @@ class TestStore:
         # list[IterationReview] with review and cosign data
         ```
         """
+        cosigners = (
+            select(TestCosign.tester_id)
+            .where(TestCosign.test_result_id == TestResult.id)
+            .order_by(TestCosign.id)
+            .correlate(TestResult)
+            .scalar_subquery()
+        )
+        query = (
+            select(
+                TestResult.uuid,
+                TestResult.date_tested,
+                Review.status,
+                Review.notes,
+                Review.tester_id,
+                func.array(cosigners).label('cosigners'),
+            )
+            .join(Review, TestResult.review_id == Review.id)
+            .where(TestResult.iteration_id == iteration.id)
+            .order_by(TestResult.date_tested.desc())
+        )
+        # cosigners are gathered by the same query, rather than one more query per review
         with state.Session.begin() as session:
-            query = (
-                select(TestResult.id, TestResult.uuid, TestResult.date_tested, Review.status, Review.notes, Review.tester_id)
-                .join(Review, TestResult.review_id == Review.id)
-                .where(TestResult.iteration_id == iteration.id)
-                .order_by(TestResult.date_tested.desc())
+            reviews = session.execute(query).all()
+
+        return [
+            IterationReview(
+                uuid=result_uuid,
+                date_tested=date_tested,
+                status=status,
+                notes=notes,
+                original_tester_id=tester,
+                cosign_ids=list(cosigners),
             )
-            try:
-                reviews = session.execute(query).all()
-            except NoResultFound:
-                return []
-
-            iteration_reviews = []
-            for result_id, result_uuid, date_tested, status, notes, tester in reviews:
-                query = select(TestCosign.tester_id).where(TestCosign.test_result_id == result_id)
-                try:
-                    cosigns = [row[0] for row in session.execute(query).all()]
-                except NoResultFound:
-                    cosigns = []
-                iteration_reviews.append(
-                    IterationReview(
-                        uuid=result_uuid,
-                        date_tested=date_tested,
-                        status=status,
-                        notes=notes,
-                        original_tester_id=tester,
-                        cosign_ids=cosigns,
-                    )
-                )
-        return iteration_reviews
+            for result_uuid, date_tested, status, notes, tester, cosigners in reviews
+        ]
+
+    def signoff_tallies(self, state: State, iteration_ids: list[int]) -> dict[int, dict[TestStatus, int]]:
+        """
+        ### Count the reviews and cosigns of many iterations at once
+
+        Each review counts once, and once more for every cosign it has.
+
+        **Args:**
+        - `state` (`State`): The application state containing the database connection.
+        - `iteration_ids` (`list[int]`): The iterations to count.
+
+        **Returns:**
+        - `dict[int, dict[TestStatus, int]]`: Signoffs by status, by iteration id. Iterations without reviews are left
+          out.
+        """
+        query = (
+            select(
+                TestResult.iteration_id,
+                Review.status,
+                func.count(TestResult.id.distinct()) + func.count(TestCosign.id),
+            )
+            .join(Review, TestResult.review_id == Review.id)
+            .outerjoin(TestCosign, TestCosign.test_result_id == TestResult.id)
+            .where(TestResult.iteration_id.in_(iteration_ids))
+            .group_by(TestResult.iteration_id, Review.status)
+        )
+        tallies: dict[int, dict[TestStatus, int]] = {}
+        with state.ReadSession.begin() as session:
+            for iteration_id, status, signoffs in session.execute(query):
+                tallies.setdefault(iteration_id, {})[TestStatus(status)] = signoffs
+        return tallies
 
     def get_test_result_by_user(self, state: State, iteration: Iteration, tester: User) -> TestResult:
         """
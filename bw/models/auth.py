@@ -1,7 +1,7 @@
 import datetime
 import uuid
 from uuid import UUID
-from sqlalchemy import ForeignKey, String, func, DateTime, Boolean, UniqueConstraint, Uuid
+from sqlalchemy import ForeignKey, String, func, DateTime, Boolean, UniqueConstraint, Uuid, Computed
 from sqlalchemy.orm import Mapped, mapped_column
 
 from bw.models import Base
@@ -10,6 +10,7 @@ from bw.settings import GLOBAL_CONFIGURATION
 from bw.auth.permissions import Permissions
 from bw.auth.roles import Roles
 from bw.auth.types import DiscordSnowflake
+from bw.combined_dataclass import SlotCombiner
 
 GLOBAL_CONFIGURATION.require('default_session_length')
 GLOBAL_CONFIGURATION.require('api_session_length')
@@ -18,6 +19,12 @@ NAME_LENGTH = 64
 TOKEN_LENGTH = 32
 
 
+def flag_mask(flags: type[SlotCombiner]) -> Computed:
+    # kept up to date by the database, so the flag columns remain the only thing that is ever written
+    bits = ' | '.join(f'(CASE WHEN {slot} THEN {flags.mask_of(slot)} ELSE 0 END)' for slot in flags.__slots__)  # ty: ignore[unresolved-attribute]
+    return Computed(bits, persisted=True)
+
+
 class Role(Base):
     __tablename__ = 'user_roles'
 
@@ -30,8 +37,12 @@ class Role(Base):
     can_publish_realtime_events: Mapped[bool]
     can_manage_session: Mapped[bool]
 
+    mask: Mapped[int] = mapped_column(flag_mask(Roles))
+
+    __mapper_args__ = {'eager_defaults': True}
+
     def into_roles(self) -> Roles:
-        return Roles.from_keys(**{key: getattr(self, key) for key in Roles.__slots__})
+        return Roles.from_mask(self.mask)
 
 
 class User(Base):
@@ -65,12 +76,15 @@ class Session(Base):
     __tablename__ = 'sessions'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey(User.id, name='linked_user_for_session'), nullable=False, unique=False)
-    token: Mapped[str] = mapped_column(String(TOKEN_LENGTH), nullable=False)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey(User.id, name='linked_user_for_session'), nullable=False, unique=False, index=True
+    )
+    token: Mapped[str] = mapped_column(String(TOKEN_LENGTH), nullable=False, index=True)
     expire_time: Mapped[datetime.datetime] = mapped_column(
         DateTime(timezone=False),
         nullable=False,
         server_default=func.localtimestamp() + datetime.timedelta(seconds=int(GLOBAL_CONFIGURATION['default_session_length'])),
+        index=True,
     )
 
     @staticmethod
@@ -86,6 +100,19 @@ class Session(Base):
         return cls.now() + datetime.timedelta(seconds=int(GLOBAL_CONFIGURATION['api_session_length']))
 
 
+class SessionRevocation(Base):
+    # signed session tokens are never stored, so revoking them means bumping the generation new tokens are issued with
+    __tablename__ = 'session_revocations'
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey(User.id, name='linked_user_for_session_revocation', ondelete='CASCADE'), primary_key=True
+    )
+    generation: Mapped[int] = mapped_column(nullable=False)
+    revoked_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=False), nullable=False, server_default=func.localtimestamp()
+    )
+
+
 class GroupPermission(Base):
     __tablename__ = 'group_permissions'
 
@@ -95,8 +122,12 @@ class GroupPermission(Base):
     can_upload_mission: Mapped[bool] = mapped_column(Boolean(False), nullable=False)
     can_test_mission: Mapped[bool] = mapped_column(Boolean(False), nullable=False)
 
+    mask: Mapped[int] = mapped_column(flag_mask(Permissions))
+
+    __mapper_args__ = {'eager_defaults': True}
+
     def into_permissions(self) -> Permissions:
-        return Permissions.from_keys(**{key: getattr(self, key) for key in Permissions.__slots__})
+        return Permissions.from_mask(self.mask)
 
 
 class Group(Base):
@@ -119,6 +150,16 @@ class UserGroup(Base):
     __table_args__ = (UniqueConstraint('user_id', 'group_id', name='can_be_added_to_group_once'),)
 
 
+class EffectiveUserPermissions(Base):
+    # every group permission a user has, merged into one mask and kept up to date by `GroupStore`
+    __tablename__ = 'effective_user_permissions'
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey(User.id, name='linked_user_for_effective_permissions', ondelete='CASCADE'), primary_key=True
+    )
+    mask: Mapped[int] = mapped_column(nullable=False)
+
+
 class DiscordOAuthCode(Base):
     __tablename__ = 'discord_oauth_codes'
 
@@ -128,4 +169,5 @@ class DiscordOAuthCode(Base):
         DateTime(timezone=False),
         nullable=False,
         server_default=func.localtimestamp() + datetime.timedelta(seconds=int(GLOBAL_CONFIGURATION['default_session_length'])),
+        index=True,
     )
@@ -0,0 +1,61 @@
+import base64
+import binascii
+import datetime
+import json
+from typing import Any
+
+from bw.error import BadPageToken
+
+PageKey = int | str | datetime.datetime
+
+
+def encode_page_token(*key: PageKey) -> str:
+    """
+    ### Encode where a page ended as a continuation token
+
+    Pages are read by key rather than by offset, so the token holds the sort key of the last row handed out. Callers
+    should treat it as opaque and only pass it back to get the next page.
+
+    **Args:**
+    - `*key` (`PageKey`): The sort key of the last row on the page, in the order it is sorted by.
+
+    **Returns:**
+    - `str`: A URL safe token.
+    """
+    values = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in key]
+    encoded = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(encoded).decode().rstrip('=')
+
+
+def decode_page_token(token: str, *types: type) -> tuple[Any, ...]:
+    """
+    ### Decode a continuation token made by `encode_page_token`
+
+    **Args:**
+    - `token` (`str`): The token to decode.
+    - `*types` (`type`): The type of each part of the key.
+
+    **Raises:**
+    - `BadPageToken`: If the token was not made by `encode_page_token` for a key of these types.
+
+    **Returns:**
+    - `tuple[Any, ...]`: The sort key the token was made from.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, binascii.Error):
+        raise BadPageToken()
+    if not isinstance(values, list) or len(values) != len(types):
+        raise BadPageToken()
+
+    key = []
+    for value, kind in zip(values, types):
+        if kind is datetime.datetime and isinstance(value, str):
+            try:
+                value = datetime.datetime.fromisoformat(value)
+            except ValueError:
+                raise BadPageToken()
+        if type(value) is not kind:
+            raise BadPageToken()
+        key.append(value)
+    return tuple(key)
@@ -48,6 +48,9 @@ class Queue:
             worker.alive = False
 
     def on_event(self, event: BaseEvent):
+        if event.internal:
+            return
+
         from bw.state import State
         from bw.realtime.api import RealtimeApi
 
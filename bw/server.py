@@ -4,9 +4,10 @@ from quart import Quart
 from bw.log import setup_config as setup_log_config, log_config
 from bw.settings import GLOBAL_CONFIGURATION
 from bw.environment import ENVIRONMENT
-from bw.state import State
+from bw.state import State, run_in_db_thread
 from bw.endpoints import define as define_endpoints
 from bw.cron import runner
+from bw.auth.session import SessionStore
 import bw.response  # noqa: F401
 import multiprocessing
 import asyncio
@@ -20,13 +21,40 @@ state = State()
 define_endpoints(app)
 
 
+@app.teardown_request
+def record_request_queries(exception: BaseException | None):
+    state.sql_metrics.finish_request()
+
+
+async def delete_expired_sessions(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # deleted in batches, each of which would otherwise hold up every request on this worker
+            await run_in_db_thread(SessionStore().delete_expired, state)
+        except Exception as e:
+            app.logger.warning(f'Could not delete expired sessions: {e}')
+
+
 @app.while_serving
 async def run_message_queue():
     app.add_background_task(Queue.process_event_queue, state.queue)
+    await state.http.open()
+    reaper = None
+    if 'session_reap_interval' in GLOBAL_CONFIGURATION:
+        reaper = asyncio.create_task(delete_expired_sessions(float(GLOBAL_CONFIGURATION['session_reap_interval'])))
 
     yield
 
+    if reaper is not None:
+        reaper.cancel()
     state.queue.stop()
+    await state.http.close()
+    state.db_executor.shutdown(wait=True, cancel_futures=True)
+    try:
+        state.cache.dump_snapshot()
+    except Exception as e:
+        app.logger.warning(f'Could not write cache snapshot: {e}')
 
 
 def run():
@@ -71,6 +99,10 @@ def production():
 
         await serve(app, config)
 
+    if state.cache.l2_cache is not None:
+        print(f'Resetting shared cache at {state.cache.l2_cache.path}')
+        state.cache.l2_cache.destroy()
+
     print('Starting cron runner')
     cron_runner = multiprocessing.Process(
         target=runner.spawn,
@@ -6,7 +6,6 @@ import datetime
 from typing import Any, Self
 from collections.abc import Iterable
 from collections.abc import Collection
-import aiohttp
 import tomllib
 import tomli_w
 
@@ -153,29 +152,27 @@ async def fetch_mod_details_from_workshop(
     logger.debug(f'Using URL: {url}')
 
     details: dict[WorkshopId, SteamWorkshopDetails] = {}
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, data=params) as response:
-            if response.status != 200:
-                logger.error(f'Failed to fetch mod names ({response.status} {response.reason} {await response.text()})')
-                return {}
-            if response.content_type != 'application/json':
-                logger.error(f'Unexpected content type trying to fetch mod names: {response.content_type}')
-                return {}
-
-            json = await response.json()
-            for file in json['response']['publishedfiledetails']:
-                workshop_id = WorkshopId(file['publishedfileid'])
-                if 'result' not in file or file['result'] != 1:
-                    error_reason = file.get('reason', 'unknown')
-                    logger.warning(
-                        f'Failed to fetch details for "{mod_workshop_ids[workshop_id]}" ({workshop_id}): {error_reason}'
-                    )
-                    continue
-                if workshop_id not in mod_workshop_ids:
-                    logger.warning(f'Workshop ID {workshop_id} not found in loaded mods')
-                    logger.debug(f'{workshop_id}, {type(workshop_id)}, {[(type(wid), wid) for wid in mod_workshop_ids.keys()]}')
-                    continue
-                details[workshop_id] = SteamWorkshopDetails.from_steam_json(file)
+    # only reads details, so it is as safe to retry as a GET
+    async with State.http.request('POST', url, data=params, retry=True) as response:
+        if response.status != 200:
+            logger.error(f'Failed to fetch mod names ({response.status} {response.reason} {await response.text()})')
+            return {}
+        if response.content_type != 'application/json':
+            logger.error(f'Unexpected content type trying to fetch mod names: {response.content_type}')
+            return {}
+
+        json = await response.json()
+        for file in json['response']['publishedfiledetails']:
+            workshop_id = WorkshopId(file['publishedfileid'])
+            if 'result' not in file or file['result'] != 1:
+                error_reason = file.get('reason', 'unknown')
+                logger.warning(f'Failed to fetch details for "{mod_workshop_ids[workshop_id]}" ({workshop_id}): {error_reason}')
+                continue
+            if workshop_id not in mod_workshop_ids:
+                logger.warning(f'Workshop ID {workshop_id} not found in loaded mods')
+                logger.debug(f'{workshop_id}, {type(workshop_id)}, {[(type(wid), wid) for wid in mod_workshop_ids.keys()]}')
+                continue
+            details[workshop_id] = SteamWorkshopDetails.from_steam_json(file)
 
     return details
 
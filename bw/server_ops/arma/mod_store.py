@@ -4,6 +4,8 @@ from sqlalchemy.exc import IntegrityError
 
 from bw.server_ops.arma.mod import SteamWorkshopDetails, WorkshopId, Mod
 from bw.state import State
+from bw.cache import cached
+from bw.web_event import ModRecordCreated
 from bw.models.arma import Mod as DbMod
 from bw.error.arma_mod import (
     ModFieldInvalid,
@@ -54,8 +56,10 @@ class ModStore:
             except IntegrityError as e:
                 raise ModAlreadyExists(workshop_details.workshop_id) from e
             session.expunge(db_mod)
+        state.broker.publish(ModRecordCreated(str(workshop_details.workshop_id)))
         return db_mod
 
+    @cached('mod', expire_on=ModRecordCreated, absent=ModNotFound, cache_found=False)
     def get_mod_by_workshop_id(self, state: State, workshop_id: WorkshopId) -> DbMod:
         """
         ### Retrieve a mod by its workshop ID
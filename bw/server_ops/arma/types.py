@@ -11,6 +11,9 @@ class WorkshopId:
     def id(self) -> str:
         return self.id_
 
+    def cache_key(self) -> str:
+        return self.id
+
     def __str__(self) -> str:
         return self.id
 
@@ -5,7 +5,7 @@ from bw.missions.api import uuid_from_name_and_map, name_and_version_from_name
 from bw.session.session import SessionStore
 from uuid import UUID
 
-from bw.state import State
+from bw.state import State, in_db_thread
 from bw.response import JsonResponse, Created, BadRequest, Ok
 from bw.missions.missions import MissionStore, MissionHistoryStore
 from bw.web_utils import define_api
@@ -16,23 +16,27 @@ logger = logging.getLogger('bw.session')
 
 class SessionApi:
     @define_api
-    async def register(self) -> JsonResponse:
+    @in_db_thread
+    def register(self) -> JsonResponse:
         session = SessionStore().create_session(State.state)
         State.broker.publish(SessionStartedEvent(session=session.uuid))
         return JsonResponse({'id': session.uuid})
 
     @define_api
-    async def finish(self, session_id: UUID) -> Ok:
+    @in_db_thread
+    def finish(self, session_id: UUID) -> Ok:
         SessionStore().end_session(State.state, session_id)
         return Ok()
 
     @define_api
-    async def get_latest_session(self) -> JsonResponse:
+    @in_db_thread
+    def get_latest_session(self) -> JsonResponse:
         session = SessionStore().get_latest_session(State.state)
         return JsonResponse({'id': session.uuid})
 
     @define_api
-    async def finish_mission(
+    @in_db_thread
+    def finish_mission(
         self,
         session_id: UUID,
         mission_name_with_version: str,
@@ -45,42 +49,45 @@ class SessionApi:
 
         mission_name, _ = name_and_version_from_name(mission_name_with_version)
         mission_id = uuid_from_name_and_map(mission_name, mission_map)
-        session = SessionStore().session_with_uuid(State.state, session_id)
-        try:
-            mission = MissionStore().mission_with_uuid(State.state, mission_id)
-            iteration = MissionStore().iteration_with_mission_and_name(
-                State.state, mission, f'{mission_name_with_version}.{mission_map}'
-            )
-
-            MissionHistoryStore().add_played_mission(State.state, mission, iteration, session, starting_orbat)
-
-            State.broker.publish(
-                MissionEndedEvent(
-                    session=session.uuid,
-                    mission=mission_id,
-                    mission_name_with_version=mission_name_with_version,
-                    iteration=iteration.uuid,
-                    starting_orbat=starting_orbat,
-                    final_orbat=final_orbat,
+        # the lookups and the insert share one connection and one transaction
+        with State.state.unit_of_work():
+            session = SessionStore().session_with_uuid(State.state, session_id)
+            try:
+                mission = MissionStore().mission_with_uuid(State.state, mission_id)
+                iteration = MissionStore().iteration_with_mission_and_name(
+                    State.state, mission, f'{mission_name_with_version}.{mission_map}'
                 )
-            )
-        except Exception as err:
-            logger.warning(f'Failed to fetch mission information for {mission_id}: {err}')
-            State.broker.publish(
-                MissionEndedEvent(
-                    session=session.uuid,
-                    mission=mission_id,
-                    mission_name_with_version=mission_name_with_version,
-                    iteration=UUID(int=0),
-                    starting_orbat=starting_orbat,
-                    final_orbat=final_orbat,
+
+                MissionHistoryStore().add_played_mission(State.state, mission, iteration, session, starting_orbat)
+            except Exception as err:
+                logger.warning(f'Failed to fetch mission information for {mission_id}: {err}')
+                State.broker.publish(
+                    MissionEndedEvent(
+                        session=session.uuid,
+                        mission=mission_id,
+                        mission_name_with_version=mission_name_with_version,
+                        iteration=UUID(int=0),
+                        starting_orbat=starting_orbat,
+                        final_orbat=final_orbat,
+                    )
                 )
+                raise
+
+        State.broker.publish(
+            MissionEndedEvent(
+                session=session.uuid,
+                mission=mission_id,
+                mission_name_with_version=mission_name_with_version,
+                iteration=iteration.uuid,
+                starting_orbat=starting_orbat,
+                final_orbat=final_orbat,
             )
-            raise
+        )
         return Created()
 
     @define_api
-    async def safe_start_ended(
+    @in_db_thread
+    def safe_start_ended(
         self,
         session_id: UUID,
         mission_name_with_version: str,
@@ -92,30 +99,31 @@ class SessionApi:
 
         mission_name, _ = name_and_version_from_name(mission_name_with_version)
         mission_id = uuid_from_name_and_map(mission_name, mission_map)
-        session = SessionStore().session_with_uuid(State.state, session_id)
-        try:
-            mission = MissionStore().mission_with_uuid(State.state, mission_id)
-            iteration = MissionStore().iteration_with_mission_and_name(
-                State.state, mission, f'{mission_name_with_version}.{mission_map}'
-            )
-
-            State.broker.publish(
-                SafeStartOffEvent(
-                    session=session.uuid,
-                    mission=mission_id,
-                    iteration=iteration.uuid,
-                    orbat=orbat,
+        with State.state.unit_of_work():
+            session = SessionStore().session_with_uuid(State.state, session_id)
+            try:
+                mission = MissionStore().mission_with_uuid(State.state, mission_id)
+                iteration = MissionStore().iteration_with_mission_and_name(
+                    State.state, mission, f'{mission_name_with_version}.{mission_map}'
                 )
-            )
-        except Exception as err:
-            logger.warning(f'Failed to fetch mission information for {mission_id}: {err}')
-            State.broker.publish(
-                SafeStartOffEvent(
-                    session=session.uuid,
-                    mission=mission_id,
-                    iteration=UUID(int=0),
-                    orbat=orbat,
+            except Exception as err:
+                logger.warning(f'Failed to fetch mission information for {mission_id}: {err}')
+                State.broker.publish(
+                    SafeStartOffEvent(
+                        session=session.uuid,
+                        mission=mission_id,
+                        iteration=UUID(int=0),
+                        orbat=orbat,
+                    )
                 )
+                raise
+
+        State.broker.publish(
+            SafeStartOffEvent(
+                session=session.uuid,
+                mission=mission_id,
+                iteration=iteration.uuid,
+                orbat=orbat,
             )
-            raise
+        )
         return Created()
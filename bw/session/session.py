@@ -5,12 +5,14 @@ import datetime
 
 from bw.models.session import Session
 from bw.state import State
+from bw.cache import cached
+from bw.web_event.session import SessionStartedEvent
 from bw.error import SessionDoesNotExist, NoSessionsRegistered, SessionAlreadyEnded
 
 
 class SessionStore:
     def create_session(self, state: State) -> Session:
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             arma_session = Session()
             session.add(arma_session)
             session.flush()
@@ -18,7 +20,7 @@ class SessionStore:
         return arma_session
 
     def end_session(self, state: State, session_id: UUID):
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(Session).where(Session.uuid == session_id)
             try:
                 arma_session = session.execute(query).one()[0]
@@ -31,7 +33,7 @@ class SessionStore:
             arma_session.finish_date = datetime.datetime.now()
 
     def get_latest_session(self, state: State) -> Session:
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(Session).where(Session.finish_date.is_(None)).order_by(Session.start_date.desc())
             arma_session = session.execute(query).scalar()
             if not arma_session:
@@ -39,8 +41,9 @@ class SessionStore:
             session.expunge(arma_session)
         return arma_session
 
+    @cached('session', expire_on=SessionStartedEvent, absent=SessionDoesNotExist, cache_found=False)
     def session_with_uuid(self, state: State, session_id: UUID) -> Session:
-        with state.Session.begin() as session:
+        with state.transaction() as session:
             query = select(Session).where(Session.uuid == session_id)
             try:
                 arma_session = session.execute(query).one()[0]
@@ -1,21 +1,80 @@
 import logging
 import asyncio
-from sqlalchemy import create_engine, Engine
-from sqlalchemy.orm import sessionmaker, Session
+import contextlib
+import contextvars
+import functools
+from collections.abc import Awaitable, Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from quart import g, has_app_context
+from sqlalchemy import create_engine, event, Engine
+from sqlalchemy.orm import sessionmaker, Session, ORMExecuteState
 
 from bw.environment import ENVIRONMENT, Test
 from bw.settings import GLOBAL_CONFIGURATION
 from bw.cache import Cache
+from bw.db_metrics import QueryMetrics
+from bw.db_pool import PoolOptions
+from bw.http_client import HttpClients
 from bw.events import Broker
 from bw.realtime.queue import Queue
 
 logger = logging.getLogger('bw.state')
 
+_unit_of_work: contextvars.ContextVar[Session | None] = contextvars.ContextVar('unit_of_work', default=None)
+
+
+def pin_to_primary():
+    """
+    ### Send the rest of the current request's reads to the primary database
+
+    Called whenever a request commits a write, so anything it reads afterwards sees that write instead of a replica
+    which has not caught up yet.
+    """
+    if has_app_context():
+        g.db_pinned_to_primary = True
+
+
+def pinned_to_primary() -> bool:
+    # outside of a request there is nothing to scope a pin to, so reads stay on the primary to be safe
+    return not has_app_context() or g.get('db_pinned_to_primary', False)
+
+
+def _note_write(execute_state: ORMExecuteState):
+    if execute_state.is_insert or execute_state.is_update or execute_state.is_delete:
+        execute_state.session.info['wrote'] = True
+
+
+def _note_flush(session: Session, flush_context):
+    session.info['wrote'] = True
+
+
+def _pin_after_write(session: Session):
+    if session.info.pop('wrote', False):
+        pin_to_primary()
+
+
+def _forget_write(session: Session):
+    session.info.pop('wrote', None)
+
 
 class DatabaseConnection:
+    replica: Engine | None
+    read_session_maker: sessionmaker[Session] | None
+
     def __init__(self, engine):
         self.engine = engine
         self.session_maker = sessionmaker(self.engine)
+        self.replica = None
+        self.read_session_maker = None
+
+        event.listen(self.session_maker, 'do_orm_execute', _note_write)
+        event.listen(self.session_maker, 'after_flush', _note_flush)
+        event.listen(self.session_maker, 'after_commit', _pin_after_write)
+        event.listen(self.session_maker, 'after_rollback', _forget_write)
+
+    def attach_replica(self, replica: Engine):
+        self.replica = replica
+        self.read_session_maker = sessionmaker(replica)
 
 
 class State:
@@ -23,12 +82,21 @@ class State:
     cache: Cache = None  # ty: ignore[invalid-assignment]
     broker: Broker = None  # ty: ignore[invalid-assignment]
     queue: Queue = None  # ty: ignore[invalid-assignment]
+    http: HttpClients = None  # ty: ignore[invalid-assignment]
+    db_executor: ThreadPoolExecutor = None  # ty: ignore[invalid-assignment]
+    sql_metrics: QueryMetrics = None  # ty: ignore[invalid-assignment]
 
     def _connection(self) -> str:
         return ENVIRONMENT.db_connection()
 
-    def _setup_engine(self, echo, db_name: str):
-        return create_engine(f'{self._connection()}/{db_name}', echo=echo)
+    def _replica_connection(self) -> str | None:
+        return ENVIRONMENT.db_replica_connection()
+
+    def _setup_engine(self, echo, db_name: str, connection: str | None = None):
+        connection = connection if connection is not None else self._connection()
+        engine = create_engine(f'{connection}/{db_name}', echo=echo, **self.pool_options.engine_arguments())
+        self.sql_metrics.instrument(engine)
+        return engine
 
     def _load_arma_configs(self):
         if isinstance(ENVIRONMENT, Test):
@@ -50,6 +118,13 @@ class State:
         State.broker = Broker()
         State.queue = Queue(State.broker, GLOBAL_CONFIGURATION.get('queue_delay', 5))
         State.cache = Cache()
+        State.http = HttpClients()
+        State.sql_metrics = QueryMetrics()
+
+        self.pool_options = PoolOptions.from_config()
+        # a thread per connection the pool can hand out, so no thread sits waiting on a checkout by default
+        db_threads = int(GLOBAL_CONFIGURATION.get('db_threads', self.pool_options.max_connections))
+        State.db_executor = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix='bw-db')
 
         self.engine_map = {}
         State.state = self
@@ -62,7 +137,19 @@ class State:
         State.broker.subscribe_all(self.cache.event)
 
     def register_database(self, database_name: str, echo=False):
-        self.engine_map[database_name] = DatabaseConnection(self._setup_engine(echo=echo, db_name=database_name))
+        connection = DatabaseConnection(self._setup_engine(echo=echo, db_name=database_name))
+        replica_connection = self._replica_connection()
+        if replica_connection is not None:
+            connection.attach_replica(self._setup_engine(echo=echo, db_name=database_name, connection=replica_connection))
+        self.engine_map[database_name] = connection
+
+    def pool_report(self) -> dict[str, dict]:
+        report = {}
+        for name, connection in self.engine_map.items():
+            report[name] = connection.engine.pool.report()
+            if connection.replica is not None:
+                report[f'{name}:replica'] = connection.replica.pool.report()
+        return report
 
     @property
     def default_engine(self) -> DatabaseConnection:
@@ -75,3 +162,116 @@ class State:
     @property
     def Session(self) -> sessionmaker[Session]:
         return self.default_engine.session_maker
+
+    @contextlib.contextmanager
+    def unit_of_work(self) -> Iterator[Session]:
+        """
+        ### Run every opted-in store call inside the block on one connection and in one transaction
+
+        Stores which open their transactions with `State.transaction` join the unit of work instead of checking out a
+        connection and committing on their own. Everything is committed when the block exits, or rolled back if it
+        raises. Cache invalidations made inside the block are made again after the commit. Opening a unit of work
+        inside another joins the outer one.
+
+        A unit of work belongs to the thread that opened it, so open it inside whatever runs on the database thread.
+
+        **Example:**
+        ```python
+        with state.unit_of_work():
+            session = SessionStore().session_with_uuid(state, session_id)
+            MissionHistoryStore().add_played_mission(state, mission, iteration, session, orbat)
+        ```
+        """
+        current = _unit_of_work.get()
+        if current is not None:
+            yield current
+            return
+
+        with self.cache.repeating_invalidations(), self.Session.begin() as session:
+            token = _unit_of_work.set(session)
+            try:
+                yield session
+            finally:
+                _unit_of_work.reset(token)
+
+    @contextlib.contextmanager
+    def transaction(self, savepoint: bool = False) -> Iterator[Session]:
+        """
+        ### Begin a transaction, or join the current unit of work
+
+        **Args:**
+        - `savepoint` (`bool`): Inside a unit of work, run the block in a savepoint so a database error it catches
+          does not abort the whole unit.
+
+        **Example:**
+        ```python
+        with state.transaction() as session:
+            session.execute(query)
+        ```
+        """
+        current = _unit_of_work.get()
+        if current is None:
+            with self.Session.begin() as session:
+                yield session
+        elif savepoint:
+            with current.begin_nested():
+                yield current
+        else:
+            yield current
+
+    @property
+    def ReadSession(self) -> sessionmaker[Session]:
+        """
+        ### Sessions for reads which can tolerate replication lag
+
+        Goes to the replica when `db_replica_address` is configured, and to the primary otherwise. A request which has
+        written anything reads from the primary from then on, so it always sees its own writes. Results read from a
+        replica may be slightly behind, so they must not be cached against invalidations made by writes.
+        """
+        connection = self.default_engine
+        if connection.read_session_maker is None or pinned_to_primary():
+            return connection.session_maker
+        return connection.read_session_maker
+
+
+async def run_in_db_thread[**P, R](func: Callable[P, R], /, *args: P.args, **kwargs: P.kwargs) -> R:
+    """
+    ### Run blocking database work without stalling the event loop
+
+    The call runs on one of the worker's database threads, in a copy of the caller's context so the request and
+    app contexts are still available to it.
+
+    **Args:**
+    - `func` (`Callable[P, R]`): The blocking function to call, e.g. a Store or Api method.
+    - `*args`, `**kwargs`: Passed on to `func`.
+
+    **Returns:**
+    - `R`: Whatever `func` returns. Whatever it raises is raised here.
+
+    **Example:**
+    ```python
+    user = await run_in_db_thread(UserStore().user_from_id, state, 1)
+    ```
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(State.db_executor, call)
+
+
+def in_db_thread[**P, R](func: Callable[P, R]) -> Callable[P, Awaitable[R]]:
+    """
+    ### Make a blocking function awaitable by running it on a database thread
+
+    **Example:**
+    ```python
+    @define_api
+    @in_db_thread
+    def register(self) -> JsonResponse: ...
+    ```
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        return await run_in_db_thread(func, *args, **kwargs)
+
+    return wrapper
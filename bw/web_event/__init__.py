@@ -6,12 +6,24 @@ from bw.web_event.mission import (
     MissionUploadEvent as MissionUploadEvent,
     IterationCosignedEvent as IterationCosignedEvent,
     IterationReviewedEvent as IterationReviewedEvent,
+    MissionTypeChangedEvent as MissionTypeChangedEvent,
+)
+from bw.web_event.auth import (
+    AuthEvent as AuthEvent,
+    RoleEvent as RoleEvent,
+    RoleChangedEvent as RoleChangedEvent,
+    UserRoleChangedEvent as UserRoleChangedEvent,
+    GroupEvent as GroupEvent,
+    GroupPermissionChangedEvent as GroupPermissionChangedEvent,
+    GroupMembershipChangedEvent as GroupMembershipChangedEvent,
+    GroupDeletedEvent as GroupDeletedEvent,
 )
 from bw.web_event.arma_ops import (
     ArmaServerManagementEvent as ArmaServerManagementEvent,
     ReloadedServerConfig as ReloadedServerConfig,
     ReloadedModlistConfig as ReloadedModlistConfig,
     ModAdded as ModAdded,
+    ModRecordCreated as ModRecordCreated,
     ModlistAdded as ModlistAdded,
     ModsDeployed as ModsDeployed,
     KeysDeployed as KeysDeployed,
@@ -29,6 +29,14 @@ class ModAdded(ArmaServerManagementEvent, event='mod_added'):
         return {'mod_name': self.mod_name, 'workshop_id': self.workshop_id}
 
 
+@dataclass
+class ModRecordCreated(ArmaServerManagementEvent, event='mod_record_created', internal=True):
+    workshop_id: str
+
+    def data(self) -> dict[str, Any]:
+        return {'workshop_id': self.workshop_id}
+
+
 @dataclass
 class FoundOutOfDateMods(ArmaServerManagementEvent, event='found out of date mods'):
     mods: list[dict[str, Any]]
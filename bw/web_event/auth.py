@@ -0,0 +1,56 @@
+from bw.web_event import BaseEvent
+from dataclasses import dataclass
+from typing import Any
+
+
+class AuthEvent(BaseEvent, namespace='auth', abstract=True, internal=True):
+    pass
+
+
+class RoleEvent(AuthEvent, abstract=True):
+    pass
+
+
+class GroupEvent(AuthEvent, abstract=True):
+    pass
+
+
+@dataclass
+class RoleChangedEvent(RoleEvent, event='role_changed'):
+    role: str
+
+    def data(self) -> dict[str, Any]:
+        return {'role': self.role}
+
+
+@dataclass
+class UserRoleChangedEvent(RoleEvent, event='user_role_changed'):
+    user: int
+
+    def data(self) -> dict[str, Any]:
+        return {'user': self.user}
+
+
+@dataclass
+class GroupPermissionChangedEvent(GroupEvent, event='group_permission_changed'):
+    permission: str
+
+    def data(self) -> dict[str, Any]:
+        return {'permission': self.permission}
+
+
+@dataclass
+class GroupMembershipChangedEvent(GroupEvent, event='group_membership_changed'):
+    user: int
+    group: int
+
+    def data(self) -> dict[str, Any]:
+        return {'user': self.user, 'group': self.group}
+
+
+@dataclass
+class GroupDeletedEvent(GroupEvent, event='group_deleted'):
+    group: str
+
+    def data(self) -> dict[str, Any]:
+        return {'group': self.group}
@@ -27,6 +27,7 @@ class MetaEvent(type):
         namespace: str | None = None,
         retry: int | None = None,
         abstract: bool = False,
+        internal: bool | None = None,
     ):
         super().__init__(name, bases, attrs)
 
@@ -44,6 +45,12 @@ class MetaEvent(type):
         elif not hasattr(cls, 'retry'):
             cls.retry = None
 
+        # internal events only ever reach in-process subscribers, they are never pushed out to clients
+        if internal is not None:
+            cls.internal = internal
+        elif not hasattr(cls, 'internal'):
+            cls.internal = False
+
         if not hasattr(cls, 'id'):
             cls.id = None
 
@@ -65,6 +72,7 @@ class BaseEvent(metaclass=MetaEvent):
     event: str
     namespace: str | None
     retry: int | None
+    internal: bool
     id: str | None
 
     def encoded_string(self) -> str:
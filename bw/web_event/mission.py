@@ -32,3 +32,11 @@ class IterationCosignedEvent(MissionEvent, event='cosigned'):
 
     def data(self) -> dict[str, Any]:
         return {'review': self.review}
+
+
+@dataclass
+class MissionTypeChangedEvent(MissionEvent, event='type_changed', internal=True):
+    name: str
+
+    def data(self) -> dict[str, Any]:
+        return {'name': self.name}
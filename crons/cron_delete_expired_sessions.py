@@ -0,0 +1,19 @@
+from bw.environment import ENVIRONMENT
+from crons.cron import Cron
+import aiohttp
+
+
+class DeleteExpiredSessions(Cron):
+    @staticmethod
+    def cron_str() -> str:
+        """
+        Returns a cron-encoded string defining when this job will be run next
+        """
+        return '17 * * * *'
+
+    async def request(self, session: aiohttp.ClientSession) -> None:
+        print('Deleting expired sessions')
+        async with session.post(f'{ENVIRONMENT.server_url()}/api/v1/admin/sessions/delete_expired') as request:
+            request.raise_for_status()
+            deleted = await request.json()
+            print(f'Deleted {deleted["sessions"]} sessions and {deleted["discord_oauth_codes"]} OAuth codes')
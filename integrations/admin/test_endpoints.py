@@ -0,0 +1,125 @@
+# ruff: noqa: F811, F401
+
+import pytest
+
+from integrations.fixtures import state, session, test_app
+from integrations.auth.fixtures import (
+    token_1,
+    db_user_1,
+    db_session_1,
+    role_name_1,
+    role_1,
+    db_role_1,
+    role_name_2,
+    role_2,
+    db_role_2,
+)
+from bw.auth.user import UserStore
+
+
+@pytest.fixture(scope='session')
+def endpoint_admin_cache_url() -> str:
+    return '/api/v1/admin/cache'
+
+
+@pytest.mark.asyncio
+async def test__cache_stats__requires_authentication(state, session, test_app, endpoint_admin_cache_url):
+    response = await test_app.get(endpoint_admin_cache_url)
+
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test__cache_stats__requires_can_manage_server(
+    state, session, test_app, db_user_1, db_session_1, role_name_1, db_role_1, endpoint_admin_cache_url
+):
+    UserStore().assign_user_role(state, db_user_1, role_name_1)
+
+    response = await test_app.get(endpoint_admin_cache_url, headers={'Authorization': f'Bearer {db_session_1.token}'})
+
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test__cache_stats__reports_cache_tiers(
+    state, session, test_app, db_user_1, db_session_1, role_name_2, db_role_2, endpoint_admin_cache_url
+):
+    UserStore().assign_user_role(state, db_user_1, role_name_2)
+
+    response = await test_app.get(
+        f'{endpoint_admin_cache_url}?largest=1', headers={'Authorization': f'Bearer {db_session_1.token}'}
+    )
+
+    assert response.status_code == 200
+    report = await response.get_json()
+    assert report['l2'] is None
+    # the session lookup made while authorising this request went through the cache
+    assert report['l1']['namespaces']['auth']['inserts'] >= 1
+    assert len(report['l1']['largest_entries']) == 1
+
+
+@pytest.mark.asyncio
+async def test__delete_expired_sessions__requires_can_manage_server(
+    state, session, test_app, db_user_1, db_session_1, role_name_1, db_role_1
+):
+    UserStore().assign_user_role(state, db_user_1, role_name_1)
+
+    response = await test_app.post(
+        '/api/v1/admin/sessions/delete_expired', headers={'Authorization': f'Bearer {db_session_1.token}'}
+    )
+
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test__delete_expired_sessions__reports_deleted_rows(
+    state, session, test_app, db_user_1, db_session_1, role_name_2, db_role_2
+):
+    UserStore().assign_user_role(state, db_user_1, role_name_2)
+
+    response = await test_app.post(
+        '/api/v1/admin/sessions/delete_expired', headers={'Authorization': f'Bearer {db_session_1.token}'}
+    )
+
+    assert response.status_code == 200
+    assert await response.get_json() == {'sessions': 0, 'discord_oauth_codes': 0}
+
+
+@pytest.mark.asyncio
+async def test__pool_stats__requires_can_manage_server(state, session, test_app, db_user_1, db_session_1, role_name_1, db_role_1):
+    UserStore().assign_user_role(state, db_user_1, role_name_1)
+
+    response = await test_app.get('/api/v1/admin/db/pool', headers={'Authorization': f'Bearer {db_session_1.token}'})
+
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test__pool_stats__reports_default_pool(state, session, test_app, db_user_1, db_session_1, role_name_2, db_role_2):
+    UserStore().assign_user_role(state, db_user_1, role_name_2)
+
+    response = await test_app.get('/api/v1/admin/db/pool', headers={'Authorization': f'Bearer {db_session_1.token}'})
+
+    assert response.status_code == 200
+    pool = (await response.get_json())['pools'][state.default_database]
+    assert pool['size'] == state.pool_options.size
+    assert pool['checkouts'] >= 1
+    assert pool['timeouts'] == 0
+
+
+@pytest.mark.asyncio
+async def test__query_stats__reports_queries_by_endpoint(
+    state, session, test_app, db_user_1, db_session_1, role_name_2, db_role_2
+):
+    UserStore().assign_user_role(state, db_user_1, role_name_2)
+    headers = {'Authorization': f'Bearer {db_session_1.token}'}
+
+    await test_app.get('/api/v1/admin/db/queries', headers=headers)
+    response = await test_app.get('/api/v1/admin/db/queries', headers=headers)
+
+    assert response.status_code == 200
+    report = await response.get_json()
+    assert report['slow_query_ms'] == state.sql_metrics.slow_query_seconds * 1000
+    endpoint = report['endpoints']['bw_api.admin.query_stats']
+    assert endpoint['requests'] >= 1
+    assert endpoint['queries'] >= endpoint['requests']
@@ -466,12 +466,17 @@ def make_mock_discord_response():
 
     def _make_response(discord_id: int, should_raise: bool = False, error_status: int = 401):
         class MockSessionObject:
+            status = error_status if should_raise else 200
+
             async def __aenter__(self):
                 return self
 
             async def __aexit__(self, *_args, **_kwargs):
                 pass
 
+            def release(self):
+                pass
+
             def raise_for_status(self):
                 if should_raise:
                     import aiohttp
@@ -70,12 +70,17 @@ async def test__login_with_discord__can_login_when_user_exists(
     mocker, state, session, token_1, token_2, expire_valid, discord_id_1, db_discord_user_1
 ):
     class MockSessionObject:
+        status = 200
+
         async def __aenter__(self):
             return self
 
         async def __aexit__(self, *_args, **_kwargs):
             pass
 
+        def release(self):
+            pass
+
         def raise_for_status(self):
             pass
 
@@ -85,7 +90,7 @@ async def test__login_with_discord__can_login_when_user_exists(
     mocker.patch('secrets.token_urlsafe', return_value=token_1)
     mocker.patch('bw.models.auth.Session.human_session_length', return_value=expire_valid)
     mocker.patch('bw.auth.api.ENVIRONMENT.discord_api_url', return_value='https://example.com')
-    mocker.patch('bw.auth.api.aiohttp.ClientSession.get', return_value=MockSessionObject())
+    mocker.patch('bw.http_client.aiohttp.ClientSession._request', return_value=MockSessionObject())
 
     response = await AuthApi().login_with_discord(state, token_2)
     assert response.status_code == 200
@@ -98,12 +103,17 @@ async def test__login_with_discord__nonexistant_id_creates_user(
     mocker, state, session, expire_valid, token_1, token_2, discord_id_1
 ):
     class MockSessionObject:
+        status = 200
+
         async def __aenter__(self):
             return self
 
         async def __aexit__(self, *_args, **_kwargs):
             pass
 
+        def release(self):
+            pass
+
         def raise_for_status(self):
             pass
 
@@ -113,7 +123,7 @@ async def test__login_with_discord__nonexistant_id_creates_user(
     mocker.patch('secrets.token_urlsafe', return_value=token_1)
     mocker.patch('bw.models.auth.Session.human_session_length', return_value=expire_valid)
     mocker.patch('bw.auth.api.ENVIRONMENT.discord_api_url', return_value='https://example.com')
-    mocker.patch('bw.auth.api.aiohttp.ClientSession.get', return_value=MockSessionObject())
+    mocker.patch('bw.http_client.aiohttp.ClientSession._request', return_value=MockSessionObject())
 
     response = await AuthApi().login_with_discord(state, token_2)
     assert response.status_code == 200
@@ -124,12 +134,17 @@ async def test__login_with_discord__nonexistant_id_creates_user(
 @pytest.mark.asyncio
 async def test__login_with_discord__bad_token_fails(mocker, state, session, token_1, token_2, db_discord_user_1):
     class MockSessionObject:
+        status = 200
+
         async def __aenter__(self):
             return self
 
         async def __aexit__(self, *_args, **_kwargs):
             pass
 
+        def release(self):
+            pass
+
         def raise_for_status(self):
             raise aiohttp.ClientResponseError(None, None, status=401, message='bad')
 
@@ -139,12 +154,55 @@ async def test__login_with_discord__bad_token_fails(mocker, state, session, toke
     mocker.patch('secrets.token_urlsafe', return_value=token_1)
     mocker.patch('bw.models.auth.Session.human_session_length', return_value=expire_valid)
     mocker.patch('bw.auth.api.ENVIRONMENT.discord_api_url', return_value='https://example.com')
-    mocker.patch('bw.auth.api.aiohttp.ClientSession.get', return_value=MockSessionObject())
+    mocker.patch('bw.http_client.aiohttp.ClientSession._request', return_value=MockSessionObject())
 
     response = await AuthApi().login_with_discord(state, token_2)
     assert response.status_code == 401
 
 
+@pytest.mark.asyncio
+async def test__login_with_discord__relogin_skips_discord(mocker, state, session, token_2, discord_id_1, db_discord_user_1):
+    class MockSessionObject:
+        status = 200
+
+        def release(self):
+            pass
+
+        def raise_for_status(self):
+            pass
+
+        async def json(self) -> dict:
+            return {'id': db_discord_user_1.discord_id}
+
+    mocker.patch('bw.auth.api.ENVIRONMENT.discord_api_url', return_value='https://example.com')
+    request = mocker.patch('bw.http_client.aiohttp.ClientSession._request', return_value=MockSessionObject())
+
+    first = await AuthApi().login_with_discord(state, token_2)
+    second = await AuthApi().login_with_discord(state, token_2)
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert request.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test__login_with_discord__rejected_token_not_remembered(mocker, state, session, token_2, db_discord_user_1):
+    class MockSessionObject:
+        status = 401
+
+        def release(self):
+            pass
+
+        def raise_for_status(self):
+            raise aiohttp.ClientResponseError(None, None, status=401, message='bad')
+
+    mocker.patch('bw.auth.api.ENVIRONMENT.discord_api_url', return_value='https://example.com')
+    request = mocker.patch('bw.http_client.aiohttp.ClientSession._request', return_value=MockSessionObject())
+
+    assert (await AuthApi().login_with_discord(state, token_2)).status_code == 401
+    assert (await AuthApi().login_with_discord(state, token_2)).status_code == 401
+    assert request.call_count == 2
+
+
 def test__login_with_bot__can_login_when_user_exists(mocker, state, session, token_1, expire_valid):
     mocker.patch('secrets.token_urlsafe', return_value=token_1)
     mocker.patch('bw.models.auth.Session.api_session_length', return_value=expire_valid)
@@ -409,18 +467,17 @@ def test__auth_api__user_info_different_users_different_data(state, session, db_
 
 def test__list_all_users__empty_database_returns_empty_json(state, session):
     """Test that empty database returns empty users list"""
-    response = AuthApi().list_all_users(state, page=1, page_size=50)
+    response = AuthApi().list_all_users(state, page_size=50, include_total=True)
     assert response.status_code == 200
     assert response.contained_json['users'] == []
     assert response.contained_json['total'] == 0
-    assert response.contained_json['page'] == 1
     assert response.contained_json['page_size'] == 50
-    assert response.contained_json['total_pages'] == 0
+    assert response.contained_json['next'] is None
 
 
 def test__list_all_users__single_user_returns_correct_structure(state, session, db_user_1):
     """Test that single user returns correct JSON structure"""
-    response = AuthApi().list_all_users(state, page=1, page_size=50)
+    response = AuthApi().list_all_users(state, page_size=50, include_total=True)
     assert response.status_code == 200
     assert len(response.contained_json['users']) == 1
     assert response.contained_json['total'] == 1
@@ -432,12 +489,11 @@ def test__list_all_users__pagination_works(state, session):
     for _ in range(3):
         UserStore().create_user(state)
 
-    response = AuthApi().list_all_users(state, page=1, page_size=2)
+    response = AuthApi().list_all_users(state, page_size=2)
     assert response.status_code == 200
     assert len(response.contained_json['users']) == 2
-    assert response.contained_json['total'] == 3
-    assert response.contained_json['page'] == 1
-    assert response.contained_json['total_pages'] == 2
+    assert response.contained_json['next'] is not None
+    assert 'total' not in response.contained_json
 
 
 def test__list_all_users__second_page_works(state, session):
@@ -446,10 +502,17 @@ def test__list_all_users__second_page_works(state, session):
     for _ in range(3):
         UserStore().create_user(state)
 
-    response = AuthApi().list_all_users(state, page=2, page_size=2)
+    first = AuthApi().list_all_users(state, page_size=2)
+    response = AuthApi().list_all_users(state, page_size=2, continue_from=first.contained_json['next'])
     assert response.status_code == 200
     assert len(response.contained_json['users']) == 1
-    assert response.contained_json['page'] == 2
+    assert response.contained_json['next'] is None
+
+
+def test__list_all_users__malformed_token_is_bad_request(state, session):
+    """Test that a malformed continuation token is rejected"""
+    response = AuthApi().list_all_users(state, continue_from='%%%')
+    assert response.status_code == 400
 
 
 def test__list_all_users__default_pagination_values(state, session):
@@ -458,8 +521,8 @@ def test__list_all_users__default_pagination_values(state, session):
 
     response = AuthApi().list_all_users(state)
     assert response.status_code == 200
-    assert response.contained_json['page'] == 1
     assert response.contained_json['page_size'] == 50
+    assert response.contained_json['next'] is None
 
 
 # Tests for get_all_roles
@@ -63,6 +63,7 @@ from bw.auth.user import UserStore
 from bw.auth.group import GroupStore
 from bw.auth.session import SessionStore
 from bw.auth.roles import Roles
+from bw.state import run_in_db_thread
 
 
 @pytest.mark.asyncio
@@ -72,14 +73,14 @@ async def test__login_bot__session_created_with_bot(state, session, test_app, en
     data = await response.get_json()
     assert 'session_token' in data
 
-    assert SessionStore().is_session_active(state, data['session_token'])
+    assert await run_in_db_thread(SessionStore().is_session_active, state, data['session_token'])
 
 
 @pytest.mark.asyncio
 async def test__login_bot__session_not_created_no_bot(state, session, test_app, endpoint_login_bot_url):
     response = await test_app.post(endpoint_login_bot_url, json={'bot_token': 'fooet'})
     assert response.status_code == 404
-    assert not SessionStore().is_session_active(state, 'fooet')
+    assert not await run_in_db_thread(SessionStore().is_session_active, state, 'fooet')
 
 
 @pytest.mark.asyncio
@@ -181,7 +182,7 @@ async def test__assign_role__can_assign_role(
         headers={'Authorization': f'Bearer {db_session_1.token}'},
     )
     assert response.status_code == 200
-    assert UserStore().get_users_role(state, db_user_1).as_dict() == db_role_1.into_roles().as_dict()
+    assert (await run_in_db_thread(UserStore().get_users_role, state, db_user_1)).as_dict() == db_role_1.into_roles().as_dict()
 
 
 @pytest.mark.asyncio
@@ -194,7 +195,7 @@ async def test__assign_role__cant_assign_if_not_permitted(
         headers={'Authorization': f'Bearer {db_session_1.token}'},
     )
     assert response.status_code == 403
-    assert UserStore().get_users_role(state, db_user_1) is None
+    assert await run_in_db_thread(UserStore().get_users_role, state, db_user_1) is None
 
 
 @pytest.mark.asyncio
@@ -217,7 +218,7 @@ async def test__assign_role__cant_assign_if_expired_session(
         headers={'Authorization': f'Bearer {db_expired_session_1.token}'},
     )
     assert response.status_code == 401
-    assert UserStore().get_users_role(state, db_user_2) is None
+    assert await run_in_db_thread(UserStore().get_users_role, state, db_user_2) is None
 
 
 @pytest.mark.asyncio
@@ -232,7 +233,7 @@ async def test__assign_role__cant_assign_nonexistent(
         headers={'Authorization': f'Bearer {db_session_1.token}'},
     )
     assert response.status_code == 404
-    assert UserStore().get_users_role(state, db_user_2) is None
+    assert await run_in_db_thread(UserStore().get_users_role, state, db_user_2) is None
 
 
 @pytest.mark.asyncio
@@ -324,7 +325,7 @@ async def test__local_assign_role__can_local_assign_role(
             headers={'Authorization': f'Bearer {db_session_1.token}'},
         )
     assert response.status_code == 200
-    assert UserStore().get_users_role(state, db_user_1).as_dict() == db_role_1.into_roles().as_dict()
+    assert (await run_in_db_thread(UserStore().get_users_role, state, db_user_1)).as_dict() == db_role_1.into_roles().as_dict()
 
 
 @pytest.mark.asyncio
@@ -350,7 +351,7 @@ async def test__local_assign_role__cant_assign_if_expired_session(
             headers={'Authorization': f'Bearer {db_expired_session_1.token}'},
         )
     assert response.status_code == 401
-    assert UserStore().get_users_role(state, db_user_2) is None
+    assert await run_in_db_thread(UserStore().get_users_role, state, db_user_2) is None
 
 
 @pytest.mark.asyncio
@@ -368,7 +369,7 @@ async def test__local_assign_role__cant_assign_nonexistent(
             headers={'Authorization': f'Bearer {db_session_1.token}'},
         )
     assert response.status_code == 404
-    assert UserStore().get_users_role(state, db_user_2) is None
+    assert await run_in_db_thread(UserStore().get_users_role, state, db_user_2) is None
 
 
 @pytest.mark.asyncio
@@ -610,7 +611,7 @@ async def test__login_discord__creates_session_for_existing_user(
     mocker.patch('secrets.token_urlsafe', return_value=token_1)
     mocker.patch('bw.models.auth.Session.human_session_length', return_value=expire_valid)
     mocker.patch('bw.auth.api.ENVIRONMENT.discord_api_url', return_value='https://discord.com/api')
-    mocker.patch('bw.auth.api.aiohttp.ClientSession.get', return_value=mock_response)
+    mocker.patch('bw.http_client.aiohttp.ClientSession._request', return_value=mock_response)
 
     response = await test_app.post('/api/v1/auth/login/discord', headers={'Authorization': f'Bearer {discord_token_1}'})
 
@@ -630,7 +631,7 @@ async def test__login_discord__creates_new_user_for_new_discord_id(
     mocker.patch('secrets.token_urlsafe', return_value=token_1)
     mocker.patch('bw.models.auth.Session.human_session_length', return_value=expire_valid)
     mocker.patch('bw.auth.api.ENVIRONMENT.discord_api_url', return_value='https://discord.com/api')
-    mocker.patch('bw.auth.api.aiohttp.ClientSession.get', return_value=mock_response)
+    mocker.patch('bw.http_client.aiohttp.ClientSession._request', return_value=mock_response)
 
     response = await test_app.post('/api/v1/auth/login/discord', headers={'Authorization': f'Bearer {discord_token_2}'})
 
@@ -648,7 +649,7 @@ async def test__login_discord__returns_401_for_invalid_token(
     mock_response = make_mock_discord_response(discord_id=discord_id_1, should_raise=True, error_status=401)
 
     mocker.patch('bw.auth.api.ENVIRONMENT.discord_api_url', return_value='https://discord.com/api')
-    mocker.patch('bw.auth.api.aiohttp.ClientSession.get', return_value=mock_response)
+    mocker.patch('bw.http_client.aiohttp.ClientSession._request', return_value=mock_response)
 
     response = await test_app.post('/api/v1/auth/login/discord', headers={'Authorization': f'Bearer {invalid_discord_token}'})
 
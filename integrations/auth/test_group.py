@@ -12,7 +12,7 @@ from bw.error import (
     GroupAssignmentFailed,
     NoGroupWithName,
 )
-from bw.models.auth import GroupPermission, Group, UserGroup
+from bw.models.auth import GroupPermission, Group, UserGroup, EffectiveUserPermissions
 from bw.auth.group import GroupStore
 from integrations.auth.fixtures import (
     state,
@@ -255,6 +255,59 @@ def test__get_all_permissions_user_has__user_has_expected_permissions_from_many_
     assert combined.as_dict() == permissions.as_dict()
 
 
+def test__get_all_permissions_user_has__cached_permissions_expire_on_group_changes(
+    state, session, db_user_1, db_group_1, db_permission_1, permission_2
+):
+    assert not any(GroupStore().get_all_permissions_user_has(state, db_user_1).as_dict().values())
+
+    GroupStore().assign_user_to_group(state, db_user_1, db_group_1)
+    permissions = GroupStore().get_all_permissions_user_has(state, db_user_1)
+    assert db_permission_1.into_permissions().as_dict() == permissions.as_dict()
+
+    GroupStore().edit_permission(state, db_permission_1.name, permission_2)
+    assert GroupStore().get_all_permissions_user_has(state, db_user_1).as_dict() == permission_2.as_dict()
+
+    GroupStore().remove_user_from_group(state, db_user_1, db_group_1)
+    assert not any(GroupStore().get_all_permissions_user_has(state, db_user_1).as_dict().values())
+
+
+def effective_mask(state, user):
+    with state.Session.begin() as session:
+        return session.scalar(select(EffectiveUserPermissions.mask).where(EffectiveUserPermissions.user_id == user.id))
+
+
+def test__effective_permissions__follow_group_membership(state, session, db_user_1, db_group_1, db_group_2):
+    assert effective_mask(state, db_user_1) is None
+
+    GroupStore().assign_user_to_group(state, db_user_1, db_group_1)
+    assert effective_mask(state, db_user_1) == Permissions(can_upload_mission=True).mask
+
+    GroupStore().assign_user_to_group(state, db_user_1, db_group_2)
+    assert effective_mask(state, db_user_1) == Permissions(can_upload_mission=True, can_test_mission=True).mask
+
+    GroupStore().remove_user_from_group(state, db_user_1, db_group_1)
+    assert effective_mask(state, db_user_1) == Permissions(can_test_mission=True).mask
+
+
+def test__effective_permissions__follow_permission_edits(
+    state, session, db_user_1, db_user_2, db_group_1, db_permission_1, permission_2
+):
+    GroupStore().assign_user_to_group(state, db_user_1, db_group_1)
+    GroupStore().assign_user_to_group(state, db_user_2, db_group_1)
+
+    GroupStore().edit_permission(state, db_permission_1.name, permission_2)
+    assert effective_mask(state, db_user_1) == permission_2.mask
+    assert effective_mask(state, db_user_2) == permission_2.mask
+
+
+def test__effective_permissions__follow_group_deletion(state, session, db_user_1, db_group_1, db_group_2):
+    GroupStore().assign_user_to_group(state, db_user_1, db_group_1)
+    GroupStore().assign_user_to_group(state, db_user_1, db_group_2)
+
+    GroupStore().delete_group(state, db_group_1.name)
+    assert effective_mask(state, db_user_1) == Permissions(can_test_mission=True).mask
+
+
 def test__get_group__can_get_existing_group(state, session, db_group_1):
     group = GroupStore().get_group(state, db_group_1.name)
     assert group.id == db_group_1.id
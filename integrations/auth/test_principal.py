@@ -0,0 +1,125 @@
+# ruff: noqa: F811, F401
+
+import types
+import pytest
+
+from sqlalchemy import delete
+
+from bw.auth.group import GroupStore
+from bw.auth.permissions import Permissions
+from bw.auth.principal import PrincipalStore, session_token_key
+from bw.auth.session import SessionStore
+from bw.auth.user import UserStore
+from bw.cache import Cache
+from bw.environment import ENVIRONMENT
+from bw.error import SessionExpired
+from bw.models.auth import Session
+from integrations.auth.fixtures import (
+    state,
+    session,
+    token_1,
+    expire_invalid,
+    db_user_1,
+    db_session_1,
+    db_expired_session_1,
+    role_name_1,
+    role_1,
+    db_role_1,
+    permission_1,
+    permission_2,
+    permission_name_1,
+    permission_name_2,
+    db_permission_1,
+    db_permission_2,
+    group_name_1,
+    group_name_2,
+    db_group_1,
+    db_group_2,
+)
+
+
+def test__principal_store__load_principal__no_session(state, session):
+    with pytest.raises(SessionExpired):
+        PrincipalStore().load_principal(state, 'no token')
+
+
+def test__principal_store__load_principal__expired_session(state, session, db_expired_session_1, token_1):
+    with pytest.raises(SessionExpired):
+        PrincipalStore().load_principal(state, token_1)
+
+
+def test__principal_store__load_principal__user_without_role_or_groups(state, session, db_user_1, db_session_1, token_1):
+    principal = PrincipalStore().load_principal(state, token_1)
+
+    assert principal.user.id == db_user_1.id
+    assert principal.session_expire_time == db_session_1.expire_time
+    assert principal.roles is None
+    assert principal.permissions == Permissions()
+
+
+def test__principal_store__load_principal__role_and_merged_permissions(
+    state, session, db_user_1, db_session_1, token_1, role_name_1, role_1, db_role_1, db_group_1, db_group_2
+):
+    UserStore().assign_user_role(state, db_user_1, role_name_1)
+    GroupStore().assign_user_to_group(state, db_user_1, db_group_1)
+    GroupStore().assign_user_to_group(state, db_user_1, db_group_2)
+
+    principal = PrincipalStore().load_principal(state, token_1)
+
+    assert principal.roles == role_1
+    assert principal.permissions == Permissions(can_upload_mission=True, can_test_mission=True)
+    assert principal.roles == UserStore().get_users_role(state, db_user_1)
+    assert principal.permissions == GroupStore().get_all_permissions_user_has(state, db_user_1)
+
+
+def test__principal_store__load_principal__cached_until_revoked(state, session, db_user_1, db_session_1, token_1):
+    PrincipalStore().load_principal(state, token_1)
+    with state.Session.begin() as db_session:
+        db_session.execute(delete(Session).where(Session.token == token_1))
+
+    # served from the cache without looking at the sessions table
+    assert PrincipalStore().load_principal(state, token_1).user.id == db_user_1.id
+
+    SessionStore().expire_session_from_user(state, db_user_1)
+    with pytest.raises(SessionExpired):
+        PrincipalStore().load_principal(state, token_1)
+
+
+def test__principal_store__load_principal__cache_key_hides_token(state, session, db_session_1, token_1):
+    PrincipalStore().load_principal(state, token_1)
+
+    key = session_token_key(token_1)
+    assert token_1 not in key
+    assert key in state.cache.l1_cache.entry_map
+
+
+def test__principal_store__load_principal__role_change_expires_cached_principal(
+    state, session, db_user_1, db_session_1, token_1, role_name_1, role_1, db_role_1
+):
+    assert PrincipalStore().load_principal(state, token_1).roles is None
+
+    UserStore().assign_user_role(state, db_user_1, role_name_1)
+
+    assert PrincipalStore().load_principal(state, token_1).roles == role_1
+
+
+def test__principal_store__load_principal__revocation_reaches_other_workers(
+    mocker, tmp_path, state, session, db_user_1, db_session_1, token_1
+):
+    mocker.patch.object(ENVIRONMENT, 'l2_cache_path', return_value=tmp_path / 'l2.sqlite3')
+    worker_1 = types.SimpleNamespace(Session=state.Session, cache=Cache())
+    worker_2 = types.SimpleNamespace(Session=state.Session, cache=Cache())
+    try:
+        PrincipalStore().load_principal(worker_1, token_1)
+        PrincipalStore().load_principal(worker_2, token_1)
+
+        getpid = mocker.patch('bw.cache.l2.os.getpid', return_value=-1)
+        worker_2.cache.l2_cache.close()
+        SessionStore().expire_session_from_user(worker_2, db_user_1)
+        mocker.stop(getpid)
+
+        with pytest.raises(SessionExpired):
+            PrincipalStore().load_principal(worker_1, token_1)
+    finally:
+        worker_1.cache.l2_cache.close()
+        worker_2.cache.l2_cache.close()
@@ -1,11 +1,17 @@
 # ruff: noqa: F811, F401
 
+import types
 import pytest
 from datetime import datetime
 
-from sqlalchemy import select
+from sqlalchemy import select, event
 
+from bw.auth.principal import PrincipalStore
 from bw.auth.session import SessionStore
+from bw.auth.token import is_signed_token
+from bw.auth.user import UserStore
+from bw.cache import Cache
+from bw.environment import ENVIRONMENT
 from bw.models.auth import Session, DiscordOAuthCode
 from bw.error import SessionExpired, NoAccessCodeFound
 from integrations.auth.fixtures import (
@@ -28,6 +34,7 @@ from integrations.auth.fixtures import (
     db_oauth_code_1,
     db_oauth_code_2,
     db_oauth_code_expired,
+    db_expired_session_1,
 )
 
 
@@ -265,3 +272,115 @@ def test__session_store__start_user_session_raises_on_failure(mocker, state, ses
 
     with pytest.raises(SessionExpired):
         SessionStore().start_user_session(state, db_user_1)
+
+
+@pytest.fixture
+def signing_key(mocker):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'session_signing_key': 'correct horse battery staple'})
+
+
+def test__session_store__signed_session_resolves_without_database(signing_key, state, session, db_user_1):
+    token = SessionStore().start_user_session(state, db_user_1)['session_token']
+    assert is_signed_token(token)
+    assert SessionStore().get_user_from_session_token(state, token).id == db_user_1.id
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(state.Engine, 'before_cursor_execute', count)
+    try:
+        principal = PrincipalStore().load_principal(state, token)
+    finally:
+        event.remove(state.Engine, 'before_cursor_execute', count)
+
+    assert principal.user.id == db_user_1.id
+    assert statements == []
+
+
+def test__session_store__signed_session_is_not_stored(signing_key, state, session, db_user_1):
+    SessionStore().start_api_session(state, db_user_1)
+    with state.Session.begin() as session:
+        assert session.execute(select(Session).where(Session.user_id == db_user_1.id)).first() is None
+
+
+def test__session_store__signed_session_expiring_stops_session(signing_key, state, session, db_user_1, db_user_2):
+    token_1 = SessionStore().start_user_session(state, db_user_1)['session_token']
+    token_2 = SessionStore().start_user_session(state, db_user_2)['session_token']
+    assert SessionStore().is_session_active(state, token_1)
+
+    SessionStore().expire_session_from_user(state, db_user_1)
+    assert not SessionStore().is_session_active(state, token_1)
+    assert SessionStore().is_session_active(state, token_2)
+
+    token_3 = SessionStore().start_user_session(state, db_user_1)['session_token']
+    assert SessionStore().is_session_active(state, token_3)
+
+
+def test__session_store__signed_api_session_replaces_previous(signing_key, state, session, db_user_1):
+    first = SessionStore().start_api_session(state, db_user_1)['session_token']
+    second = SessionStore().start_api_session(state, db_user_1)['session_token']
+    assert not SessionStore().is_session_active(state, first)
+    assert SessionStore().is_session_active(state, second)
+
+
+def test__session_store__opaque_sessions_still_work_with_signing_key(mocker, token_1, expire_valid, state, session, db_user_1):
+    mocker.patch('secrets.token_urlsafe', return_value=token_1)
+    SessionStore().start_user_session(state, db_user_1)
+
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'session_signing_key': 'correct horse battery staple'})
+    assert SessionStore().is_session_active(state, token_1)
+    SessionStore().expire_session_from_user(state, db_user_1)
+    assert not SessionStore().is_session_active(state, token_1)
+
+
+def test__session_store__signed_session_of_deleted_user_is_refused(signing_key, state, session):
+    user = UserStore().create_user(state)
+    token = SessionStore().start_user_session(state, user)['session_token']
+    UserStore().delete_user(state, user)
+    assert not SessionStore().is_session_active(state, token)
+
+
+def test__session_store__signed_session_revocation_reaches_other_workers(
+    mocker, tmp_path, signing_key, state, session, db_user_1
+):
+    mocker.patch.object(ENVIRONMENT, 'l2_cache_path', return_value=tmp_path / 'l2.sqlite3')
+    worker_1 = types.SimpleNamespace(Session=state.Session, cache=Cache())
+    worker_2 = types.SimpleNamespace(Session=state.Session, cache=Cache())
+    try:
+        token = SessionStore().start_user_session(worker_1, db_user_1)['session_token']
+        PrincipalStore().load_principal(worker_1, token)
+        PrincipalStore().load_principal(worker_2, token)
+
+        getpid = mocker.patch('bw.cache.l2.os.getpid', return_value=-1)
+        worker_2.cache.l2_cache.close()
+        SessionStore().expire_session_from_user(worker_2, db_user_1)
+        mocker.stop(getpid)
+
+        with pytest.raises(SessionExpired):
+            PrincipalStore().load_principal(worker_1, token)
+    finally:
+        worker_1.cache.l2_cache.close()
+        worker_2.cache.l2_cache.close()
+
+
+def test__session_store__delete_expired__only_deletes_expired(
+    state, session, db_expired_session_1, db_session_2, db_oauth_code_expired, db_oauth_code_2
+):
+    assert SessionStore().delete_expired(state) == {'sessions': 1, 'discord_oauth_codes': 1}
+
+    with state.Session.begin() as session:
+        assert session.scalars(select(Session.id)).all() == [db_session_2.id]
+        assert session.scalars(select(DiscordOAuthCode.state)).all() == [db_oauth_code_2.state]
+
+
+def test__session_store__delete_expired__deletes_in_batches(state, session, db_user_1, expire_invalid):
+    with state.Session.begin() as session:
+        session.add_all(
+            Session(user_id=db_user_1.id, token=f'expired {i}', expire_time=datetime.fromisoformat(expire_invalid))
+            for i in range(5)
+        )
+
+    assert SessionStore().delete_expired(state, batch_size=2) == {'sessions': 5, 'discord_oauth_codes': 0}
+    assert SessionStore().delete_expired(state, batch_size=2) == {'sessions': 0, 'discord_oauth_codes': 0}
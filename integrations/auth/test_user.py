@@ -2,12 +2,21 @@
 
 import pytest
 
-from sqlalchemy import select
+from sqlalchemy import select, event
 
+from bw.auth.types import DiscordSnowflake
 from bw.auth.user import UserStore
 from bw.auth.group import GroupStore
 from bw.models.auth import User, DiscordUser, BotUser, Role, Session, UserGroup
-from bw.error import DbError, NoUserWithGivenCredentials, AuthError, RoleCreationFailed, NoRoleWithName, DiscordUserAlreadyExists
+from bw.error import (
+    BadPageToken,
+    DbError,
+    NoUserWithGivenCredentials,
+    AuthError,
+    RoleCreationFailed,
+    NoRoleWithName,
+    DiscordUserAlreadyExists,
+)
 from integrations.auth.fixtures import (
     state,
     session,
@@ -220,6 +229,45 @@ def test__delete_discord_user__raises_on_bad_argument(state, session):
         UserStore().delete_discord_user(state, None)
 
 
+def count_statements(state, func):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(state.Engine, 'before_cursor_execute', count)
+    try:
+        result = func()
+    finally:
+        event.remove(state.Engine, 'before_cursor_execute', count)
+    return result, len(statements)
+
+
+def test__user_from_discord_id__cached(state, session, db_user_1, db_discord_user_1):
+    UserStore().user_from_discord_id(state, db_discord_user_1.discord_id)
+
+    user, statements = count_statements(state, lambda: UserStore().user_from_discord_id(state, db_discord_user_1.discord_id))
+    assert user.id == db_user_1.id
+    assert statements == 0
+
+
+def test__user_from_discord_id__link_expires_missing_user(state, session, db_user_1, discord_id_1):
+    with pytest.raises(NoUserWithGivenCredentials):
+        UserStore().user_from_discord_id(state, discord_id_1)
+
+    UserStore().link_discord_user(state, discord_id_1, db_user_1)
+    assert UserStore().user_from_discord_id(state, discord_id_1).id == db_user_1.id
+
+
+@pytest.mark.parametrize('delete_by', ['user', 'discord_user'])
+def test__user_from_discord_id__delete_expires_cached_user(state, session, db_user_1, db_discord_user_1, delete_by):
+    UserStore().user_from_discord_id(state, db_discord_user_1.discord_id)
+
+    UserStore().delete_discord_user(state, db_user_1 if delete_by == 'user' else db_discord_user_1)
+    with pytest.raises(NoUserWithGivenCredentials):
+        UserStore().user_from_discord_id(state, db_discord_user_1.discord_id)
+
+
 def test__delete_bot_user__deletes_bot_user_from_user(state, session, db_bot_user_1, db_user_1):
     UserStore().delete_bot_user(state, db_user_1)
 
@@ -274,6 +322,14 @@ def test__edit_role__can_edit_role(state, session, role_1, role_2):
         assert db_role.into_roles().as_dict() == role_2.as_dict()
 
 
+def test__create_role__mask_kept_by_database(state, session, role_1, role_2):
+    created = UserStore().create_role(state, 'my_role', role_1)
+    assert created.mask == role_1.mask
+
+    edited = UserStore().edit_role(state, 'my_role', role_2)
+    assert edited.mask == role_2.mask
+
+
 def test__edit_role__cant_edit_non_existing_role(state, session, role_1):
     with pytest.raises(NoRoleWithName):
         UserStore().edit_role(state, 'my_role', role_1)
@@ -334,6 +390,17 @@ def test__get_users_role__none_returned_if_no_role(state, session, db_user_1):
     assert UserStore().get_users_role(state, db_user_1) is None
 
 
+def test__get_users_role__cached_role_expires_on_assignment(state, session, db_user_1, role_1, role_2):
+    UserStore().create_role(state, 'role', role_1)
+    assert UserStore().get_users_role(state, db_user_1) is None
+
+    UserStore().assign_user_role(state, db_user_1, 'role')
+    assert UserStore().get_users_role(state, db_user_1).as_dict() == role_1.as_dict()
+
+    UserStore().edit_role(state, 'role', role_2)
+    assert UserStore().get_users_role(state, db_user_1).as_dict() == role_2.as_dict()
+
+
 def test__edit_role__does_not_change_other_roles(state, session, role_1, role_2):
     UserStore().create_role(state, 'role_a', role_1)
     role_b = UserStore().create_role(state, 'role_b', role_2)
@@ -360,20 +427,18 @@ def test__get_all_roles__no_roles_empty(state, session):
 
 def test__get_all_users_paginated__empty_database_returns_empty_list(state, session):
     """Test that pagination works with no users in database"""
-    result = UserStore().get_all_users_paginated(state, page=1, page_size=50)
+    result = UserStore().get_all_users_paginated(state, page_size=50, include_total=True)
     assert result['users'] == []
     assert result['total'] == 0
-    assert result['page'] == 1
     assert result['page_size'] == 50
-    assert result['total_pages'] == 0
+    assert result['next'] is None
 
 
 def test__get_all_users_paginated__single_user_returns_correct_data(state, session, db_user_1):
     """Test that single user is returned with correct structure"""
-    result = UserStore().get_all_users_paginated(state, page=1, page_size=50)
+    result = UserStore().get_all_users_paginated(state, page_size=50)
     assert len(result['users']) == 1
-    assert result['total'] == 1
-    assert result['total_pages'] == 1
+    assert result['next'] is None
 
     user = result['users'][0]
     assert user['id'] == db_user_1.id
@@ -387,10 +452,9 @@ def test__get_all_users_paginated__single_user_returns_correct_data(state, sessi
 
 def test__get_all_users_paginated__multiple_users_returns_all(state, session, db_user_1, db_user_2):
     """Test that multiple users are returned"""
-    result = UserStore().get_all_users_paginated(state, page=1, page_size=50)
+    result = UserStore().get_all_users_paginated(state, page_size=50, include_total=True)
     assert len(result['users']) == 2
     assert result['total'] == 2
-    assert result['total_pages'] == 1
 
 
 def test__get_all_users_paginated__user_with_role_returns_role_name(state, session, db_user_1, role_1, role_name_1):
@@ -398,7 +462,7 @@ def test__get_all_users_paginated__user_with_role_returns_role_name(state, sessi
     UserStore().create_role(state, role_name_1, role_1)
     UserStore().assign_user_role(state, db_user_1, role_name_1)
 
-    result = UserStore().get_all_users_paginated(state, page=1, page_size=50)
+    result = UserStore().get_all_users_paginated(state, page_size=50)
     user = result['users'][0]
     assert user['role'] == role_name_1
 
@@ -408,14 +472,14 @@ def test__get_all_users_paginated__user_with_groups_returns_group_names(state, s
     GroupStore().assign_user_to_group(state, db_user_1, db_group_1)
     GroupStore().assign_user_to_group(state, db_user_1, db_group_2)
 
-    result = UserStore().get_all_users_paginated(state, page=1, page_size=50)
+    result = UserStore().get_all_users_paginated(state, page_size=50)
     user = result['users'][0]
     assert set(user['groups']) == {db_group_1.name, db_group_2.name}
 
 
 def test__get_all_users_paginated__user_with_discord_shows_connected(state, session, db_user_1, db_discord_user_1):
     """Test that Discord connection is shown"""
-    result = UserStore().get_all_users_paginated(state, page=1, page_size=50)
+    result = UserStore().get_all_users_paginated(state, page_size=50)
     user = result['users'][0]
     assert user['connected_apps']['discord'] is True
     assert user['connected_apps']['bot'] is False
@@ -423,7 +487,7 @@ def test__get_all_users_paginated__user_with_discord_shows_connected(state, sess
 
 def test__get_all_users_paginated__user_with_bot_shows_connected(state, session, db_user_1, db_bot_user_1):
     """Test that bot connection is shown"""
-    result = UserStore().get_all_users_paginated(state, page=1, page_size=50)
+    result = UserStore().get_all_users_paginated(state, page_size=50)
     user = result['users'][0]
     assert user['connected_apps']['discord'] is False
     assert user['connected_apps']['bot'] is True
@@ -433,7 +497,7 @@ def test__get_all_users_paginated__user_with_both_connections_shows_both(
     state, session, db_user_1, db_discord_user_1, db_bot_user_1
 ):
     """Test that both connections are shown"""
-    result = UserStore().get_all_users_paginated(state, page=1, page_size=50)
+    result = UserStore().get_all_users_paginated(state, page_size=50)
     user = result['users'][0]
     assert user['connected_apps']['discord'] is True
     assert user['connected_apps']['bot'] is True
@@ -446,12 +510,11 @@ def test__get_all_users_paginated__pagination_first_page(state, session):
     UserStore().create_user(state)
     UserStore().create_user(state)
 
-    result = UserStore().get_all_users_paginated(state, page=1, page_size=2)
+    result = UserStore().get_all_users_paginated(state, page_size=2)
     assert len(result['users']) == 2
-    assert result['total'] == 3
-    assert result['page'] == 1
     assert result['page_size'] == 2
-    assert result['total_pages'] == 2
+    assert result['next'] is not None
+    assert 'total' not in result
 
 
 def test__get_all_users_paginated__pagination_second_page(state, session):
@@ -461,20 +524,27 @@ def test__get_all_users_paginated__pagination_second_page(state, session):
     UserStore().create_user(state)
     UserStore().create_user(state)
 
-    result = UserStore().get_all_users_paginated(state, page=2, page_size=2)
+    first = UserStore().get_all_users_paginated(state, page_size=2)
+    result = UserStore().get_all_users_paginated(state, page_size=2, continue_from=first['next'])
     assert len(result['users']) == 1
-    assert result['total'] == 3
-    assert result['page'] == 2
-    assert result['total_pages'] == 2
+    assert result['next'] is None
+
+
+def test__get_all_users_paginated__exact_last_page_has_no_next(state, session):
+    """Test that a page which ends exactly at the last user does not point at an empty page"""
+    for _ in range(4):
+        UserStore().create_user(state)
+
+    first = UserStore().get_all_users_paginated(state, page_size=2)
+    result = UserStore().get_all_users_paginated(state, page_size=2, continue_from=first['next'])
+    assert len(result['users']) == 2
+    assert result['next'] is None
 
 
-def test__get_all_users_paginated__pagination_beyond_last_page_returns_empty(state, session, db_user_1):
-    """Test requesting page beyond available data"""
-    result = UserStore().get_all_users_paginated(state, page=5, page_size=50)
-    assert len(result['users']) == 0
-    assert result['total'] == 1
-    assert result['page'] == 5
-    assert result['total_pages'] == 1
+def test__get_all_users_paginated__malformed_token_raises(state, session, db_user_1):
+    """Test that a token not handed out by the store is rejected"""
+    with pytest.raises(BadPageToken):
+        UserStore().get_all_users_paginated(state, page_size=2, continue_from='not a token')
 
 
 def test__get_all_users_paginated__custom_page_size(state, session):
@@ -483,43 +553,65 @@ def test__get_all_users_paginated__custom_page_size(state, session):
     for _ in range(10):
         UserStore().create_user(state)
 
-    result = UserStore().get_all_users_paginated(state, page=1, page_size=3)
+    result = UserStore().get_all_users_paginated(state, page_size=3, include_total=True)
     assert len(result['users']) == 3
     assert result['total'] == 10
-    assert result['total_pages'] == 4
 
 
-def test__get_all_users_paginated__total_pages_calculation_exact_division(state, session):
-    """Test total pages when users divide evenly into page size"""
-    # Create 6 users
-    for _ in range(6):
-        UserStore().create_user(state)
-
-    result = UserStore().get_all_users_paginated(state, page=1, page_size=3)
-    assert result['total_pages'] == 2
-
-
-def test__get_all_users_paginated__total_pages_calculation_with_remainder(state, session):
-    """Test total pages when users don't divide evenly"""
-    # Create 7 users
-    for _ in range(7):
-        UserStore().create_user(state)
+def test__get_all_users_paginated__total_is_cached(state, session):
+    """Test that the total is not recounted on every page"""
+    UserStore().create_user(state)
+    assert UserStore().get_all_users_paginated(state, include_total=True)['total'] == 1
+    UserStore().create_user(state)
+    assert UserStore().get_all_users_paginated(state, include_total=True)['total'] == 1
 
-    result = UserStore().get_all_users_paginated(state, page=1, page_size=3)
-    assert result['total_pages'] == 3
+    state.cache.clear()
+    assert UserStore().get_all_users_paginated(state, include_total=True)['total'] == 2
 
 
 def test__get_all_users_paginated__users_ordered_consistently(state, session):
-    """Test that users are returned in consistent order across pages"""
-    # Create 5 users
+    """Test that walking every page visits every user exactly once"""
     users = []
     for _ in range(5):
         users.append(UserStore().create_user(state))
 
-    page1 = UserStore().get_all_users_paginated(state, page=1, page_size=3)
-    page2 = UserStore().get_all_users_paginated(state, page=2, page_size=3)
+    page1 = UserStore().get_all_users_paginated(state, page_size=3)
+    # users created while paging do not shift later pages
+    UserStore().create_user(state)
+    page2 = UserStore().get_all_users_paginated(state, page_size=3, continue_from=page1['next'])
+
+    page1_ids = [user['id'] for user in page1['users']]
+    page2_ids = [user['id'] for user in page2['users']]
+    assert page1_ids + page2_ids[:2] == [user.id for user in users]
+    assert len(set(page1_ids) & set(page2_ids)) == 0
 
-    # Should have no overlapping user IDs
-    page1_ids = {user['id'] for user in page1['users']}
-    page2_ids = {user['id'] for user in page2['users']}
-    assert len(page1_ids & page2_ids) == 0
+
+@pytest.mark.parametrize('page_size', [1, 10, 50])
+def test__get_all_users_paginated__query_count_does_not_grow_with_page(
+    state, session, page_size, role_1, role_name_1, db_role_1, db_group_1, db_group_2
+):
+    """Test that a page costs the same number of queries however many users it holds"""
+    for i in range(page_size):
+        user = UserStore().create_user(state)
+        UserStore().assign_user_role(state, user, role_name_1)
+        GroupStore().assign_user_to_group(state, user, db_group_1)
+        GroupStore().assign_user_to_group(state, user, db_group_2)
+        UserStore().link_discord_user(state, DiscordSnowflake(str(1000 + i)), user)
+        UserStore().link_bot_user(state, user)
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(state.Engine, 'before_cursor_execute', count)
+    try:
+        result = UserStore().get_all_users_paginated(state, page_size=page_size)
+    finally:
+        event.remove(state.Engine, 'before_cursor_execute', count)
+
+    assert len(result['users']) == page_size
+    assert all(user['role'] == role_name_1 for user in result['users'])
+    assert all(user['groups'] == sorted([db_group_1.name, db_group_2.name]) for user in result['users'])
+    assert all(user['connected_apps'] == {'discord': True, 'bot': True} for user in result['users'])
+    assert len(statements) == 1
@@ -9,6 +9,7 @@ import csv
 import shutil
 from bw.response import JsonResponse, Created, WebResponse
 from bw.missions.api import MissionsApi, TestApi
+from bw.missions.response import MissionSignoffResponse
 from bw.error import CouldNotCreateIteration, HemttError
 from bw.missions.missions import MissionStore
 from bw.missions.pbo import MissionLoader
@@ -271,6 +272,13 @@ class TestMissionsApi:
         resp = await MissionsApi().get_mission_information(state, mission_uuid=UUID(int=0))
         assert resp.status_code == 404
 
+    def test__signoffs_for_missions__tallies_newest_iteration(
+        self, state, session, db_mission_1, db_iteration_1, db_iteration_2, db_test_result_1, db_test_result_2
+    ):
+        signoffs = MissionsApi().signoffs_for_missions(state, [db_mission_1.uuid, UUID(int=0)])
+        assert signoffs[db_mission_1.uuid] == MissionSignoffResponse(iteration_count=2, passed_signoffs=0, failed_signoffs=1)
+        assert signoffs[UUID(int=0)] == MissionSignoffResponse(iteration_count=0, passed_signoffs=0, failed_signoffs=0)
+
 
 # god i love naming conventions
 class TestTestApi:
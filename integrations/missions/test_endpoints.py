@@ -0,0 +1,35 @@
+# ruff: noqa: F811, F401
+
+import pytest
+
+from bw.db_metrics import assert_query_budget
+from integrations.fixtures import test_app
+from integrations.missions.fixtures import (
+    state,
+    session,
+    db_user_1,
+    db_user_2,
+    db_mission_type_1,
+    db_mission_type_2,
+    db_mission_1,
+    db_mission_1_1,
+    db_mission_1_2,
+    db_iteration_1,
+    db_iteration_2,
+    db_review_1,
+    db_review_2,
+    db_test_result_1,
+    db_test_result_1_2,
+    db_test_cosign_1,
+)
+
+
+@pytest.mark.asyncio
+async def test__missions_list__queries_do_not_grow_with_missions(
+    state, session, test_app, db_mission_1, db_mission_1_1, db_mission_1_2, db_test_result_1, db_test_result_1_2, db_test_cosign_1
+):
+    with assert_query_budget(state.Engine, 3):
+        response = await test_app.get('/api/v1/html/missions/list')
+
+    assert response.status_code == 200
+    assert db_mission_1.title in (await response.get_data(as_text=True))
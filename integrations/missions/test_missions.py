@@ -1,11 +1,18 @@
 # ruff: noqa: F811, F401
 
+import datetime
 from uuid import uuid4
 import pytest
 import uuid
-from sqlalchemy import select
-
-from bw.error import CouldNotCreateMissionType, NoMissionTypeWithName, CouldNotCreateIteration, MissionDoesNotExist
+from sqlalchemy import select, update
+
+from bw.error import (
+    BadPageToken,
+    CouldNotCreateMissionType,
+    NoMissionTypeWithName,
+    CouldNotCreateIteration,
+    MissionDoesNotExist,
+)
 from bw.models.missions import Mission, MissionType, Iteration
 from bw.missions.missions import MissionStore, MissionTypeStore
 from integrations.missions.fixtures import (
@@ -262,6 +269,48 @@ class TestMissionStore:
     def test__iteration_with_mission_and_name__no_filename_raises(self, state, session):
         pass
 
+    def test__get_missions_by_page__newest_first(self, state, session, db_mission_1, db_mission_1_1, db_mission_1_2):
+        missions, next_page = MissionStore().get_missions_by_page(state, 10)
+        assert [mission.id for mission, _, _ in missions] == [db_mission_1_2.id, db_mission_1_1.id, db_mission_1.id]
+        assert next_page is None
+
+    def test__get_missions_by_page__walks_every_page(self, state, session, db_mission_1, db_mission_1_1, db_mission_1_2):
+        first, next_page = MissionStore().get_missions_by_page(state, 2)
+        assert len(first) == 2
+        assert next_page is not None
+
+        second, next_page = MissionStore().get_missions_by_page(state, 2, next_page)
+        assert [mission.id for mission, _, _ in second] == [db_mission_1.id]
+        assert next_page is None
+
+    def test__get_missions_by_page__same_creation_date_is_not_skipped(
+        self, state, session, db_mission_1, db_mission_1_1, db_mission_1_2
+    ):
+        with state.Session.begin() as session:
+            session.execute(update(Mission).values(creation_date=datetime.datetime(2025, 1, 1)))
+
+        seen = []
+        next_page = None
+        while True:
+            missions, next_page = MissionStore().get_missions_by_page(state, 1, next_page)
+            seen.extend(mission.id for mission, _, _ in missions)
+            if next_page is None:
+                break
+        assert seen == [db_mission_1_2.id, db_mission_1_1.id, db_mission_1.id]
+
+    def test__get_missions_by_page__malformed_token_raises(self, state, session, db_mission_1):
+        with pytest.raises(BadPageToken):
+            MissionStore().get_missions_by_page(state, 2, 'WzFd')
+
+    def test__latest_iterations__newest_iteration_and_count(
+        self, state, session, db_mission_1, db_mission_1_1, db_iteration_1, db_iteration_2
+    ):
+        latest = MissionStore().latest_iterations(state, [db_mission_1.uuid, db_mission_1_1.uuid])
+        assert latest.keys() == {db_mission_1.uuid}
+        iteration, iteration_count = latest[db_mission_1.uuid]
+        assert iteration.id == db_iteration_2.id
+        assert iteration_count == 2
+
 
 class TestMissionHistoryStore:
     def test__add_played_mission__object_created(self, state, session):
@@ -22,6 +22,7 @@ from integrations.missions.fixtures import (
     db_user_2,
     db_test_result_2,
     db_test_result_1_2,
+    db_test_cosign_1,
 )
 
 
@@ -180,3 +181,11 @@ def test__test_store__remove_cosign__removes_cosign_from_iteration_reviews(
     assert review_failed.notes == db_review_2.notes
     assert review_failed.original_tester_id == db_user_2.id
     assert len(review_failed.cosign_ids) == 0
+
+
+def test__test_store__signoff_tallies__counts_results_and_cosigns(
+    state, session, db_iteration_1, db_iteration_2, db_test_result_1, db_test_result_1_2, db_test_cosign_1
+):
+    tallies = TestStore().signoff_tallies(state, [db_iteration_1.id, db_iteration_2.id])
+    assert tallies[db_iteration_1.id] == {TestStatus.PASSED: 2, TestStatus.FAILED: 1}
+    assert db_iteration_2.id not in tallies
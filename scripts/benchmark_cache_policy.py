@@ -0,0 +1,73 @@
+import argparse
+import random
+from pathlib import Path
+from bw.cache.l1 import L1Cache, policy_from_config
+
+POLICIES = ('lru', 'tinylfu')
+
+
+def synthetic_trace(requests: int, seed: int) -> list[tuple[str, int]]:
+    """
+    ### Build an access trace shaped like production traffic
+
+    Most requests look up a small, skewed working set of sessions and permissions. Every so often somebody pages
+    through the whole mission list, touching every mission exactly once.
+    """
+    rng = random.Random(seed)
+    sessions = [f'session:{i}' for i in range(400)]
+    permissions = [f'permissions:{i}' for i in range(100)]
+    missions = [f'mission:{i}' for i in range(3000)]
+    weights = [1 / (rank + 1) for rank in range(len(sessions))]
+
+    trace = []
+    while len(trace) < requests:
+        if rng.random() < 0.0002:
+            trace.extend((mission, 512) for mission in missions)
+            continue
+        trace.append((rng.choices(sessions, weights)[0], 256))
+        trace.append((rng.choice(permissions), 128))
+    return trace[:requests]
+
+
+def load_trace(path: Path) -> list[tuple[str, int]]:
+    # one access per line, `key` or `key size`
+    trace = []
+    with open(path) as file:
+        for line in file:
+            parts = line.split()
+            if not parts:
+                continue
+            trace.append((parts[0], int(parts[1]) if len(parts) > 1 else 256))
+    return trace
+
+
+def replay(trace: list[tuple[str, int]], policy: str, cache_size: int) -> float:
+    cache = L1Cache()
+    cache.max_cache_size_bytes = cache_size
+    cache.policy = policy_from_config(policy, cache_size)
+
+    hits = 0
+    for key, size in trace:
+        if cache.get(key) is not None:
+            hits += 1
+        else:
+            cache.insert(key, key, None, size=size)
+    return hits / len(trace)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare L1 cache hit rates between eviction policies')
+    parser.add_argument('--trace', type=Path, help='replay this trace instead of a synthetic one')
+    parser.add_argument('--requests', type=int, default=200_000)
+    parser.add_argument('--cache-size', type=int, default=64 * 1024)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace) if args.trace else synthetic_trace(args.requests, args.seed)
+    print(f'Replaying {len(trace)} accesses against a {args.cache_size} byte cache')
+    for policy in POLICIES:
+        print(f'{policy:>8}: {replay(trace, policy, args.cache_size):.2%} hit rate')
+
+
+if __name__ == '__main__':
+    main()
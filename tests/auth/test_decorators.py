@@ -1,9 +1,16 @@
+import asyncio
+import datetime
 import pytest
+import threading
 import unittest
-from bw.auth.decorators import require_local, require_session, require_group_permission, require_user_role
+from concurrent.futures import ThreadPoolExecutor
+from quart import Quart
+from bw.auth.decorators import guard, require_local, require_session, require_group_permission, require_user_role
 from bw.error.auth import NonLocalIpAccessingLocalOnlyAddress, CannotDetermineSession, SessionExpired, NotEnoughPermissions
 from bw.auth.permissions import Permissions
+from bw.auth.principal import Principal, remember_principal
 from bw.auth.roles import Roles
+from bw.state import State
 
 
 class MockUser:
@@ -12,11 +19,23 @@ class MockUser:
         self.data = 12345
 
 
+def principal_of(user) -> Principal:
+    return Principal(user=user, session_expire_time=datetime.datetime.max, roles=None, permissions=Permissions())
+
+
 @pytest.fixture
 def mock_session_user() -> MockUser:
     return MockUser()
 
 
+@pytest.fixture
+def db_executor(mocker):
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='bw-db')
+    mocker.patch.object(State, 'db_executor', executor)
+    yield executor
+    executor.shutdown(wait=True)
+
+
 class TestRequireLocal:
     def test__require_local__sync__local_ip_succeeds(self):
         called = False
@@ -131,15 +150,13 @@ class TestRequireSession:
             called = True
             assert session_user == 123456
 
-        with unittest.mock.patch('bw.auth.decorators.validate_session') as mock_validator:
-            with unittest.mock.patch(
-                'bw.auth.decorators.SessionStore.get_user_from_session_token', return_value=123456
-            ) as mock_get_session_user:
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {'Authorization': 'Bearer valid_token'}
-                    tester()
-        assert mock_validator.called
-        assert mock_get_session_user.called
+        with unittest.mock.patch(
+            'bw.auth.decorators.PrincipalStore.load_principal', return_value=principal_of(123456)
+        ) as mock_load_principal:
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                tester()
+        assert mock_load_principal.called
         assert called
 
     def test__require_session__sync__arguments_passed(self):
@@ -151,22 +168,20 @@ class TestRequireSession:
             assert isinstance(arg2, str)
             assert arg2 == 'test'
 
-        with unittest.mock.patch('bw.auth.decorators.validate_session'):
-            with unittest.mock.patch('bw.auth.decorators.SessionStore.get_user_from_session_token', return_value=123456):
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {'Authorization': 'Bearer valid_token'}
-                    tester(arg1=42, arg2='test')
+        with unittest.mock.patch('bw.auth.decorators.PrincipalStore.load_principal', return_value=principal_of(123456)):
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                tester(arg1=42, arg2='test')
 
     def test__require_session__sync__proper_return(self):
         @require_session
         def tester(session_user):
             return 42
 
-        with unittest.mock.patch('bw.auth.decorators.validate_session'):
-            with unittest.mock.patch('bw.auth.decorators.SessionStore.get_user_from_session_token', return_value=123456):
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {'Authorization': 'Bearer valid_token'}
-                    assert 42 == tester()
+        with unittest.mock.patch('bw.auth.decorators.PrincipalStore.load_principal', return_value=principal_of(123456)):
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                assert 42 == tester()
 
     def test__require_session__sync__without_header_fails(self):
         called = False
@@ -177,16 +192,14 @@ class TestRequireSession:
             called = True
             assert session_user == 123456
 
-        with unittest.mock.patch('bw.auth.decorators.validate_session') as mock_validator:
-            with unittest.mock.patch(
-                'bw.auth.decorators.SessionStore.get_user_from_session_token', return_value=123456
-            ) as mock_get_session_user:
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {}
-                    with pytest.raises(CannotDetermineSession):
-                        tester()
-        assert not mock_validator.called
-        assert not mock_get_session_user.called
+        with unittest.mock.patch(
+            'bw.auth.decorators.PrincipalStore.load_principal', return_value=principal_of(123456)
+        ) as mock_load_principal:
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {}
+                with pytest.raises(CannotDetermineSession):
+                    tester()
+        assert not mock_load_principal.called
         assert not called
 
     def test__require_session__sync__invalid_header_fails(self):
@@ -198,40 +211,17 @@ class TestRequireSession:
             called = True
             assert session_user == 123456
 
-        with unittest.mock.patch('bw.auth.decorators.validate_session') as mock_validator:
-            with unittest.mock.patch(
-                'bw.auth.decorators.SessionStore.get_user_from_session_token', return_value=123456
-            ) as mock_get_session_user:
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {'Authorization': 'Meercat valid_token'}
-                    with pytest.raises(CannotDetermineSession):
-                        tester()
-        assert not mock_validator.called
-        assert not mock_get_session_user.called
-        assert not called
-
-    def test__require_session__sync__validate_session_raises(self):
-        called = False
-
-        @require_session
-        def tester(session_user):
-            nonlocal called
-            called = True
-            assert session_user == 123456
-
-        with unittest.mock.patch('bw.auth.decorators.validate_session', side_effect=SessionExpired) as mock_validator:
-            with unittest.mock.patch(
-                'bw.auth.decorators.SessionStore.get_user_from_session_token', return_value=123456
-            ) as mock_get_session_user:
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {'Authorization': 'Bearer valid_token'}
-                    with pytest.raises(SessionExpired):
-                        tester()
-        assert mock_validator.called
-        assert not mock_get_session_user.called
+        with unittest.mock.patch(
+            'bw.auth.decorators.PrincipalStore.load_principal', return_value=principal_of(123456)
+        ) as mock_load_principal:
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Meercat valid_token'}
+                with pytest.raises(CannotDetermineSession):
+                    tester()
+        assert not mock_load_principal.called
         assert not called
 
-    def test__require_session__sync__get_user_raises(self):
+    def test__require_session__sync__session_expired_raises(self):
         called = False
 
         @require_session
@@ -240,16 +230,14 @@ class TestRequireSession:
             called = True
             assert session_user == 123456
 
-        with unittest.mock.patch('bw.auth.decorators.validate_session') as mock_validator:
-            with unittest.mock.patch(
-                'bw.auth.decorators.SessionStore.get_user_from_session_token', side_effect=SessionExpired
-            ) as mock_get_session_user:
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {'Authorization': 'Bearer valid_token'}
-                    with pytest.raises(SessionExpired):
-                        tester()
-        assert mock_validator.called
-        assert mock_get_session_user.called
+        with unittest.mock.patch(
+            'bw.auth.decorators.PrincipalStore.load_principal', side_effect=SessionExpired
+        ) as mock_load_principal:
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                with pytest.raises(SessionExpired):
+                    tester()
+        assert mock_load_principal.called
         assert not called
 
     @pytest.mark.asyncio
@@ -262,15 +250,13 @@ class TestRequireSession:
             called = True
             assert session_user == 123456
 
-        with unittest.mock.patch('bw.auth.decorators.validate_session') as mock_validator:
-            with unittest.mock.patch(
-                'bw.auth.decorators.SessionStore.get_user_from_session_token', return_value=123456
-            ) as mock_get_session_user:
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {'Authorization': 'Bearer valid_token'}
-                    await tester()
-        assert mock_validator.called
-        assert mock_get_session_user.called
+        with unittest.mock.patch(
+            'bw.auth.decorators.PrincipalStore.load_principal', return_value=principal_of(123456)
+        ) as mock_load_principal:
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                await tester()
+        assert mock_load_principal.called
         assert called
 
     @pytest.mark.asyncio
@@ -283,11 +269,10 @@ class TestRequireSession:
             assert isinstance(arg2, str)
             assert arg2 == 'test'
 
-        with unittest.mock.patch('bw.auth.decorators.validate_session'):
-            with unittest.mock.patch('bw.auth.decorators.SessionStore.get_user_from_session_token', return_value=123456):
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {'Authorization': 'Bearer valid_token'}
-                    await tester(arg1=42, arg2='test')
+        with unittest.mock.patch('bw.auth.decorators.PrincipalStore.load_principal', return_value=principal_of(123456)):
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                await tester(arg1=42, arg2='test')
 
     @pytest.mark.asyncio
     async def test__require_session__async__proper_return(self):
@@ -295,11 +280,10 @@ class TestRequireSession:
         async def tester(session_user):
             return 42
 
-        with unittest.mock.patch('bw.auth.decorators.validate_session'):
-            with unittest.mock.patch('bw.auth.decorators.SessionStore.get_user_from_session_token', return_value=123456):
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {'Authorization': 'Bearer valid_token'}
-                    assert 42 == await tester()
+        with unittest.mock.patch('bw.auth.decorators.PrincipalStore.load_principal', return_value=principal_of(123456)):
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                assert 42 == await tester()
 
     @pytest.mark.asyncio
     async def test__require_session__async__without_header_fails(self):
@@ -311,16 +295,14 @@ class TestRequireSession:
             called = True
             assert session_user == 123456
 
-        with unittest.mock.patch('bw.auth.decorators.validate_session') as mock_validator:
-            with unittest.mock.patch(
-                'bw.auth.decorators.SessionStore.get_user_from_session_token', return_value=123456
-            ) as mock_get_session_user:
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {}
-                    with pytest.raises(CannotDetermineSession):
-                        tester()
-        assert not mock_validator.called
-        assert not mock_get_session_user.called
+        with unittest.mock.patch(
+            'bw.auth.decorators.PrincipalStore.load_principal', return_value=principal_of(123456)
+        ) as mock_load_principal:
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {}
+                with pytest.raises(CannotDetermineSession):
+                    tester()
+        assert not mock_load_principal.called
         assert not called
 
     @pytest.mark.asyncio
@@ -333,42 +315,18 @@ class TestRequireSession:
             called = True
             assert session_user == 123456
 
-        with unittest.mock.patch('bw.auth.decorators.validate_session') as mock_validator:
-            with unittest.mock.patch(
-                'bw.auth.decorators.SessionStore.get_user_from_session_token', return_value=123456
-            ) as mock_get_session_user:
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {'Authorization': 'Meercat valid_token'}
-                    with pytest.raises(CannotDetermineSession):
-                        await tester()
-        assert not mock_validator.called
-        assert not mock_get_session_user.called
-        assert not called
-
-    @pytest.mark.asyncio
-    async def test__require_session__async__validate_session_raises(self):
-        called = False
-
-        @require_session
-        async def tester(session_user):
-            nonlocal called
-            called = True
-            assert session_user == 123456
-
-        with unittest.mock.patch('bw.auth.decorators.validate_session', side_effect=SessionExpired) as mock_validator:
-            with unittest.mock.patch(
-                'bw.auth.decorators.SessionStore.get_user_from_session_token', return_value=123456
-            ) as mock_get_session_user:
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {'Authorization': 'Bearer valid_token'}
-                    with pytest.raises(SessionExpired):
-                        await tester()
-        assert mock_validator.called
-        assert not mock_get_session_user.called
+        with unittest.mock.patch(
+            'bw.auth.decorators.PrincipalStore.load_principal', return_value=principal_of(123456)
+        ) as mock_load_principal:
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Meercat valid_token'}
+                with pytest.raises(CannotDetermineSession):
+                    await tester()
+        assert not mock_load_principal.called
         assert not called
 
     @pytest.mark.asyncio
-    async def test__require_session__async__get_user_raises(self):
+    async def test__require_session__async__session_expired_raises(self):
         called = False
 
         @require_session
@@ -377,16 +335,14 @@ class TestRequireSession:
             called = True
             assert session_user == 123456
 
-        with unittest.mock.patch('bw.auth.decorators.validate_session') as mock_validator:
-            with unittest.mock.patch(
-                'bw.auth.decorators.SessionStore.get_user_from_session_token', side_effect=SessionExpired
-            ) as mock_get_session_user:
-                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
-                    mock_request.headers = {'Authorization': 'Bearer valid_token'}
-                    with pytest.raises(SessionExpired):
-                        await tester()
-        assert mock_validator.called
-        assert mock_get_session_user.called
+        with unittest.mock.patch(
+            'bw.auth.decorators.PrincipalStore.load_principal', side_effect=SessionExpired
+        ) as mock_load_principal:
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                with pytest.raises(SessionExpired):
+                    await tester()
+        assert mock_load_principal.called
         assert not called
 
 
@@ -547,6 +503,24 @@ class TestRequireGroupPermission:
         assert mock_getter.called
         assert not called
 
+    @pytest.mark.asyncio
+    async def test__require_group_permission__async__uses_principal_from_session(self, mock_session_user):
+        @require_group_permission(Permissions.can_test_mission)
+        async def tester(session_user):
+            return 42
+
+        principal = Principal(
+            user=mock_session_user,
+            session_expire_time=datetime.datetime.max,
+            roles=None,
+            permissions=Permissions(can_test_mission=True),
+        )
+        async with Quart(__name__).app_context():
+            remember_principal(principal)
+            with unittest.mock.patch('bw.auth.decorators.GroupStore.get_all_permissions_user_has') as mock_getter:
+                assert 42 == await tester(mock_session_user)
+        assert not mock_getter.called
+
 
 class TestRequireUserRole:
     def test__require_user_role__sync__succeeds(self, mock_session_user):
@@ -737,3 +711,194 @@ class TestRequireUserRole:
                 await tester(mock_session_user)
         assert mock_getter.called
         assert not called
+
+    @pytest.mark.asyncio
+    async def test__require_user_role__async__uses_principal_from_session(self, mock_session_user):
+        @require_user_role(Roles.can_manage_server)
+        async def tester(session_user):
+            return 42
+
+        principal = Principal(
+            user=mock_session_user,
+            session_expire_time=datetime.datetime.max,
+            roles=Roles(can_manage_server=True),
+            permissions=Permissions(),
+        )
+        async with Quart(__name__).app_context():
+            remember_principal(principal)
+            with unittest.mock.patch('bw.auth.decorators.UserStore.get_users_role') as mock_getter:
+                assert 42 == await tester(mock_session_user)
+        assert not mock_getter.called
+
+    @pytest.mark.asyncio
+    async def test__require_user_role__async__ignores_principal_of_other_user(self, mock_session_user):
+        @require_user_role(Roles.can_manage_server)
+        async def tester(session_user):
+            return 42
+
+        other_user = MockUser()
+        other_user.id = mock_session_user.id + 1
+        principal = Principal(
+            user=other_user,
+            session_expire_time=datetime.datetime.max,
+            roles=Roles(can_manage_server=True),
+            permissions=Permissions(),
+        )
+        async with Quart(__name__).app_context():
+            remember_principal(principal)
+            with unittest.mock.patch('bw.auth.decorators.UserStore.get_users_role') as mock_getter:
+                mock_getter.return_value = Roles(can_manage_server=False)
+                with pytest.raises(NotEnoughPermissions):
+                    await tester(mock_session_user)
+        assert mock_getter.called
+
+
+def principal_with(user, roles: Roles | None = None, permissions: Permissions | None = None) -> Principal:
+    return Principal(user=user, session_expire_time=datetime.datetime.max, roles=roles, permissions=permissions or Permissions())
+
+
+class TestGuard:
+    def test__guard__roles_imply_session(self, mock_session_user):
+        @guard(roles=(Roles.can_manage_server,))
+        def tester(session_user):
+            return session_user
+
+        principal = principal_with(mock_session_user, roles=Roles(can_manage_server=True))
+        with unittest.mock.patch('bw.auth.decorators.PrincipalStore.load_principal', return_value=principal) as mock_load:
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                assert tester() is mock_session_user
+        mock_load.assert_called_once()
+        assert mock_load.call_args.args[-1] == 'valid_token'
+
+    def test__guard__missing_role_fails(self, mock_session_user):
+        called = False
+
+        @guard(roles=(Roles.can_manage_server,), permissions=(Permissions.can_test_mission,))
+        def tester(session_user):
+            nonlocal called
+            called = True
+
+        principal = principal_with(
+            mock_session_user, roles=Roles(can_create_role=True), permissions=Permissions(can_test_mission=True)
+        )
+        with unittest.mock.patch('bw.auth.decorators.PrincipalStore.load_principal', return_value=principal):
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                with pytest.raises(NotEnoughPermissions):
+                    tester()
+        assert not called
+
+    def test__guard__no_role_fails(self, mock_session_user):
+        @guard(roles=(Roles.can_manage_server,))
+        def tester(session_user):
+            pass
+
+        with unittest.mock.patch(
+            'bw.auth.decorators.PrincipalStore.load_principal', return_value=principal_of(mock_session_user)
+        ):
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                with pytest.raises(NotEnoughPermissions):
+                    tester()
+
+    def test__guard__missing_permission_fails(self, mock_session_user):
+        @guard(permissions=(Permissions.can_upload_mission, Permissions.can_test_mission))
+        def tester(session_user):
+            pass
+
+        principal = principal_with(mock_session_user, permissions=Permissions(can_test_mission=True))
+        with unittest.mock.patch('bw.auth.decorators.PrincipalStore.load_principal', return_value=principal):
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                with pytest.raises(NotEnoughPermissions):
+                    tester()
+
+    def test__guard__remote_ip_fails_before_session(self):
+        @guard(local=True, session=True)
+        def tester(session_user):
+            pass
+
+        with unittest.mock.patch('bw.auth.decorators.PrincipalStore.load_principal') as mock_load:
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.remote_addr = '8.8.8.8'
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                with pytest.raises(NonLocalIpAccessingLocalOnlyAddress):
+                    tester()
+        assert not mock_load.called
+
+    def test__guard__local_without_session(self):
+        @guard(local=True)
+        def tester(arg1: int):
+            return arg1
+
+        with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+            mock_request.remote_addr = '192.168.1.20'
+            assert 42 == tester(42)
+
+    @pytest.mark.asyncio
+    async def test__guard__async__stays_a_coroutine_function(self, mock_session_user):
+        @guard(session=True)
+        async def tester(session_user, arg1: int):
+            return arg1
+
+        assert asyncio.iscoroutinefunction(tester)
+        with unittest.mock.patch(
+            'bw.auth.decorators.PrincipalStore.load_principal', return_value=principal_of(mock_session_user)
+        ):
+            with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                assert 42 == await tester(arg1=42)
+
+    @pytest.mark.asyncio
+    async def test__guard__async__loads_principal_off_the_event_loop(self, mock_session_user, db_executor):
+        loaded_on = []
+
+        def load_principal(state, token):
+            loaded_on.append(threading.current_thread())
+            return principal_of(mock_session_user)
+
+        def get_users_role(state, user):
+            loaded_on.append(threading.current_thread())
+            return Roles(can_manage_server=True)
+
+        @require_user_role(Roles.can_manage_server)
+        async def tester(session_user):
+            return session_user
+
+        @guard(session=True)
+        async def handler(session_user):
+            return await tester(session_user)
+
+        with unittest.mock.patch('bw.auth.decorators.PrincipalStore.load_principal', side_effect=load_principal):
+            with unittest.mock.patch('bw.auth.decorators.UserStore.get_users_role', side_effect=get_users_role):
+                with unittest.mock.patch('bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock) as mock_request:
+                    mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                    assert await handler() is mock_session_user
+        assert len(loaded_on) == 2
+        assert threading.current_thread() not in loaded_on
+        assert all(thread.name.startswith('bw-db') for thread in loaded_on)
+
+    def test__guard__stacked_decorators_resolve_session_once(self, mock_session_user):
+        @require_session
+        @require_user_role(Roles.can_manage_server)
+        @require_group_permission(Permissions.can_test_mission)
+        def tester(session_user):
+            return session_user
+
+        principal = principal_with(
+            mock_session_user, roles=Roles(can_manage_server=True), permissions=Permissions(can_test_mission=True)
+        )
+        with unittest.mock.patch('bw.auth.decorators.PrincipalStore.load_principal', return_value=principal) as mock_load:
+            with unittest.mock.patch('bw.auth.decorators.UserStore.get_users_role') as mock_role:
+                with unittest.mock.patch('bw.auth.decorators.GroupStore.get_all_permissions_user_has') as mock_permissions:
+                    with unittest.mock.patch(
+                        'bw.auth.decorators.request', new_callable=unittest.mock.PropertyMock
+                    ) as mock_request:
+                        mock_request.headers = {'Authorization': 'Bearer valid_token'}
+                        assert tester() is mock_session_user
+        mock_load.assert_called_once()
+        assert not mock_role.called
+        assert not mock_permissions.called
+        assert tester.__wrapped__.__name__ == 'tester'
+        assert not hasattr(tester.__wrapped__, '__guard__')
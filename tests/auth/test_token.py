@@ -0,0 +1,67 @@
+import pytest
+
+from bw.auth.token import SessionClaims, is_signed_token, sign_session_token, verify_session_token
+from bw.error import SessionExpired
+
+
+@pytest.fixture
+def signing_key(mocker):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'session_signing_key': 'correct horse battery staple'})
+
+
+@pytest.fixture
+def claims(mocker):
+    mocker.patch('bw.auth.token.time.time', return_value=1000.0)
+    return SessionClaims(user_id=7, kind='api', generation=3, expire_time=1300.0)
+
+
+def test__signed_token__round_trip(signing_key, claims):
+    token = sign_session_token(claims)
+    assert is_signed_token(token)
+    assert verify_session_token(token) == claims
+
+
+def test__signed_token__opaque_tokens_are_not_signed():
+    assert not is_signed_token('abcDEF123-_abcDEF123-_abcDEF123-')
+
+
+def test__signed_token__expired_raises(signing_key, claims, mocker):
+    token = sign_session_token(claims)
+    mocker.patch('bw.auth.token.time.time', return_value=1300.0)
+    with pytest.raises(SessionExpired):
+        verify_session_token(token)
+
+
+def test__signed_token__tampered_payload_raises(signing_key, claims):
+    token = sign_session_token(claims)
+    forged = sign_session_token(SessionClaims(user_id=1, kind='api', generation=3, expire_time=1300.0))
+    body, _, signature = token.rpartition('.')
+    forged_body, _, _ = forged.rpartition('.')
+    with pytest.raises(SessionExpired):
+        verify_session_token(f'{forged_body}.{signature}')
+
+
+def test__signed_token__other_key_raises(signing_key, claims, mocker):
+    token = sign_session_token(claims)
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'session_signing_key': 'another key'})
+    with pytest.raises(SessionExpired):
+        verify_session_token(token)
+
+
+def test__signed_token__refused_without_key(signing_key, claims, mocker):
+    token = sign_session_token(claims)
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'session_signing_key': ''})
+    with pytest.raises(SessionExpired):
+        verify_session_token(token)
+
+
+@pytest.mark.parametrize('token', ['bw1.', 'bw1..', 'bw1.e30.', 'bw1.!!!.!!!', 'bw1.e30.AAAA'])
+def test__signed_token__malformed_raises(signing_key, token):
+    with pytest.raises(SessionExpired):
+        verify_session_token(token)
+
+
+def test__signed_token__cannot_sign_without_key(mocker, claims):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'session_signing_key': ''})
+    with pytest.raises(RuntimeError):
+        sign_session_token(claims)
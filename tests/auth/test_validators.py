@@ -9,6 +9,12 @@ def test__validate_local__non_local_ip_raises():
         validators.validate_local('8.8.8.8')
 
 
+@pytest.mark.parametrize('ip', ['10.0.0.1.example.com', '172.16.0', '192.0.0.256', 'localhost', ''])
+def test__validate_local__not_an_address_raises(ip):
+    with pytest.raises(NonLocalIpAccessingLocalOnlyAddress):
+        validators.validate_local(ip)
+
+
 def test__validate_local__local_ip_fine():
     validators.validate_local('0.0.0.0')
     validators.validate_local('10.0.0.1')
@@ -0,0 +1,367 @@
+# ruff: noqa: F811, F401
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bw.cache import Cache
+from bw.cache.l1 import LruPolicy
+from bw.environment import ENVIRONMENT
+from bw.web_event import MissionEvent, MissionUploadEvent, IterationCosignedEvent
+from bw.error import L1CacheMiss, L2CacheMiss
+
+
+@pytest.fixture
+def l2_path(tmp_path):
+    return tmp_path / 'l2.sqlite3'
+
+
+@pytest.fixture
+def cache(mocker, l2_path):
+    mocker.patch.object(ENVIRONMENT, 'l2_cache_path', return_value=l2_path)
+    cache = Cache()
+    yield cache
+    cache.l2_cache.close()
+
+
+@pytest.fixture
+def other_worker(mocker, l2_path):
+    mocker.patch.object(ENVIRONMENT, 'l2_cache_path', return_value=l2_path)
+    cache = Cache()
+    yield cache
+    cache.l2_cache.close()
+
+
+def test__cache__no_l2_path__raises_l1_miss(mocker):
+    mocker.patch.object(ENVIRONMENT, 'l2_cache_path', return_value=None)
+    cache = Cache()
+    assert cache.l2_cache is None
+    with pytest.raises(L1CacheMiss):
+        cache.get('key1')
+
+
+def test__cache__get__raises_l2_miss_if_not_in_any_tier(cache):
+    with pytest.raises(L2CacheMiss):
+        cache.get('key1')
+
+
+def test__cache__get__returns_value_from_l1(cache):
+    cache.insert('key1', 'value1')
+    assert cache['key1'] == 'value1'
+
+
+def test__cache__get__falls_through_to_l2_and_promotes(cache, other_worker):
+    cache.insert('key1', 'value1')
+    assert other_worker.l1_cache.contains('key1') is False
+    assert other_worker.get('key1') == 'value1'
+    assert other_worker.l1_cache.contains('key1') is True
+
+
+def test__cache__insert__l1_evictions_are_demoted_into_l2(mocker, cache):
+    cache.l1_cache.max_cache_size_bytes = 100
+    cache.l1_cache.policy = LruPolicy()
+    mocker.patch.object(cache.l1_cache, '_getsize', return_value=60)
+    cache.insert('key1', 'value1')
+    cache.l2_cache.clear()
+
+    cache.insert('key2', 'value2')
+    assert cache.l1_cache.contains('key1') is False
+    assert cache.l2_cache.contains('key1') is True
+    assert cache.get('key1') == 'value1'
+
+
+def test__cache__event__accepts_event_instances(cache, other_worker):
+    cache.insert('key1', 'value1', MissionUploadEvent)
+    cache.insert('key2', 'value2', IterationCosignedEvent)
+    cache.event(MissionUploadEvent.__new__(MissionUploadEvent))
+    assert cache.l1_cache.contains('key1') is False
+    with pytest.raises(L2CacheMiss):
+        other_worker.get('key1')
+    assert other_worker.get('key2') == 'value2'
+
+
+def test__cache__sync__drops_values_overwritten_by_other_worker(mocker, cache, other_worker):
+    cache.insert('key1', 'value1')
+    assert other_worker.get('key1') == 'value1'
+
+    mocker.patch('bw.cache.l2.os.getpid', return_value=-1)
+    cache.l2_cache.close()
+    cache.insert('key1', 'value2')
+    mocker.stopall()
+
+    assert other_worker.get('key1') == 'value2'
+
+
+def test__cache__sync__drops_values_invalidated_by_other_worker(mocker, cache, other_worker):
+    cache.insert('mission:1', 'value1', tags=('reviews',))
+    cache.insert('mission:2', 'value2', MissionUploadEvent)
+    assert other_worker.get('mission:1') == 'value1'
+    assert other_worker.get('mission:2') == 'value2'
+
+    mocker.patch('bw.cache.l2.os.getpid', return_value=-1)
+    cache.l2_cache.close()
+    cache.invalidate('reviews')
+    cache.event(MissionUploadEvent)
+    mocker.stopall()
+
+    other_worker.sync()
+    assert other_worker.l1_cache.contains('mission:1') is False
+    assert other_worker.l1_cache.contains('mission:2') is False
+
+
+def test__cache__sync__clears_l1_if_log_was_trimmed(mocker, cache, other_worker):
+    mocker.patch('bw.cache.l2.INVALIDATION_LOG_LENGTH', 2)
+    cache.insert('key1', 'value1')
+    assert other_worker.get('key1') == 'value1'
+
+    mocker.patch('bw.cache.l2.os.getpid', return_value=-1)
+    cache.l2_cache.close()
+    for i in range(300):
+        cache.invalidate(f'tag{i}')
+    mocker.stopall()
+
+    other_worker.sync()
+    assert other_worker.l1_cache.contains('key1') is False
+
+
+def test__cache__insert__ttl_applies_to_both_tiers(mocker, cache, other_worker):
+    mocker.patch('bw.cache.l1.time.time', return_value=1000.0)
+    mocker.patch('bw.cache.l2.time.time', return_value=1000.0)
+    mocker.patch('bw.cache.cache.time.time', return_value=1000.0)
+    cache.insert('key1', 'value1', ttl=10)
+    assert other_worker.get('key1') == 'value1'
+    assert other_worker.l1_cache.entry_map['key1'].expires_at == 1010.0
+
+    mocker.patch('bw.cache.l1.time.time', return_value=1011.0)
+    mocker.patch('bw.cache.l2.time.time', return_value=1011.0)
+    with pytest.raises(L2CacheMiss):
+        other_worker.get('key1')
+
+
+class Loader:
+    def __init__(self, value='value1', error: Exception | None = None):
+        self.value = value
+        self.error = error
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+@pytest.mark.asyncio
+async def test__cache__get_or_load__concurrent_misses_share_one_load(cache):
+    loader = Loader()
+    waiters = [asyncio.create_task(cache.get_or_load('key1', loader)) for _ in range(10)]
+    await asyncio.sleep(0)
+    loader.release.set()
+
+    assert await asyncio.gather(*waiters) == ['value1'] * 10
+    assert loader.calls == 1
+    assert cache.get('key1') == 'value1'
+
+
+@pytest.mark.asyncio
+async def test__cache__get_or_load__hit_does_not_load(cache):
+    cache.insert('key1', 'cached')
+    loader = Loader()
+    assert await cache.get_or_load('key1', loader) == 'cached'
+    assert loader.calls == 0
+
+
+@pytest.mark.asyncio
+async def test__cache__get_or_load__failure_reaches_every_waiter_and_is_not_cached(cache):
+    loader = Loader(error=ValueError('broken'))
+    waiters = [asyncio.create_task(cache.get_or_load('key1', loader)) for _ in range(3)]
+    await asyncio.sleep(0)
+    loader.release.set()
+
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert loader.calls == 1
+
+    loader.error = None
+    assert await cache.get_or_load('key1', loader) == 'value1'
+    assert loader.calls == 2
+
+
+@pytest.mark.asyncio
+async def test__cache__get_or_load__cancelled_caller_does_not_cancel_load(cache):
+    loader = Loader()
+    first = asyncio.create_task(cache.get_or_load('key1', loader))
+    second = asyncio.create_task(cache.get_or_load('key1', loader))
+    await asyncio.sleep(0)
+    first.cancel()
+    loader.release.set()
+
+    assert await second == 'value1'
+    assert first.cancelled()
+    assert loader.calls == 1
+
+
+@pytest.mark.asyncio
+async def test__cache__get_or_load__invalidation_during_load_is_not_cached(cache):
+    loader = Loader()
+    waiter = asyncio.create_task(cache.get_or_load('key1', loader, tags=['tag1']))
+    await asyncio.sleep(0)
+    cache.invalidate('tag1')
+    loader.release.set()
+
+    assert await waiter == 'value1'
+    assert cache.l1_cache.contains('key1') is False
+
+
+@pytest.mark.asyncio
+async def test__cache__get_or_load__serves_stale_value_while_refreshing(mocker, cache):
+    time = mocker.patch('bw.cache.cache.time.time', return_value=1000.0)
+    mocker.patch('bw.cache.l1.time.time', new=time)
+    mocker.patch('bw.cache.l2.time.time', new=time)
+
+    loader = Loader('old')
+    loader.release.set()
+    assert await cache.get_or_load('key1', loader, ttl=10, stale_ttl=60) == 'old'
+    assert cache.get('key1') == 'old'
+
+    time.return_value = 1011.0
+    loader.value = 'new'
+    loader.release.clear()
+    assert await cache.get_or_load('key1', loader, ttl=10, stale_ttl=60) == 'old'
+    assert await cache.get_or_load('key1', loader, ttl=10, stale_ttl=60) == 'old'
+    await asyncio.sleep(0)
+    assert loader.calls == 2
+
+    loader.release.set()
+    await asyncio.wrap_future(cache._loading['key1'].future)
+    assert await cache.get_or_load('key1', loader, ttl=10, stale_ttl=60) == 'new'
+    assert loader.calls == 2
+
+
+@pytest.mark.asyncio
+async def test__cache__get_or_load__stale_value_expires_eventually(mocker, cache):
+    time = mocker.patch('bw.cache.cache.time.time', return_value=1000.0)
+    mocker.patch('bw.cache.l1.time.time', new=time)
+    mocker.patch('bw.cache.l2.time.time', new=time)
+
+    loader = Loader('old')
+    loader.release.set()
+    await cache.get_or_load('key1', loader, ttl=10, stale_ttl=60)
+
+    time.return_value = 1071.0
+    loader.value = 'new'
+    assert await cache.get_or_load('key1', loader, ttl=10, stale_ttl=60) == 'new'
+
+
+@pytest.mark.asyncio
+async def test__cache__get_or_load__stale_ttl_requires_ttl(cache):
+    with pytest.raises(ValueError):
+        await cache.get_or_load('key1', Loader(), stale_ttl=60)
+
+
+def test__cache__used_from_many_threads__stays_consistent(cache):
+    def work(worker: int):
+        for i in range(200):
+            cache.insert(f'key:{worker}:{i}', i, tags=(f'worker:{worker}',))
+            assert cache.get(f'key:{worker}:{i}') == i
+            if i % 50 == 0:
+                cache.invalidate(f'unused:{worker}')
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for result in [executor.submit(work, worker) for worker in range(8)]:
+            result.result()
+
+    assert cache.get('key:0:199') == 199
+
+
+def test__cache__load_through__concurrent_misses_share_one_load(cache):
+    loads = []
+    release = threading.Event()
+
+    def load():
+        loads.append(threading.get_ident())
+        release.wait(5)
+        return {'value': 1}, None
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = [executor.submit(cache.load_through, 'key1', load, lambda _: ()) for _ in range(8)]
+        time.sleep(0.1)
+        release.set()
+        values = [result.result() for result in results]
+
+    assert len(loads) == 1
+    assert values == [{'value': 1}] * 8
+    # every caller gets its own copy
+    assert len({id(value) for value in values}) == 8
+    assert cache.get('key1') is not None
+
+
+def test__cache__load_once__shares_errors(cache):
+    release = threading.Event()
+
+    def load():
+        release.wait(5)
+        raise ValueError('no')
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = [executor.submit(cache.load_once, 'key1', load) for _ in range(4)]
+        time.sleep(0.1)
+        release.set()
+        for result in results:
+            with pytest.raises(ValueError):
+                result.result()
+    assert cache._loading == {}
+
+
+def test__cache__load_once__not_joined_after_invalidation(cache):
+    started = threading.Event()
+    release = threading.Event()
+    loads = []
+
+    def load():
+        loads.append(len(loads))
+        started.set()
+        release.wait(5)
+        return len(loads)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        stale = executor.submit(cache.load_once, 'key1', load)
+        started.wait(5)
+        # anything read before this write may be out of date, so later misses load again
+        cache.invalidate('anything')
+        fresh = executor.submit(cache.load_once, 'key1', load)
+        time.sleep(0.1)
+        release.set()
+        stale.result()
+        fresh.result()
+    assert len(loads) == 2
+
+
+@pytest.mark.asyncio
+async def test__cache__load_once__refuses_event_loop(cache):
+    with pytest.raises(RuntimeError, match='run_in_db_thread'):
+        cache.load_once('key1', lambda: 'value1')
+    assert cache._loading == {}
+
+
+@pytest.mark.asyncio
+async def test__cache__load_once__joins_load_started_by_get_or_load(cache):
+    loader = Loader()
+    waiter = asyncio.create_task(cache.get_or_load('key1', loader))
+    await asyncio.sleep(0)
+
+    def load():
+        raise AssertionError('should have waited on the in-flight load')
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        joined = asyncio.get_running_loop().run_in_executor(executor, cache.load_once, 'key1', load)
+        await asyncio.sleep(0.1)
+        loader.release.set()
+        assert await joined == 'value1'
+    assert await waiter == 'value1'
+    assert loader.calls == 1
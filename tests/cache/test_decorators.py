@@ -0,0 +1,251 @@
+# ruff: noqa: F811, F401
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+import pytest
+
+from bw.cache import Cache, cached
+from bw.environment import ENVIRONMENT
+from bw.events import Broker
+from bw.error import MissionDoesNotExist
+from bw.models.auth import User
+from bw.server_ops.arma.types import WorkshopId
+from bw.web_event import BaseEvent, MissionEvent, MissionUploadEvent
+
+
+class FakeState:
+    def __init__(self):
+        self.cache = Cache()
+        self.broker = Broker()
+        self.broker.subscribe_all(self.cache.event)
+
+
+@dataclass
+class Snapshot:
+    value: Any
+    calls: int
+
+
+class Store:
+    def __init__(self):
+        self.calls = 0
+        self.known = set()
+        self.release = threading.Event()
+
+    @cached('test', expire_on=MissionEvent)
+    def lookup(self, state, value, extra=None) -> Snapshot:
+        self.calls += 1
+        return Snapshot(value=[value, extra], calls=self.calls)
+
+    @cached('test')
+    def slow_lookup(self, state, value) -> Snapshot:
+        self.calls += 1
+        self.release.wait(5)
+        return Snapshot(value=[value], calls=self.calls)
+
+    @cached('test', expire_on=MissionEvent)
+    def lookup_during_write(self, state, value) -> int:
+        self.calls += 1
+        # another request commits a write, and invalidates, after this read
+        state.broker.publish(MissionUploadEvent(uuid.uuid4(), uuid.uuid4()))
+        return self.calls
+
+    @cached('test', expire_on=MissionEvent, absent=MissionDoesNotExist)
+    def absent_during_write(self, state, value) -> int:
+        self.calls += 1
+        state.broker.publish(MissionUploadEvent(uuid.uuid4(), uuid.uuid4()))
+        raise MissionDoesNotExist(value)
+
+    @cached('test')
+    def lookup_or_raise(self, state, value) -> int:
+        self.calls += 1
+        raise ValueError(value)
+
+    @cached('test', expire_on=MissionEvent, absent=MissionDoesNotExist, absent_ttl=10)
+    def lookup_or_absent(self, state, value) -> int:
+        self.calls += 1
+        if value in self.known:
+            return value
+        raise MissionDoesNotExist(value)
+
+    @cached('test', expire_on=MissionEvent, absent=MissionDoesNotExist, cache_found=False)
+    def only_absent(self, state, value) -> int:
+        self.calls += 1
+        if value in self.known:
+            return value
+        raise MissionDoesNotExist(value)
+
+
+@pytest.fixture
+def state(mocker):
+    mocker.patch.object(ENVIRONMENT, 'l2_cache_path', return_value=None)
+    return FakeState()
+
+
+@pytest.fixture
+def store():
+    return Store()
+
+
+def test__cached__second_call_hits_cache(state, store):
+    assert store.lookup(state, 1).calls == 1
+    assert store.lookup(state, 1).calls == 1
+    assert store.calls == 1
+
+
+def test__cached__different_arguments_are_different_keys(state, store):
+    store.lookup(state, 1)
+    store.lookup(state, 2)
+    store.lookup(state, 1, extra='a')
+    store.lookup(state, '1')
+    assert store.calls == 4
+
+
+def test__cached__keyword_and_positional_arguments_share_key(state, store):
+    store.lookup(state, 1, 'a')
+    store.lookup(state, value=1, extra='a')
+    assert store.calls == 1
+
+
+def test__cached__hits_are_independent_copies(state, store):
+    store.lookup(state, 1)
+    first = store.lookup(state, 1)
+    first.value.append('mutated')
+
+    second = store.lookup(state, 1)
+    assert second.value == [1, None]
+    assert first is not second
+
+
+def test__cached__expire_event_invalidates(state, store):
+    store.lookup(state, 1)
+    state.broker.publish(MissionUploadEvent(uuid.uuid4(), uuid.uuid4()))
+    assert store.lookup(state, 1).calls == 2
+
+
+def test__cached__unrelated_event_does_not_invalidate(state, store):
+    class UnrelatedEvent(BaseEvent, event='unrelated_cached', namespace='test', internal=True):
+        def data(self) -> dict[str, Any]:
+            return {}
+
+    store.lookup(state, 1)
+    state.broker.publish(UnrelatedEvent())
+    assert store.lookup(state, 1).calls == 1
+
+
+def test__cached__exceptions_are_not_cached(state, store):
+    with pytest.raises(ValueError):
+        store.lookup_or_raise(state, 1)
+    with pytest.raises(ValueError):
+        store.lookup_or_raise(state, 1)
+    assert store.calls == 2
+
+
+def test__cached__models_are_keyed_by_identity(state, store):
+    store.lookup(state, User(id=1))
+    store.lookup(state, User(id=1))
+    store.lookup(state, User(id=2))
+    assert store.calls == 2
+
+
+def test__cached__unkeyable_argument_raises(state, store):
+    with pytest.raises(TypeError):
+        store.lookup(state, object())
+
+
+def test__cached__requires_state_argument():
+    with pytest.raises(TypeError):
+
+        @cached('test')
+        def lookup(value):
+            return value
+
+
+def test__cached__objects_with_cache_key_are_keyed_by_it(state, store):
+    store.lookup(state, WorkshopId(1))
+    store.lookup(state, WorkshopId('1'))
+    store.lookup(state, WorkshopId(2))
+    assert store.calls == 2
+
+
+def test__cached__absent_lookup_raises_same_error_without_calling_again(state, store):
+    with pytest.raises(MissionDoesNotExist) as first:
+        store.lookup_or_absent(state, 1)
+    with pytest.raises(MissionDoesNotExist) as second:
+        store.lookup_or_absent(state, 1)
+
+    assert store.calls == 1
+    assert str(first.value) == str(second.value)
+    assert first.value.status() == second.value.status()
+
+
+def test__cached__absent_lookup_expires_on_event(state, store):
+    with pytest.raises(MissionDoesNotExist):
+        store.lookup_or_absent(state, 1)
+
+    store.known.add(1)
+    state.broker.publish(MissionUploadEvent(uuid.uuid4(), uuid.uuid4()))
+    assert store.lookup_or_absent(state, 1) == 1
+    assert store.calls == 2
+
+
+def test__cached__absent_lookup_expires_after_ttl(mocker, state, store):
+    time = mocker.patch('bw.cache.l1.time.time', return_value=1000.0)
+    mocker.patch('bw.cache.cache.time.time', new=time)
+    with pytest.raises(MissionDoesNotExist):
+        store.lookup_or_absent(state, 1)
+
+    store.known.add(1)
+    time.return_value = 1011.0
+    assert store.lookup_or_absent(state, 1) == 1
+
+
+def test__cached__absent_ttl_defaults_to_config(mocker, state, store):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'cache_absent_ttl': '5'})
+    time = mocker.patch('bw.cache.l1.time.time', return_value=1000.0)
+    mocker.patch('bw.cache.cache.time.time', new=time)
+    with pytest.raises(MissionDoesNotExist):
+        store.only_absent(state, 1)
+    assert state.cache.l1_cache.entry_map[next(iter(state.cache.l1_cache.entry_map))].expires_at == 1005.0
+
+
+def test__cached__cache_found_false_only_caches_absence(state, store):
+    store.known.add(1)
+    store.only_absent(state, 1)
+    store.only_absent(state, 1)
+    assert store.calls == 2
+
+    with pytest.raises(MissionDoesNotExist):
+        store.only_absent(state, 2)
+    with pytest.raises(MissionDoesNotExist):
+        store.only_absent(state, 2)
+    assert store.calls == 3
+
+
+def test__cached__concurrent_misses_share_one_call(state, store):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = [executor.submit(store.slow_lookup, state, 1) for _ in range(8)]
+        time.sleep(0.1)
+        store.release.set()
+        snapshots = [result.result() for result in results]
+
+    assert store.calls == 1
+    assert all(snapshot == Snapshot(value=[1], calls=1) for snapshot in snapshots)
+    assert len({id(snapshot) for snapshot in snapshots}) == 8
+
+
+def test__cached__not_cached_if_invalidated_during_call(state, store):
+    assert store.lookup_during_write(state, 1) == 1
+    assert store.lookup_during_write(state, 1) == 2
+
+
+def test__cached__absent_not_cached_if_invalidated_during_call(state, store):
+    for _ in range(2):
+        with pytest.raises(MissionDoesNotExist):
+            store.absent_during_write(state, 1)
+    assert store.calls == 2
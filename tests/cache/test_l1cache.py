@@ -3,9 +3,10 @@
 from uuid import UUID
 import pytest
 
-from bw.cache.l1 import L1Cache, Entry
-from bw.web_event import MissionUploadEvent, IterationCosignedEvent
-from bw.error import L1CacheMiss
+from bw.cache.l1 import L1Cache, Entry, CountMinSketch, LruPolicy, TinyLfuPolicy
+from bw.cache.tags import encode_tag
+from bw.web_event import MissionEvent, MissionUploadEvent, IterationCosignedEvent
+from bw.error import L1CacheMiss, InvalidConfigValue
 
 
 @pytest.fixture
@@ -29,7 +30,7 @@ def populated_cache():
 
 @pytest.fixture
 def small_cache(mocker, small_bytes):
-    mocker.patch('bw.settings.GLOBAL_CONFIGURATION.get', return_value=small_bytes)
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'cache_size': small_bytes, 'cache_policy': 'lru'})
     yield L1Cache()
 
 
@@ -135,3 +136,230 @@ def test__l1cache__event__does_nothing_if_no_matching_keys(populated_cache):
     assert populated_cache.contains('key1') is True
     assert populated_cache.contains('key2') is True
     assert populated_cache.contains('key3') is False
+
+
+def test__l1cache__event__expires_keys_tagged_with_parent_event(populated_cache):
+    populated_cache.insert('key4', 'value4', MissionEvent)
+    populated_cache.event(IterationCosignedEvent)
+    assert populated_cache.contains('key2') is True
+    assert populated_cache.contains('key3') is False
+    assert populated_cache.contains('key4') is False
+
+
+def test__l1cache__event__only_touches_indexed_keys(populated_cache):
+    populated_cache.event(MissionUploadEvent)
+    assert set(populated_cache.tag_map) == {encode_tag(IterationCosignedEvent)}
+
+
+def test__l1cache__insert__entries_carry_several_tags(cache):
+    cache.insert('key1', 'value1', MissionUploadEvent, tags=('reviews', IterationCosignedEvent))
+    cache.insert('key2', 'value2', None, tags=('reviews',))
+    cache.event(IterationCosignedEvent)
+    assert cache.contains('key1') is False
+    assert cache.contains('key2') is True
+    cache.invalidate('reviews')
+    assert cache.contains('key2') is False
+    assert cache.tag_map == {}
+
+
+def test__l1cache__insert__reinsert_replaces_tags(cache):
+    cache.insert('key1', 'value1', MissionUploadEvent)
+    cache.insert('key1', 'value2', IterationCosignedEvent)
+    cache.event(MissionUploadEvent)
+    assert cache.get('key1') == 'value2'
+    cache.event(IterationCosignedEvent)
+    assert cache.contains('key1') is False
+
+
+def test__l1cache__invalidate_namespace__expires_keys_in_namespace(cache):
+    cache.insert('mission:1', 'value1', None)
+    cache.insert('mission:2', 'value2', None)
+    cache.insert('user:1', 'value3', None)
+    cache.invalidate_namespace('mission')
+    assert cache.contains('mission:1') is False
+    assert cache.contains('mission:2') is False
+    assert cache.contains('user:1') is True
+    assert 'mission' not in cache.namespace_map
+
+
+def test__l1cache__expire__subtracts_value_size(mocker, cache):
+    mocker.patch.object(cache, '_getsize', return_value=10)
+    cache.insert('key1', 'value1', None)
+    cache.insert('key2', 'value2', None)
+    assert cache.current_size_bytes == 20
+    cache.expire('key1')
+    assert cache.current_size_bytes == 10
+
+
+def test__l1cache__insert__reinsert_adjusts_size(mocker, cache):
+    getsize = mocker.patch.object(cache, '_getsize', return_value=10)
+    cache.insert('key1', 'value1', None)
+    getsize.return_value = 30
+    cache.insert('key1', 'value2', None)
+    assert cache.current_size_bytes == 30
+    assert cache.entry_map['key1'].size == 30
+
+
+def test__l1cache__insert__declared_size_skips_sizing(mocker, cache):
+    getsize = mocker.patch.object(cache, '_getsize', return_value=10)
+    cache.insert('key1', 'value1', None, size=42)
+    getsize.assert_not_called()
+    assert cache.current_size_bytes == 42
+
+
+def test__l1cache__insert__oversized_reinsert_drops_stale_value(mocker, small_cache, small_bytes):
+    small_cache.insert('key1', 'value1', None, size=10)
+    assert small_cache.insert('key1', 'value2', None, size=small_bytes * 2) == ['value2']
+    assert small_cache.contains('key1') is False
+    assert small_cache.current_size_bytes == 0
+
+
+def test__l1cache__insert__namespace_budget_only_evicts_own_namespace(mocker, small_bytes):
+    mocker.patch.dict(
+        'bw.settings.GLOBAL_CONFIGURATION',
+        {'cache_size': small_bytes, 'cache_namespace_budgets': 'hot:30', 'cache_policy': 'lru'},
+    )
+    cache = L1Cache()
+    cache.insert('cold:1', 'value1', None, size=20)
+    cache.insert('hot:1', 'value2', None, size=20)
+    assert cache.insert('hot:2', 'value3', None, size=20) == ['value2']
+    assert cache.contains('cold:1') is True
+    assert cache.contains('hot:2') is True
+    assert cache.namespace_size_bytes == {'cold': 20, 'hot': 20}
+
+
+def test__l1cache__insert__namespace_budget_evicts_least_recently_used(mocker, small_bytes):
+    mocker.patch.dict(
+        'bw.settings.GLOBAL_CONFIGURATION',
+        {'cache_size': small_bytes, 'cache_namespace_budgets': 'hot:30', 'cache_policy': 'lru'},
+    )
+    cache = L1Cache()
+    cache.insert('hot:1', 'value1', None, size=10)
+    cache.insert('hot:2', 'value2', None, size=10)
+    cache.get('hot:1')
+    assert cache.insert('hot:3', 'value3', None, size=15) == ['value2']
+
+
+def test__l1cache__insert__value_larger_than_namespace_budget_is_rejected(mocker, small_bytes):
+    mocker.patch.dict(
+        'bw.settings.GLOBAL_CONFIGURATION',
+        {'cache_size': small_bytes, 'cache_namespace_budgets': 'hot:30', 'cache_policy': 'lru'},
+    )
+    cache = L1Cache()
+    assert cache.insert('hot:1', 'value1', None, size=40) == ['value1']
+    assert cache.current_size_bytes == 0
+
+
+def test__l1cache__get__expired_entries_are_missing(mocker, cache):
+    mocker.patch('bw.cache.l1.time.time', return_value=1000.0)
+    cache.insert('key1', 'value1', None, ttl=10)
+    assert cache.get('key1') == 'value1'
+    mocker.patch('bw.cache.l1.time.time', return_value=1011.0)
+    assert cache.get('key1') is None
+    assert cache.contains('key1') is False
+    assert cache.current_size_bytes == 0
+
+
+def test__l1cache__insert__purges_expired_entries(mocker, cache):
+    mocker.patch('bw.cache.l1.time.time', return_value=1000.0)
+    cache.insert('key1', 'value1', None, ttl=10)
+    cache.insert('key2', 'value2', None)
+    mocker.patch('bw.cache.l1.time.time', return_value=1011.0)
+    cache.insert('key3', 'value3', None)
+    assert 'key1' not in cache.entry_map
+    assert 'key2' in cache.entry_map
+
+
+def test__l1cache__insert__reinsert_replaces_ttl(mocker, cache):
+    mocker.patch('bw.cache.l1.time.time', return_value=1000.0)
+    cache.insert('key1', 'value1', None, ttl=10)
+    cache.insert('key1', 'value2', None, ttl=100)
+    mocker.patch('bw.cache.l1.time.time', return_value=1011.0)
+    cache.insert('key2', 'value3', None)
+    assert cache.get('key1') == 'value2'
+
+
+def test__l1cache__insert__default_ttl_from_config(mocker):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'cache_default_ttl': '5'})
+    mocker.patch('bw.cache.l1.time.time', return_value=1000.0)
+    cache = L1Cache()
+    cache.insert('key1', 'value1', None)
+    assert cache.entry_map['key1'].expires_at == 1005.0
+
+
+def test__l1cache__policy__selected_from_config(mocker):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'cache_policy': 'lru'})
+    assert isinstance(L1Cache().policy, LruPolicy)
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'cache_policy': 'tinylfu'})
+    assert isinstance(L1Cache().policy, TinyLfuPolicy)
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'cache_policy': 'random'})
+    with pytest.raises(InvalidConfigValue):
+        L1Cache()
+
+
+def test__l1cache__tinylfu__rejects_rarely_used_candidates(mocker, small_bytes):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'cache_size': small_bytes, 'cache_policy': 'tinylfu'})
+    cache = L1Cache()
+    cache.insert('hot:1', 'value1', None, size=60)
+    for _ in range(5):
+        cache.get('hot:1')
+
+    cache.get('scan:1')
+    assert cache.insert('scan:1', 'value2', None, size=60) == ['value2']
+    assert cache.contains('hot:1') is True
+    assert cache.contains('scan:1') is False
+
+
+def test__l1cache__tinylfu__admits_frequently_used_candidates(mocker, small_bytes):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'cache_size': small_bytes, 'cache_policy': 'tinylfu'})
+    cache = L1Cache()
+    cache.insert('old:1', 'value1', None, size=60)
+    cache.get('old:1')
+    for _ in range(5):
+        cache.get('new:1')
+    assert cache.insert('new:1', 'value2', None, size=60) == ['value1']
+    assert cache.contains('new:1') is True
+
+
+def test__l1cache__lru__always_admits(mocker, small_bytes):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'cache_size': small_bytes, 'cache_policy': 'lru'})
+    cache = L1Cache()
+    cache.insert('hot:1', 'value1', None, size=60)
+    for _ in range(5):
+        cache.get('hot:1')
+    assert cache.insert('scan:1', 'value2', None, size=60) == ['value1']
+
+
+def test__count_min_sketch__estimates_counts():
+    sketch = CountMinSketch(64)
+    for _ in range(3):
+        sketch.increment('key1')
+    sketch.increment('key2')
+    assert sketch.estimate('key1') >= 3
+    assert sketch.estimate('key2') >= 1
+    assert sketch.estimate('key1') > sketch.estimate('key2')
+
+
+def test__count_min_sketch__saturates_and_ages():
+    sketch = CountMinSketch(64)
+    for _ in range(20):
+        sketch.increment('key1')
+    assert sketch.estimate('key1') == CountMinSketch.MAX_COUNT
+
+    for i in range(sketch.reset_after):
+        sketch.increment(f'other{i}')
+    assert sketch.estimate('key1') < CountMinSketch.MAX_COUNT
+
+
+def test__l1cache__tinylfu__scans_do_not_evict_protected_entries(mocker, small_bytes):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'cache_size': small_bytes, 'cache_policy': 'tinylfu'})
+    cache = L1Cache()
+    cache.insert('hot:1', 'value1', None, size=40)
+    cache.get('hot:1')
+    cache.get('hot:1')
+
+    for i in range(10):
+        if cache.get(f'scan:{i}') is None:
+            cache.insert(f'scan:{i}', f'scan{i}', None, size=40)
+    assert cache.contains('hot:1') is True
+    assert cache.current_size_bytes <= small_bytes
@@ -0,0 +1,231 @@
+# ruff: noqa: F811, F401
+
+import os
+
+import pytest
+
+from bw.cache.l2 import L2Cache
+from bw.error import InsecureCachePath
+from bw.cache.tags import encode_tag
+from bw.web_event import MissionEvent, MissionUploadEvent, IterationCosignedEvent
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = L2Cache(tmp_path / 'l2.sqlite3', 1024 * 1024)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def populated_cache(cache):
+    cache.insert('key1', 'value1', ())
+    cache.insert('key2', 'value2', {encode_tag(MissionUploadEvent)})
+    cache.insert('mission:key3', 'value3', {encode_tag(IterationCosignedEvent), 'reviews'})
+    return cache
+
+
+@pytest.fixture
+def small_cache(tmp_path):
+    cache = L2Cache(tmp_path / 'small_l2.sqlite3', 100)
+    yield cache
+    cache.close()
+
+
+def test__l2cache__get__returns_value_and_tags_if_exists(populated_cache):
+    assert populated_cache.get('key1') == ('value1', frozenset(), None)
+    assert populated_cache.get('key2') == ('value2', {encode_tag(MissionUploadEvent)}, None)
+
+
+def test__l2cache__get__returns_none_if_not_exists(cache):
+    assert cache.get('key1') is None
+
+
+def test__l2cache__insert__overwrites_existing_value(cache):
+    cache.insert('key1', 'value1', ())
+    cache.insert('key1', 'value2', {encode_tag(MissionUploadEvent)})
+    assert cache.get('key1') == ('value2', {encode_tag(MissionUploadEvent)}, None)
+
+
+def test__l2cache__insert__tracks_size_across_overwrites(cache):
+    cache.insert('key1', 'value1', ())
+    size = cache.current_size_bytes
+    cache.insert('key1', 'value2', ())
+    assert cache.current_size_bytes == size
+    cache.expire('key1')
+    assert cache.current_size_bytes == 0
+
+
+def test__l2cache__insert__evicts_oldest_when_full(small_cache):
+    assert small_cache.insert('key1', 'a' * 60, ()) is True
+    assert small_cache.insert('key2', 'b' * 60, ()) is True
+    assert small_cache.contains('key1') is False
+    assert small_cache.contains('key2') is True
+    assert small_cache.current_size_bytes <= small_cache.max_cache_size_bytes
+
+
+def test__l2cache__insert__large_items_dont_destroy_cache(small_cache):
+    assert small_cache.insert('key1', 'a', ()) is True
+    assert small_cache.insert('key2', 'b' * 500, ()) is False
+    assert small_cache.contains('key1') is True
+    assert small_cache.contains('key2') is False
+
+
+def test__l2cache__insert__unpicklable_values_are_skipped(cache):
+    assert cache.insert('key1', lambda: None, ()) is False
+    assert cache.contains('key1') is False
+
+
+def test__l2cache__event__expires_correct_keys(populated_cache):
+    populated_cache.event(MissionUploadEvent)
+    assert populated_cache.contains('key1') is True
+    assert populated_cache.contains('key2') is False
+    assert populated_cache.contains('mission:key3') is True
+
+
+def test__l2cache__event__expires_keys_tagged_with_parent_event(populated_cache):
+    populated_cache.insert('key4', 'value4', {encode_tag(MissionEvent)})
+    populated_cache.event(IterationCosignedEvent)
+    assert populated_cache.contains('key2') is True
+    assert populated_cache.contains('mission:key3') is False
+    assert populated_cache.contains('key4') is False
+
+
+def test__l2cache__invalidate__expires_keys_with_tag(populated_cache):
+    populated_cache.invalidate('reviews')
+    assert populated_cache.contains('key1') is True
+    assert populated_cache.contains('mission:key3') is False
+
+
+def test__l2cache__invalidate_namespace__expires_keys_in_namespace(populated_cache):
+    populated_cache.invalidate_namespace('mission')
+    assert populated_cache.contains('key2') is True
+    assert populated_cache.contains('mission:key3') is False
+
+
+def test__l2cache__insert__replaces_tags_on_overwrite(cache):
+    cache.insert('key1', 'value1', {'old'})
+    cache.insert('key1', 'value2', {'new'})
+    cache.invalidate('old')
+    assert cache.contains('key1') is True
+    cache.invalidate('new')
+    assert cache.contains('key1') is False
+
+
+def test__l2cache__poll__returns_invalidations_from_other_connections(mocker, tmp_path):
+    writer = L2Cache(tmp_path / 'shared.sqlite3', 1024 * 1024)
+    reader = L2Cache(tmp_path / 'shared.sqlite3', 1024 * 1024)
+    assert reader.poll() == []
+
+    mocker.patch('bw.cache.l2.os.getpid', return_value=-1)
+    writer.insert('key1', 'value1', (), notify=True)
+    writer.invalidate('reviews')
+    writer.invalidate_namespace('mission')
+    mocker.stopall()
+
+    assert reader.poll() == [('key', 'key1'), ('tag', 'reviews'), ('namespace', 'mission')]
+    assert reader.poll() == []
+    writer.close()
+    reader.close()
+
+
+def test__l2cache__poll__skips_own_invalidations(cache):
+    cache.poll()
+    cache.invalidate('reviews')
+    assert cache.poll() == []
+
+
+def test__l2cache__is_shared_between_instances(tmp_path):
+    writer = L2Cache(tmp_path / 'shared.sqlite3', 1024 * 1024)
+    reader = L2Cache(tmp_path / 'shared.sqlite3', 1024 * 1024)
+    writer.insert('key1', {'value': 1}, ())
+    assert reader.get('key1') == ({'value': 1}, frozenset(), None)
+    writer.close()
+    reader.close()
+
+
+def test__l2cache__clear__removes_all_items(populated_cache):
+    populated_cache.clear()
+    assert populated_cache.contains('key1') is False
+    assert populated_cache.contains('key2') is False
+    assert populated_cache.current_size_bytes == 0
+
+
+def test__l2cache__destroy__removes_backing_file(populated_cache):
+    populated_cache.destroy()
+    assert populated_cache.path.exists() is False
+
+
+def test__l2cache__get__skips_expired_entries(mocker, cache):
+    cache.insert('key1', 'value1', (), expires_at=1000.0)
+    cache.insert('key2', 'value2', (), expires_at=3000.0)
+    mocker.patch('bw.cache.l2.time.time', return_value=2000.0)
+    assert cache.get('key1') is None
+    assert cache.contains('key1') is False
+    assert cache.get('key2') == ('value2', frozenset(), 3000.0)
+
+
+def test__l2cache__insert__evicts_expired_entries_first(mocker, small_cache):
+    mocker.patch('bw.cache.l2.time.time', return_value=1000.0)
+    small_cache.insert('key1', 'a' * 20, ())
+    small_cache.insert('key2', 'b' * 20, (), expires_at=1500.0)
+    mocker.patch('bw.cache.l2.time.time', return_value=2000.0)
+    small_cache.insert('key3', 'c' * 20, ())
+    assert small_cache.contains('key1') is True
+    assert small_cache.contains('key3') is True
+
+
+def test__l2cache__creates_private_directory(tmp_path):
+    cache = L2Cache(tmp_path / 'cache' / 'l2.sqlite3', 1024 * 1024)
+    cache.insert('key1', 'value1', ())
+    cache.close()
+    assert (tmp_path / 'cache').stat().st_mode & 0o777 == 0o700
+
+
+def test__l2cache__refuses_file_owned_by_another_user(mocker, tmp_path):
+    path = tmp_path / 'l2.sqlite3'
+    path.write_bytes(b'')
+    mocker.patch('bw.cache.files.os.getuid', return_value=os.getuid() + 1)
+
+    with pytest.raises(InsecureCachePath):
+        L2Cache(path, 1024 * 1024).get('key1')
+
+
+def test__l2cache__refuses_directory_writable_by_others(tmp_path):
+    directory = tmp_path / 'shared'
+    directory.mkdir()
+    directory.chmod(0o777)
+
+    with pytest.raises(InsecureCachePath):
+        L2Cache(directory / 'l2.sqlite3', 1024 * 1024).get('key1')
+
+
+def test__l2cache__refuses_symlinked_file(tmp_path):
+    (tmp_path / 'elsewhere.sqlite3').write_bytes(b'')
+    (tmp_path / 'l2.sqlite3').symlink_to(tmp_path / 'elsewhere.sqlite3')
+
+    with pytest.raises(InsecureCachePath):
+        L2Cache(tmp_path / 'l2.sqlite3', 1024 * 1024).get('key1')
+
+
+def test__l2cache__invalidations_since__includes_own_invalidations(cache):
+    generation, position = cache.log_position()
+    cache.invalidate('reviews')
+    cache.expire('key1')
+
+    assert cache.invalidations_since(generation, position) == [('tag', 'reviews'), ('key', 'key1')]
+    assert cache.invalidations_since(generation, position + 2) == []
+
+
+def test__l2cache__invalidations_since__other_generation_replays_whole_log(cache):
+    cache.invalidate('reviews')
+    assert cache.invalidations_since('some other file', 50) == [('tag', 'reviews')]
+
+
+def test__l2cache__invalidations_since__trimmed_log(mocker, cache):
+    generation, position = cache.log_position()
+    mocker.patch('bw.cache.l2.INVALIDATION_LOG_LENGTH', 2)
+    for i in range(300):
+        cache.invalidate(f'tag{i}')
+
+    assert cache.invalidations_since(generation, position) is None
@@ -0,0 +1,61 @@
+import pickle
+import threading
+import objsize
+import pytest
+
+from bw.cache.sizer import DeepSizer, SampledSizer, PickleSizer, sizer_from_config, namespace_budgets_from_config
+from bw.error import InvalidConfigValue
+
+
+def test__deep_sizer__matches_objsize():
+    value = {'a': [1, 2, 3], 'b': 'text'}
+    assert DeepSizer().size(value) == objsize.get_deep_size(value)
+
+
+def test__sampled_sizer__small_containers_are_exact():
+    value = [str(i) for i in range(8)]
+    assert SampledSizer(sample_size=16).size(value) == objsize.get_deep_size(value)
+
+
+def test__sampled_sizer__large_uniform_containers_are_close():
+    value = [f'{i:08}' for i in range(10_000)]
+    exact = objsize.get_deep_size(value)
+    estimate = SampledSizer(sample_size=16).size(value)
+    assert abs(estimate - exact) / exact < 0.05
+
+
+def test__sampled_sizer__large_dicts_are_close():
+    value = {f'{i:08}': i * 1000 for i in range(10_000)}
+    exact = objsize.get_deep_size(value)
+    estimate = SampledSizer(sample_size=16).size(value)
+    assert abs(estimate - exact) / exact < 0.05
+
+
+def test__pickle_sizer__matches_pickled_length():
+    value = {'a': [1, 2, 3]}
+    assert PickleSizer().size(value) == len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def test__pickle_sizer__falls_back_for_unpicklable_values():
+    assert PickleSizer().size(threading.Lock()) > 0
+
+
+def test__sizer_from_config__returns_named_sizer():
+    assert isinstance(sizer_from_config('deep'), DeepSizer)
+    assert isinstance(sizer_from_config('sampled'), SampledSizer)
+    assert isinstance(sizer_from_config('pickle'), PickleSizer)
+
+
+def test__sizer_from_config__rejects_unknown_sizer():
+    with pytest.raises(InvalidConfigValue):
+        sizer_from_config('guess')
+
+
+def test__namespace_budgets_from_config__parses_pairs():
+    assert namespace_budgets_from_config('mission:100, auth:20') == {'mission': 100, 'auth': 20}
+    assert namespace_budgets_from_config('') == {}
+
+
+def test__namespace_budgets_from_config__rejects_malformed_pairs():
+    with pytest.raises(InvalidConfigValue):
+        namespace_budgets_from_config('mission')
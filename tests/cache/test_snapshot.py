@@ -0,0 +1,236 @@
+# ruff: noqa: F811, F401
+
+import os
+import pickle
+import pytest
+
+from bw.cache import Cache
+from bw.cache.snapshot import Snapshot, write_snapshot
+from bw.cache.tags import encode_tag
+from bw.environment import ENVIRONMENT
+from bw.error import CacheMiss, InsecureCachePath
+from bw.web_event import MissionEvent, MissionUploadEvent
+
+
+def entry(key, value, tags=(), expires_at=None):
+    tags = frozenset(tags)
+    return key, pickle.dumps((value, tags)), tags, expires_at
+
+
+@pytest.fixture(autouse=True)
+def revision(mocker):
+    mocker.patch('bw.cache.cache.schema_revision', return_value='abc123')
+    return mocker.patch('bw.cache.snapshot.schema_revision', return_value='abc123')
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    return tmp_path / 'snapshot.bin'
+
+
+@pytest.fixture
+def populated_snapshot(snapshot_path):
+    write_snapshot(
+        snapshot_path,
+        'abc123',
+        [
+            entry('key1', 'value1'),
+            entry('key2', {'a': [1, 2]}, {encode_tag(MissionUploadEvent)}),
+            entry('mission:key3', 'value3', {encode_tag(MissionEvent)}),
+        ],
+    )
+    snapshot = Snapshot(snapshot_path, 60)
+    yield snapshot
+    snapshot.close()
+
+
+def test__snapshot__round_trip(populated_snapshot):
+    assert len(populated_snapshot) == 3
+    assert populated_snapshot.take('key1') == ('value1', frozenset(), None)
+    assert populated_snapshot.take('key2') == ({'a': [1, 2]}, frozenset({encode_tag(MissionUploadEvent)}), None)
+    assert populated_snapshot.take('missing') is None
+
+
+def test__snapshot__entries_are_taken_once(populated_snapshot):
+    assert populated_snapshot.take('key1') is not None
+    assert populated_snapshot.take('key1') is None
+    assert len(populated_snapshot) == 2
+
+
+def test__snapshot__loads_lazily(mocker, populated_snapshot):
+    read = mocker.spy(populated_snapshot, '_read')
+    assert read.call_count == 0
+
+    populated_snapshot.take('key1')
+    populated_snapshot.take('key2')
+    assert read.call_count == 1
+
+
+def test__snapshot__missing_file_is_empty(snapshot_path):
+    assert len(Snapshot(snapshot_path, 60)) == 0
+
+
+def test__snapshot__other_schema_revision_is_discarded(revision, populated_snapshot):
+    revision.return_value = 'def456'
+    assert len(populated_snapshot) == 0
+
+
+def test__snapshot__too_old_is_discarded(mocker, snapshot_path):
+    write_snapshot(snapshot_path, 'abc123', [entry('key1', 'value1')])
+    mocker.patch('bw.cache.snapshot.time.time', return_value=10**10)
+
+    assert len(Snapshot(snapshot_path, 60)) == 0
+
+
+def test__snapshot__expired_entries_are_skipped(mocker, snapshot_path):
+    time = mocker.patch('bw.cache.snapshot.time.time', return_value=1000.0)
+    write_snapshot(
+        snapshot_path, 'abc123', [entry('key1', 'value1', expires_at=1010.0), entry('key2', 'value2', expires_at=1100.0)]
+    )
+    time.return_value = 1050.0
+
+    snapshot = Snapshot(snapshot_path, 60)
+    assert snapshot.take('key1') is None
+    assert snapshot.take('key2') == ('value2', frozenset(), 1100.0)
+
+
+def test__snapshot__corrupt_file_is_discarded(snapshot_path):
+    snapshot_path.write_bytes(b'BWCS' + b'\xff' * 10)
+    assert len(Snapshot(snapshot_path, 60)) == 0
+
+
+def test__snapshot__invalidate_by_tag(populated_snapshot):
+    populated_snapshot.invalidate(MissionUploadEvent)
+    assert populated_snapshot.take('key2') is None
+    assert populated_snapshot.take('key1') is not None
+
+
+def test__snapshot__invalidate_namespace(populated_snapshot):
+    populated_snapshot.invalidate_namespace('mission')
+    assert populated_snapshot.take('mission:key3') is None
+    assert populated_snapshot.take('key1') is not None
+
+
+def test__snapshot__clear(populated_snapshot):
+    populated_snapshot.clear()
+    assert populated_snapshot.take('key1') is None
+
+
+def test__cache__warm_restart_from_snapshot(mocker, tmp_path, snapshot_path):
+    mocker.patch.object(ENVIRONMENT, 'l2_cache_path', return_value=tmp_path / 'l2.sqlite3')
+    mocker.patch.object(ENVIRONMENT, 'cache_snapshot_path', return_value=snapshot_path)
+
+    cache = Cache()
+    cache.insert('mission:1', 'value1', MissionUploadEvent)
+    cache.insert('mission:2', 'value2', MissionEvent)
+    # only in the shared L2 cache, not this worker's L1 cache
+    cache.l1_cache.expire('mission:2')
+    assert cache.dump_snapshot() == 2
+    cache.l2_cache.destroy()
+
+    restarted = Cache()
+    try:
+        assert restarted.get('mission:1') == 'value1'
+        restarted.event(MissionEvent)
+        with pytest.raises(CacheMiss):
+            restarted.get('mission:2')
+    finally:
+        restarted.l2_cache.close()
+
+
+def test__cache__dump_snapshot_skips_unpicklable_values(mocker, snapshot_path):
+    mocker.patch.object(ENVIRONMENT, 'l2_cache_path', return_value=None)
+    mocker.patch.object(ENVIRONMENT, 'cache_snapshot_path', return_value=snapshot_path)
+
+    cache = Cache()
+    cache.insert('key1', 'value1')
+    cache.insert('key2', lambda: None)
+    assert cache.dump_snapshot() == 1
+
+
+def test__cache__dump_snapshot_without_path(mocker):
+    mocker.patch.object(ENVIRONMENT, 'cache_snapshot_path', return_value=None)
+    assert Cache().dump_snapshot() == 0
+
+
+def test__snapshot__replays_invalidations_logged_since_it_was_written(mocker, snapshot_path):
+    write_snapshot(
+        snapshot_path,
+        'abc123',
+        [entry('key1', 'value1'), entry('key2', 'value2', {encode_tag(MissionUploadEvent)}), entry('mission:key3', 'v3')],
+        ('generation', 10),
+    )
+    log = mocker.Mock()
+    log.invalidations_since.return_value = [('tag', encode_tag(MissionUploadEvent)), ('namespace', 'mission')]
+
+    snapshot = Snapshot(snapshot_path, 60, log)
+    assert len(snapshot) == 1
+    log.invalidations_since.assert_called_once_with('generation', 10)
+    assert snapshot.take('key1') is not None
+
+
+def test__snapshot__discarded_if_invalidation_log_moved_past_it(mocker, snapshot_path):
+    write_snapshot(snapshot_path, 'abc123', [entry('key1', 'value1')], ('generation', 10))
+    log = mocker.Mock()
+    log.invalidations_since.return_value = None
+
+    assert len(Snapshot(snapshot_path, 60, log)) == 0
+
+
+def test__snapshot__without_log_position_discarded_when_log_exists(mocker, populated_snapshot, snapshot_path):
+    assert len(Snapshot(snapshot_path, 60, mocker.Mock())) == 0
+
+
+def test__cache__snapshot_sees_invalidations_from_before_first_access(mocker, tmp_path, snapshot_path):
+    mocker.patch.object(ENVIRONMENT, 'l2_cache_path', return_value=tmp_path / 'l2.sqlite3')
+    mocker.patch.object(ENVIRONMENT, 'cache_snapshot_path', return_value=snapshot_path)
+
+    previous = Cache()
+    previous.insert('auth:principal', 'admin', MissionUploadEvent)
+    previous.insert('mission:1', 'value1')
+    assert previous.dump_snapshot() == 2
+    previous.l2_cache.close()
+
+    worker_a = Cache()
+    worker_b = Cache()
+    try:
+        # worker A invalidates before worker B has opened the L2 cache or its snapshot
+        worker_a.event(MissionUploadEvent)
+        worker_a.l2_cache.expire('mission:1')
+        with pytest.raises(CacheMiss):
+            worker_b.get('auth:principal')
+        with pytest.raises(CacheMiss):
+            worker_b.get('mission:1')
+    finally:
+        worker_a.l2_cache.close()
+        worker_b.l2_cache.close()
+
+
+def test__snapshot__owned_by_another_user_is_not_loaded(mocker, populated_snapshot, snapshot_path):
+    mocker.patch('bw.cache.files.os.getuid', return_value=os.getuid() + 1)
+    assert len(Snapshot(snapshot_path, 60)) == 0
+
+
+def test__snapshot__symlink_is_not_loaded(tmp_path, populated_snapshot, snapshot_path):
+    (tmp_path / 'link.bin').symlink_to(snapshot_path)
+    assert len(Snapshot(tmp_path / 'link.bin', 60)) == 0
+
+
+def test__write_snapshot__does_not_follow_planted_files(tmp_path, snapshot_path):
+    victim = tmp_path / 'victim'
+    victim.write_text('untouched')
+    (tmp_path / f'{snapshot_path.name}.{os.getpid()}.tmp').symlink_to(victim)
+
+    write_snapshot(snapshot_path, 'abc123', [entry('key1', 'value1')])
+    assert victim.read_text() == 'untouched'
+    assert snapshot_path.stat().st_mode & 0o777 == 0o600
+    assert not list(tmp_path.glob(f'.{snapshot_path.name}.*'))
+
+
+def test__write_snapshot__refuses_directory_writable_by_others(tmp_path):
+    directory = tmp_path / 'shared'
+    directory.mkdir()
+    directory.chmod(0o777)
+
+    with pytest.raises(InsecureCachePath):
+        write_snapshot(directory / 'snapshot.bin', 'abc123', [entry('key1', 'value1')])
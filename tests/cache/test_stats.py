@@ -0,0 +1,163 @@
+# ruff: noqa: F811, F401
+
+import pytest
+
+from bw.cache import Cache
+from bw.cache.l1 import L1Cache, LruPolicy
+from bw.cache.l2 import L2Cache
+from bw.cache.stats import CacheStats, NO_NAMESPACE
+from bw.cache.tags import encode_tag
+from bw.environment import ENVIRONMENT
+from bw.web_event import MissionEvent, MissionUploadEvent
+
+
+@pytest.fixture
+def l1_cache():
+    cache = L1Cache()
+    cache.policy = LruPolicy()
+    return cache
+
+
+@pytest.fixture
+def l2_cache(tmp_path):
+    cache = L2Cache(tmp_path / 'l2.sqlite3', 1024 * 1024)
+    yield cache
+    cache.close()
+
+
+def test__cache_stats__counters_are_kept_per_namespace():
+    stats = CacheStats()
+    stats.of('mission:1').hits += 1
+    stats.of('mission:2').hits += 1
+    stats.of('auth:1').misses += 1
+    stats.of('unnamespaced').inserts += 1
+
+    assert stats.of_namespace('mission').hits == 2
+    assert stats.of_namespace('auth').misses == 1
+    assert stats.of_namespace(None).inserts == 1
+
+
+def test__cache_stats__report_includes_namespaces_only_holding_entries():
+    report = CacheStats().report({'mission': (100, 2)}, [('mission:1', 60)])
+    assert report['namespaces']['mission']['size_bytes'] == 100
+    assert report['namespaces']['mission']['entries'] == 2
+    assert report['namespaces']['mission']['hits'] == 0
+    assert report['largest_entries'] == [{'key': 'mission:1', 'size_bytes': 60}]
+
+
+def test__l1cache__stats__counts_hits_misses_and_inserts(l1_cache):
+    l1_cache.insert('mission:1', 'value', None, size=10)
+    l1_cache.get('mission:1')
+    l1_cache.get('mission:1')
+    l1_cache.get('mission:2')
+
+    counters = l1_cache.stats.of_namespace('mission')
+    assert (counters.inserts, counters.hits, counters.misses) == (1, 2, 1)
+
+
+def test__l1cache__stats__counts_evictions_and_rejections(l1_cache):
+    l1_cache.max_cache_size_bytes = 20
+    l1_cache.insert('mission:1', 'value', None, size=10)
+    l1_cache.insert('mission:2', 'value', None, size=10)
+    l1_cache.insert('mission:3', 'value', None, size=10)
+    l1_cache.insert('mission:4', 'value', None, size=100)
+
+    counters = l1_cache.stats.of_namespace('mission')
+    assert counters.evictions == 1
+    assert counters.rejections == 1
+
+
+def test__l1cache__stats__counts_invalidations_by_event(l1_cache):
+    l1_cache.insert('mission:1', 'value', MissionEvent, size=10)
+    l1_cache.insert('mission:2', 'value', MissionUploadEvent, size=10)
+    l1_cache.insert('auth:1', 'value', None, size=10)
+
+    l1_cache.event(MissionUploadEvent)
+    l1_cache.invalidate_namespace('auth')
+
+    assert l1_cache.stats.of_namespace('mission').invalidations == 2
+    assert l1_cache.stats.of_namespace('auth').invalidations == 1
+    assert l1_cache.stats.invalidations_by_event == {'MissionUploadEvent': 2}
+
+
+def test__l1cache__stats__counts_ttl_expirations(mocker, l1_cache):
+    time = mocker.patch('bw.cache.l1.time.time', return_value=1000.0)
+    l1_cache.insert('mission:1', 'value', None, size=10, ttl=5)
+    time.return_value = 1006.0
+
+    assert l1_cache.get('mission:1') is None
+    counters = l1_cache.stats.of_namespace('mission')
+    assert (counters.expirations, counters.misses) == (1, 1)
+
+
+def test__l1cache__report__sizes_and_largest_entries(l1_cache):
+    l1_cache.insert('mission:1', 'value', None, size=10)
+    l1_cache.insert('mission:2', 'value', None, size=30)
+    l1_cache.insert('other', 'value', None, size=20)
+
+    report = l1_cache.report(largest=2)
+    assert report['size_bytes'] == 60
+    assert report['entries'] == 3
+    assert report['namespaces']['mission']['size_bytes'] == 40
+    assert report['namespaces'][NO_NAMESPACE]['size_bytes'] == 20
+    assert report['largest_entries'] == [{'key': 'mission:2', 'size_bytes': 30}, {'key': 'other', 'size_bytes': 20}]
+
+
+def test__l2cache__stats__counts_hits_misses_and_inserts(l2_cache):
+    l2_cache.insert('mission:1', 'value', ())
+    l2_cache.get('mission:1')
+    l2_cache.get('mission:2')
+
+    counters = l2_cache.stats.of_namespace('mission')
+    assert (counters.inserts, counters.hits, counters.misses) == (1, 1, 1)
+
+
+def test__l2cache__stats__counts_invalidations_by_event(l2_cache):
+    l2_cache.insert('mission:1', 'value', {encode_tag(MissionEvent)})
+    l2_cache.insert('auth:1', 'value', ())
+    l2_cache.event(MissionUploadEvent)
+
+    assert l2_cache.stats.of_namespace('mission').invalidations == 1
+    assert l2_cache.stats.invalidations_by_event == {'MissionUploadEvent': 1}
+
+
+def test__l2cache__stats__counts_evictions(tmp_path):
+    cache = L2Cache(tmp_path / 'small.sqlite3', 200)
+    try:
+        for i in range(5):
+            cache.insert(f'mission:{i}', 'x' * 50, ())
+        assert cache.stats.of_namespace('mission').evictions > 0
+    finally:
+        cache.close()
+
+
+def test__l2cache__report__sizes_and_largest_entries(l2_cache):
+    l2_cache.insert('mission:1', 'x' * 10, ())
+    l2_cache.insert('mission:2', 'x' * 100, ())
+    l2_cache.insert('other', 'x', ())
+
+    report = l2_cache.report(largest=1)
+    assert report['entries'] == 3
+    assert report['namespaces']['mission']['entries'] == 2
+    assert report['namespaces'][NO_NAMESPACE]['entries'] == 1
+    assert report['size_bytes'] == sum(namespace['size_bytes'] for namespace in report['namespaces'].values())
+    assert [entry['key'] for entry in report['largest_entries']] == ['mission:2']
+
+
+def test__cache__report__covers_both_tiers(mocker, tmp_path):
+    mocker.patch.object(ENVIRONMENT, 'l2_cache_path', return_value=tmp_path / 'l2.sqlite3')
+    cache = Cache()
+    try:
+        cache.insert('mission:1', 'value')
+        cache.get('mission:1')
+
+        report = cache.report()
+        assert report['l1']['namespaces']['mission']['hits'] == 1
+        assert report['l2']['namespaces']['mission']['inserts'] == 1
+    finally:
+        cache.l2_cache.close()
+
+
+def test__cache__report__without_l2(mocker):
+    mocker.patch.object(ENVIRONMENT, 'l2_cache_path', return_value=None)
+    assert Cache().report()['l2'] is None
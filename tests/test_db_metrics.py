@@ -0,0 +1,91 @@
+import logging
+import uuid
+
+import pytest
+from quart import Quart
+from sqlalchemy import create_engine, text
+
+from bw.db_metrics import NO_ENDPOINT, QueryBudgetExceeded, QueryMetrics, assert_query_budget, parameter_shape, query_budget
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "metrics.sqlite3"}')
+    yield engine
+    engine.dispose()
+
+
+def test__parameter_shape__leaves_out_values():
+    shape = parameter_shape({'uuid_1': uuid.uuid4(), 'ids': [1, 2, 3], 'token': 'secret'})
+    assert shape == {'uuid_1': 'UUID', 'ids': 'list[3]', 'token': 'str'}
+    assert parameter_shape((1, 'secret')) == ['int', 'str']
+    assert parameter_shape([{'a': 1}, {'a': 2}], executemany=True) == "2 x {'a': 'int'}"
+
+
+def test__query_metrics__counts_queries_outside_requests(engine):
+    metrics = QueryMetrics()
+    metrics.instrument(engine)
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        conn.execute(text('SELECT 2'))
+
+    report = metrics.report()
+    assert report['endpoints'][NO_ENDPOINT]['queries'] == 2
+    assert report['endpoints'][NO_ENDPOINT]['requests'] == 0
+
+
+def test__query_metrics__slow_query_logs_parameter_shapes(mocker, engine, caplog):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'db_slow_query_ms': '0'})
+    metrics = QueryMetrics()
+    metrics.instrument(engine)
+    with caplog.at_level(logging.WARNING, logger='bw.sql'), engine.connect() as conn:
+        conn.execute(text('SELECT :token'), {'token': 'hunter2'})
+
+    assert metrics.report()['endpoints'][NO_ENDPOINT]['slow_queries'] == 1
+    assert "parameters: ['str']" in caplog.text
+    assert 'hunter2' not in caplog.text
+
+
+def test__assert_query_budget__raises_when_over(engine):
+    with assert_query_budget(engine, 1) as statements, engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+    assert statements == ['SELECT 1']
+
+    with pytest.raises(QueryBudgetExceeded, match='2 queries, over its budget of 1'):
+        with assert_query_budget(engine, 1), engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            conn.execute(text('SELECT 2'))
+
+
+@pytest.mark.asyncio
+async def test__query_budget__attributes_queries_to_endpoint(engine):
+    metrics = QueryMetrics()
+    metrics.instrument(engine)
+    app = Quart(__name__)
+
+    @app.get('/cheap')
+    @query_budget(2)
+    async def cheap():
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+        return 'ok'
+
+    @app.get('/expensive')
+    @query_budget(1)
+    async def expensive():
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            conn.execute(text('SELECT 2'))
+        return 'ok'
+
+    app.teardown_request(lambda exception: metrics.finish_request())
+
+    client = app.test_client()
+    assert (await client.get('/cheap')).status_code == 200
+    assert (await client.get('/expensive')).status_code == 500
+
+    report = metrics.report()['endpoints']
+    assert report['cheap']['requests'] == 1
+    assert report['cheap']['mean_queries_per_request'] == 1
+    assert report['expensive']['most_queries_per_request'] == 2
+    assert cheap.__query_budget__ == 2
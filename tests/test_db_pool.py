@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import create_engine, exc
+
+from bw.db_pool import InstrumentedQueuePool, PoolOptions
+
+
+@pytest.fixture
+def engine(tmp_path):
+    options = PoolOptions(size=1, max_overflow=1, timeout=0.05, recycle=-1, pre_ping=False)
+    engine = create_engine(f'sqlite:///{tmp_path / "pool.sqlite3"}', **options.engine_arguments())
+    yield engine
+    engine.dispose()
+
+
+def test__pool_options__from_config(mocker):
+    mocker.patch.dict(
+        'bw.settings.GLOBAL_CONFIGURATION',
+        {'db_pool_size': '8', 'db_max_overflow': '4', 'db_pool_timeout': '2.5', 'db_pool_pre_ping': 'false'},
+    )
+    options = PoolOptions.from_config()
+    assert options == PoolOptions(size=8, max_overflow=4, timeout=2.5, recycle=30 * 60, pre_ping=False)
+    assert options.max_connections == 12
+
+
+def test__instrumented_pool__counts_checkouts_and_overflow(engine):
+    assert isinstance(engine.pool, InstrumentedQueuePool)
+    with engine.connect():
+        report = engine.pool.report()
+        assert report['in_use'] == 1
+        assert report['overflow_checkouts'] == 0
+        with engine.connect():
+            report = engine.pool.report()
+            assert report['in_use'] == 2
+            assert report['overflow'] == 1
+
+    report = engine.pool.report()
+    assert report['in_use'] == 0
+    assert report['checkouts'] == 2
+    assert report['overflow_checkouts'] == 1
+    assert report['peak_in_use'] == 2
+
+
+def test__instrumented_pool__counts_timeouts(engine):
+    with engine.connect(), engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    report = engine.pool.report()
+    assert report['timeouts'] == 1
+    assert report['max_wait_ms'] >= 50
+
+
+def test__instrumented_pool__metrics_survive_dispose(engine):
+    with engine.connect():
+        pass
+    engine.dispose()
+    with engine.connect():
+        pass
+
+    assert engine.pool.report()['checkouts'] == 2
@@ -0,0 +1,98 @@
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from bw.http_client import HttpClients
+
+
+@pytest.fixture
+def http(mocker):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'http_retries': '2', 'http_retry_backoff': '0'})
+    return HttpClients()
+
+
+@pytest_asyncio.fixture
+async def server():
+    calls = {'flaky': 0, 'post': 0}
+
+    async def ok(request):
+        return web.json_response({'peer': request.transport.get_extra_info('peername')[1]})
+
+    async def flaky(request):
+        calls['flaky'] += 1
+        if calls['flaky'] < 3:
+            return web.Response(status=503)
+        return web.json_response({'calls': calls['flaky']})
+
+    async def post(request):
+        calls['post'] += 1
+        return web.Response(status=503)
+
+    app = web.Application()
+    app.router.add_get('/ok', ok)
+    app.router.add_get('/flaky', flaky)
+    app.router.add_post('/post', post)
+    async with TestServer(app) as test_server:
+        test_server.calls = calls
+        yield test_server
+
+
+@pytest.mark.asyncio
+async def test__http_clients__request__retries_busy_responses(http, server):
+    async with http.request('GET', str(server.make_url('/flaky'))) as response:
+        assert response.status == 200
+        assert (await response.json())['calls'] == 3
+
+
+@pytest.mark.asyncio
+async def test__http_clients__request__returns_last_response_when_out_of_retries(mocker, server):
+    mocker.patch.dict('bw.settings.GLOBAL_CONFIGURATION', {'http_retries': '1', 'http_retry_backoff': '0'})
+    async with HttpClients().request('GET', str(server.make_url('/flaky'))) as response:
+        assert response.status == 503
+    assert server.calls['flaky'] == 2
+
+
+@pytest.mark.asyncio
+async def test__http_clients__request__post_not_retried_by_default(http, server):
+    async with http.request('POST', str(server.make_url('/post'))) as response:
+        assert response.status == 503
+    assert server.calls['post'] == 1
+
+    async with http.request('POST', str(server.make_url('/post')), retry=True) as response:
+        assert response.status == 503
+    assert server.calls['post'] == 4
+
+
+@pytest.mark.asyncio
+async def test__http_clients__request__connection_error_raises_after_retries(http, unused_tcp_port):
+    with pytest.raises(aiohttp.ClientConnectionError):
+        async with http.request('GET', f'http://127.0.0.1:{unused_tcp_port}/'):
+            pass
+
+
+@pytest.mark.asyncio
+async def test__http_clients__open__reuses_connections(http, server):
+    await http.open()
+    try:
+        peers = set()
+        for _ in range(3):
+            async with http.request('GET', str(server.make_url('/ok'))) as response:
+                peers.add((await response.json())['peer'])
+        assert len(peers) == 1
+        assert len(http._sessions) == 1
+    finally:
+        await http.close()
+    assert not http.is_open
+    assert http._sessions == {}
+
+
+@pytest.mark.asyncio
+async def test__http_clients__not_open__uses_a_connection_per_request(http, server):
+    peers = set()
+    for _ in range(2):
+        async with http.request('GET', str(server.make_url('/ok'))) as response:
+            peers.add((await response.json())['peer'])
+    assert len(peers) == 2
+    assert http._sessions == {}
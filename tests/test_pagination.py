@@ -0,0 +1,27 @@
+import datetime
+import pytest
+
+from bw.error import BadPageToken
+from bw.pagination import encode_page_token, decode_page_token
+
+
+def test__page_token__round_trip():
+    key = (datetime.datetime(2025, 3, 4, 5, 6, 7, 890), 42)
+    token = encode_page_token(*key)
+    assert decode_page_token(token, datetime.datetime, int) == key
+
+
+def test__page_token__is_url_safe():
+    token = encode_page_token('a/b+c?d=e', 2**40)
+    assert all(character.isalnum() or character in '-_' for character in token)
+
+
+@pytest.mark.parametrize('token', ['', '%%%', 'bm90IGpzb24', 'eyJhIjoxfQ', 'WzFd', 'WyJhIiwxXQ', 'WyJub3QgYSBkYXRlIiwxXQ'])
+def test__page_token__malformed_raises(token):
+    with pytest.raises(BadPageToken):
+        decode_page_token(token, datetime.datetime, int)
+
+
+def test__page_token__wrong_types_raises():
+    with pytest.raises(BadPageToken):
+        decode_page_token(encode_page_token('1'), int)
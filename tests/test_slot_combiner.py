@@ -76,3 +76,29 @@ def test__slot_combiner__from_many_no_args():
     assert not combined.a
     assert not combined.b
     assert not combined.c
+
+
+def test__slot_combiner__mask_bits_follow_declaration_order():
+    assert MyTestDataclass(a=True, b=False, c=False).mask == 0b001
+    assert MyTestDataclass(a=False, b=True, c=True).mask == 0b110
+
+
+def test__slot_combiner__from_mask_round_trip(data_2):
+    assert MyTestDataclass.from_mask(data_2.mask) == data_2
+    assert MyTestDataclass.from_mask(0).as_dict() == {'a': False, 'b': False, 'c': False}
+
+
+def test__slot_combiner__mask_of_names_and_slots():
+    assert MyTestDataclass.mask_of('a', 'c') == 0b101
+    assert MyTestDataclass.mask_of(MyTestDataclass.b) == 0b010
+    assert MyTestDataclass.mask_of() == 0
+
+
+def test__slot_combiner__covers(data_2):
+    assert data_2.covers(MyTestDataclass.mask_of('a', 'c'))
+    assert not data_2.covers(MyTestDataclass.mask_of('b'))
+    assert data_2.covers(0)
+
+
+def test__slot_combiner__flags_in():
+    assert MyTestDataclass.flags_in(0b101) == ['a', 'c']
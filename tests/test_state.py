@@ -0,0 +1,50 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bw.state import State, in_db_thread, run_in_db_thread
+
+request_id = contextvars.ContextVar('request_id')
+
+
+@pytest.fixture
+def db_executor(mocker):
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='bw-db')
+    mocker.patch.object(State, 'db_executor', executor)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+@pytest.mark.asyncio
+async def test__run_in_db_thread__runs_off_the_event_loop_with_callers_context(db_executor):
+    request_id.set('abc')
+
+    def work(value: int, *, scale: int) -> tuple[str, str, int]:
+        return threading.current_thread().name, request_id.get(), value * scale
+
+    thread_name, seen_request_id, result = await run_in_db_thread(work, 2, scale=3)
+    assert thread_name.startswith('bw-db')
+    assert seen_request_id == 'abc'
+    assert result == 6
+
+
+@pytest.mark.asyncio
+async def test__run_in_db_thread__raises_what_the_call_raises(db_executor):
+    def work():
+        raise KeyError('missing')
+
+    with pytest.raises(KeyError):
+        await run_in_db_thread(work)
+
+
+@pytest.mark.asyncio
+async def test__in_db_thread__makes_method_awaitable(db_executor):
+    class Api:
+        @in_db_thread
+        def name(self, suffix: str) -> str:
+            return threading.current_thread().name + suffix
+
+    assert (await Api().name('!')).startswith('bw-db')
+    assert Api.name.__name__ == 'name'